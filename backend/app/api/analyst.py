@@ -1,9 +1,21 @@
+import json
 from fastapi import APIRouter, HTTPException
-from ..models.patent import InitialIdeaRequest, StartChatResponse, LandscapeAnalysisRequest, HolisticAnalysis
-from ..services import local_embedding_service, mongo_service, llm_service
+from fastapi.responses import StreamingResponse
+from typing import List
+from ..core import config
+from ..core.executors import PoolSaturatedError, llm_limiter
+from ..models.patent import (
+    InitialIdeaRequest, StartChatResponse, LandscapeAnalysisRequest, HolisticAnalysis,
+    BatchSimilarResult, BatchSimilarResponse,
+)
+from ..services import local_embedding_service, llm_service, prompt_packer, provider_scheduler, retrieval_service
+from ..services.embedding_cache import get_embedding_cache
 
 router = APIRouter()
 
+def _service_unavailable(error: PoolSaturatedError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
 @router.post("/find-similar", response_model=StartChatResponse)
 async def find_similar_patents(request: InitialIdeaRequest):
     """
@@ -11,12 +23,46 @@ async def find_similar_patents(request: InitialIdeaRequest):
     This endpoint remains unchanged and works as intended.
     """
     try:
-        embedding = local_embedding_service.create_embedding(request.idea_text)
-        patents = mongo_service.vector_search(embedding)
+        # Dense vector search, or BM25 + vector fused by rank when RETRIEVAL_MODE=hybrid.
+        patents = await retrieval_service.find_similar(request.idea_text, **request.search_params())
         return StartChatResponse(matched_patents=patents)
+    except PoolSaturatedError as e:
+        raise _service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding similar patents: {str(e)}")
 
+@router.post("/find-similar/batch", response_model=BatchSimilarResponse)
+async def find_similar_patents_batch(requests: List[InitialIdeaRequest]):
+    """
+    Batch variant of /find-similar for screening many ideas at once. All ideas are embedded in a
+    single vectorized encode and then searched concurrently. Each idea gets its own result entry;
+    an idea whose search fails reports an error without failing the rest of the batch.
+    """
+    if not requests:
+        raise HTTPException(status_code=400, detail="The batch must contain at least one idea.")
+    if len(requests) > config.BATCH_MAX_IDEAS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {config.BATCH_MAX_IDEAS} ideas.")
+
+    searchable = [i for i, request in enumerate(requests) if request.idea_text.strip()]
+    try:
+        outcomes = await retrieval_service.find_similar_batch([requests[i].idea_text for i in searchable],
+                                                             [requests[i].search_params() for i in searchable])
+    except PoolSaturatedError as e:
+        raise _service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error embedding the batch: {str(e)}")
+
+    outcomes = dict(zip(searchable, outcomes))
+    results = []
+    for i in range(len(requests)):
+        if i not in outcomes:
+            results.append(BatchSimilarResult(index=i, error="idea_text is empty."))
+        elif isinstance(outcomes[i], BaseException):
+            results.append(BatchSimilarResult(index=i, error=f"Error finding similar patents: {str(outcomes[i])}"))
+        else:
+            results.append(BatchSimilarResult(index=i, matched_patents=outcomes[i]))
+    return BatchSimilarResponse(results=results)
+
 # --- THIS IS THE NEW, CORRECTED ANALYSIS ENDPOINT ---
 @router.post("/analyze-landscape", response_model=HolisticAnalysis)
 async def analyze_patent_landscape(request: LandscapeAnalysisRequest):
@@ -27,13 +73,63 @@ async def analyze_patent_landscape(request: LandscapeAnalysisRequest):
     if not request.matched_patents:
         raise HTTPException(status_code=400, detail="Cannot perform analysis with an empty list of matched patents.")
 
+    provider_scheduler.priority.set(request.priority)
     try:
-        # This now calls our new, more powerful orchestrator function
-        analysis = llm_service.get_holistic_analysis(
+        # This now calls our new, more powerful orchestrator function.
+        # Repeats are served from cache; identical concurrent requests share one LLM call,
+        # made with async clients so a slow provider never blocks the event loop.
+        analysis = await llm_service.analyze_landscape(
             user_idea=request.user_idea,
             matched_patents=request.matched_patents
         )
         return analysis
+    except PoolSaturatedError as e:
+        raise _service_unavailable(e)
+    except prompt_packer.PromptBudgetError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # The service layer's final error is passed cleanly to the frontend.
-        raise HTTPException(status_code=500, detail=f"AI Landscape Analysis Failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"AI Landscape Analysis Failed: {str(e)}")
+
+
+@router.post("/analyze-landscape/stream")
+async def stream_patent_landscape(request: LandscapeAnalysisRequest):
+    """
+    Streaming variant of /analyze-landscape. Returns Server-Sent Events so the UI can render each
+    field of the analysis as soon as the model has produced it, instead of waiting for the whole
+    completion. The final `done` event carries the complete, quality-validated HolisticAnalysis.
+    """
+    if not request.matched_patents:
+        raise HTTPException(status_code=400, detail="Cannot perform analysis with an empty list of matched patents.")
+    try:
+        # Reject before the 200 response starts; once streaming, errors arrive as `error` events.
+        llm_limiter.ensure_capacity()
+    except PoolSaturatedError as e:
+        raise _service_unavailable(e)
+
+    async def event_stream():
+        provider_scheduler.priority.set(request.priority)
+        try:
+            async for event, data in llm_service.stream_holistic_analysis(request.user_idea, request.matched_patents):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except PoolSaturatedError as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': e.retry_after})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stats", include_in_schema=False)
+def get_stats():
+    """Runtime counters for capacity tuning: embedding batch sizes, queue waits, cache hit rates, prompt tokens saved and LLM rate limits."""
+    return {
+        "embedding_batcher": local_embedding_service.get_batcher().stats(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "analysis_cache": llm_service.get_analysis_cache_stats(),
+        "comparison_cache": llm_service.get_comparison_cache_stats(),
+        "llm_providers": llm_service.get_provider_stats(),
+        "prompt_packing": prompt_packer.get_stats(),
+        "llm_scheduler": provider_scheduler.get_stats(),
+    }
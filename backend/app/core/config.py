@@ -1,9 +1,211 @@
 import os
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY and not TOGETHER_API_KEY:
-    raise ValueError("FATAL ERROR: At least one AI service key (GOOGLE_API_KEY or TOGETHER_API_KEY) must be defined in your .env file.")
\ No newline at end of file
+
+def require_llm_keys():
+    """Called by the LLM services on import; the embedding server needs no LLM credentials."""
+    if not GOOGLE_API_KEY and not TOGETHER_API_KEY:
+        raise ValueError("FATAL ERROR: At least one AI service key (GOOGLE_API_KEY or TOGETHER_API_KEY) must be defined in your .env file.")
+
+# --- Logging ---
+# Log records are queued and written by a background thread; every line carries the request id.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+if LOG_LEVEL not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+    raise ValueError(f"FATAL ERROR: LOG_LEVEL must be DEBUG, INFO, WARNING, ERROR or CRITICAL, got '{LOG_LEVEL}'.")
+
+# --- LLM provider endpoints ---
+# Overridable so benchmarks can point both providers at benchmarks/fake_llm_server.py.
+# GEMINI_API_ENDPOINT switches the Gemini SDK to its REST transport against that host.
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", "https://api.together.xyz/v1")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+
+# --- Vector search backend ---
+# "atlas" runs $vectorSearch on MongoDB Atlas. "local" searches the memory-mapped index
+# written by data_ingestion/build_local_index.py, so no Atlas round trip is needed.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas").lower()
+if VECTOR_BACKEND not in ("atlas", "local"):
+    raise ValueError(f"FATAL ERROR: VECTOR_BACKEND must be 'atlas' or 'local', got '{VECTOR_BACKEND}'.")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(PROJECT_ROOT, "data_ingestion", "local_index"))
+# Breadth of the HNSW graph search; only used when the index was built with a graph.
+LOCAL_INDEX_EF_SEARCH = int(os.getenv("LOCAL_INDEX_EF_SEARCH", "64"))
+# Filtered searches that leave at most this many rows scan them exactly; larger ones walk the
+# HNSW graph, skipping rows that do not match.
+LOCAL_INDEX_EXACT_FILTER_ROWS = int(os.getenv("LOCAL_INDEX_EXACT_FILTER_ROWS", "50000"))
+
+# --- Quantized vector search ---
+# "int8" or "binary" searches compact codes stored next to (or instead of) the full vectors,
+# then rescores RESCORE_FACTOR times as many candidates as needed at full precision.
+# Atlas needs a vector index on embedding_int8 / embedding_bits named VECTOR_QUANTIZED_INDEX;
+# the local backend needs an index built with --quantize.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+if VECTOR_QUANTIZATION not in ("none", "int8", "binary"):
+    raise ValueError(f"FATAL ERROR: VECTOR_QUANTIZATION must be 'none', 'int8' or 'binary', got '{VECTOR_QUANTIZATION}'.")
+VECTOR_RESCORE_FACTOR = max(int(os.getenv("VECTOR_RESCORE_FACTOR", "4")), 1)
+VECTOR_QUANTIZED_INDEX = os.getenv("VECTOR_QUANTIZED_INDEX", f"vector_index_{VECTOR_QUANTIZATION}")
+
+# --- Vector search parameters ---
+# Defaults for the per-request knobs of /find-similar. VECTOR_SEARCH_LIMIT nearest neighbours are
+# fetched, from VECTOR_SEARCH_NUM_CANDIDATES considered by the ANN search (0 = max(150, 15 * limit);
+# the HNSW breadth or rescored candidates on the local backend), those scoring under
+# VECTOR_SEARCH_MIN_SCORE are dropped and the best VECTOR_SEARCH_NUM_RESULTS are returned.
+# benchmarks/bench_vector_search.py reports the recall and latency of each combination.
+VECTOR_SEARCH_NUM_RESULTS = int(os.getenv("VECTOR_SEARCH_NUM_RESULTS", "5"))
+VECTOR_SEARCH_LIMIT = int(os.getenv("VECTOR_SEARCH_LIMIT", "10"))
+VECTOR_SEARCH_NUM_CANDIDATES = int(os.getenv("VECTOR_SEARCH_NUM_CANDIDATES", "0"))
+VECTOR_SEARCH_MIN_SCORE = float(os.getenv("VECTOR_SEARCH_MIN_SCORE", "0.5"))
+# Near-duplicates and family members ingested as one cluster (data_ingestion/dedup.py) are returned
+# once, as the best-scoring patent of the cluster, which lists the others in family_members.
+VECTOR_SEARCH_COLLAPSE_CLUSTERS = os.getenv("VECTOR_SEARCH_COLLAPSE_CLUSTERS", "true").lower() == "true"
+# Atlas rejects numCandidates above 10000.
+VECTOR_SEARCH_MAX_CANDIDATES = 10000
+if not 1 <= VECTOR_SEARCH_NUM_RESULTS <= VECTOR_SEARCH_LIMIT:
+    raise ValueError(f"FATAL ERROR: VECTOR_SEARCH_NUM_RESULTS must be between 1 and VECTOR_SEARCH_LIMIT ({VECTOR_SEARCH_LIMIT}), got {VECTOR_SEARCH_NUM_RESULTS}.")
+if VECTOR_SEARCH_NUM_CANDIDATES and not VECTOR_SEARCH_LIMIT <= VECTOR_SEARCH_NUM_CANDIDATES <= VECTOR_SEARCH_MAX_CANDIDATES:
+    raise ValueError(f"FATAL ERROR: VECTOR_SEARCH_NUM_CANDIDATES must be 0 or between VECTOR_SEARCH_LIMIT and {VECTOR_SEARCH_MAX_CANDIDATES}, got {VECTOR_SEARCH_NUM_CANDIDATES}.")
+if not 0.0 <= VECTOR_SEARCH_MIN_SCORE <= 1.0:
+    raise ValueError(f"FATAL ERROR: VECTOR_SEARCH_MIN_SCORE must be in [0, 1], got {VECTOR_SEARCH_MIN_SCORE}.")
+
+# --- Hybrid retrieval ---
+# "hybrid" also runs a BM25 search over title + abstract (index built by
+# data_ingestion/build_lexical_index.py) and merges both rankings by reciprocal-rank fusion.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+if RETRIEVAL_MODE not in ("vector", "hybrid"):
+    raise ValueError(f"FATAL ERROR: RETRIEVAL_MODE must be 'vector' or 'hybrid', got '{RETRIEVAL_MODE}'.")
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(PROJECT_ROOT, "data_ingestion", "lexical_index"))
+# Depth of each ranking fed into the fusion, and the RRF damping constant.
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# --- MongoDB connection pool ---
+# A single client per process is shared by every request; these bound its pool.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+
+# --- Request executors and backpressure ---
+# Embedding runs on a small CPU pool and LLM calls on a larger I/O pool. Once a pool has
+# POOL_SIZE calls running and QUEUE_LIMIT waiting, new requests get 503 with Retry-After.
+EMBEDDING_POOL_SIZE = int(os.getenv("EMBEDDING_POOL_SIZE", "2"))
+EMBEDDING_QUEUE_LIMIT = int(os.getenv("EMBEDDING_QUEUE_LIMIT", "64"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "32"))
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "4"))
+SEARCH_QUEUE_LIMIT = int(os.getenv("SEARCH_QUEUE_LIMIT", "64"))
+
+# --- Embedding model backend ---
+# "torch" runs all-MiniLM-L6-v2 in eager PyTorch. "onnx" runs the same weights with ONNX Runtime,
+# and "onnx-int8" a dynamically int8-quantized export, chosen for this CPU's instruction set
+# unless EMBEDDING_ONNX_QUANTIZATION names one. Both ONNX backends need
+# `pip install "sentence-transformers[onnx]"`. benchmarks/bench_embedding_backends.py checks
+# parity with torch and measures the speed-up. EMBEDDING_THREADS is the intra-op thread count of
+# each encode; the default splits the cores between the EMBEDDING_POOL_SIZE concurrent encodes.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+if EMBEDDING_BACKEND not in ("torch", "onnx", "onnx-int8"):
+    raise ValueError(f"FATAL ERROR: EMBEDDING_BACKEND must be 'torch', 'onnx' or 'onnx-int8', got '{EMBEDDING_BACKEND}'.")
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "auto").lower()
+if EMBEDDING_ONNX_QUANTIZATION not in ("auto", "arm64", "avx2", "avx512", "avx512_vnni"):
+    raise ValueError(
+        "FATAL ERROR: EMBEDDING_ONNX_QUANTIZATION must be auto, arm64, avx2, avx512 or avx512_vnni, "
+        f"got '{EMBEDDING_ONNX_QUANTIZATION}'."
+    )
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or max(1, (os.cpu_count() or 1) // EMBEDDING_POOL_SIZE)
+
+# --- Embedding server ---
+# With EMBEDDING_SERVER_SOCKET set, workers send their texts to one embedding server per node
+# (python -m app.services.embedding_server, listening on that Unix socket) instead of each
+# loading the model, so memory no longer grows with the worker count and encodes are batched
+# across all workers. The server itself runs with the embedding settings above.
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+EMBEDDING_SERVER_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_SERVER_TIMEOUT_SECONDS", "30"))
+
+# --- Startup warm-up ---
+# Each worker loads the embedding model (and any local indexes) in a background task right after
+# startup; /ready answers 503 until that has finished. Disable to load everything on first use.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# --- Batch search ---
+# /find-similar/batch accepts up to MAX_IDEAS ideas and runs at most CONCURRENCY searches at once.
+BATCH_MAX_IDEAS = int(os.getenv("BATCH_MAX_IDEAS", "500"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "16"))
+OVERLOAD_RETRY_AFTER_SECONDS = int(os.getenv("OVERLOAD_RETRY_AFTER_SECONDS", "5"))
+
+# --- Embedding micro-batching ---
+# Concurrent /find-similar requests are merged into one encode of up to MAX_SIZE texts.
+# While the encoders are busy, a request waits at most WAIT_MS for others to join it.
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "3"))
+
+# --- Embedding cache ---
+# Tier 1 is an in-process LRU with TTL; tier 2 is a SQLite file shared by all workers on
+# the host. Set EMBEDDING_CACHE_PATH to an empty string to keep the cache in memory only.
+EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "10000"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(PROJECT_ROOT, "backend", ".cache", "embeddings.sqlite3"))
+
+# --- Landscape analysis cache ---
+# Validated analyses are cached per (idea, patent set, models, prompt version).
+ANALYSIS_CACHE_MAX_ITEMS = int(os.getenv("ANALYSIS_CACHE_MAX_ITEMS", "1000"))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "21600"))
+
+# --- Map-reduce analysis ---
+# "single" puts every patent into one analysis prompt. "map_reduce" first compares each patent with
+# the idea in its own call, ANALYSIS_MAP_CONCURRENCY at a time per analysis, then synthesizes the
+# comparisons in one compact call, so large prior-art sets cost about one comparison plus one
+# synthesis of wall time. "auto" uses map-reduce from ANALYSIS_MAP_REDUCE_MIN_PATENTS patents up.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "auto").lower()
+if ANALYSIS_MODE not in ("single", "map_reduce", "auto"):
+    raise ValueError(f"FATAL ERROR: ANALYSIS_MODE must be 'single', 'map_reduce' or 'auto', got '{ANALYSIS_MODE}'.")
+ANALYSIS_MAP_REDUCE_MIN_PATENTS = int(os.getenv("ANALYSIS_MAP_REDUCE_MIN_PATENTS", "10"))
+ANALYSIS_MAP_CONCURRENCY = int(os.getenv("ANALYSIS_MAP_CONCURRENCY", "16"))
+ANALYSIS_COMPARISON_CACHE_MAX_ITEMS = int(os.getenv("ANALYSIS_COMPARISON_CACHE_MAX_ITEMS", "20000"))
+
+# --- Prompt packing ---
+# The prior art in the analysis prompt is packed into a token budget per provider: patents are
+# ordered by score, near-duplicate abstracts are replaced by a pointer to the better-scored one, and
+# abstracts are cut to their sentences most similar to the idea until the whole prompt fits.
+PROMPT_PACKING_ENABLED = os.getenv("PROMPT_PACKING_ENABLED", "true").lower() == "true"
+PROMPT_TOKEN_BUDGET_GEMINI = int(os.getenv("PROMPT_TOKEN_BUDGET_GEMINI", "6000"))
+PROMPT_TOKEN_BUDGET_TOGETHER = int(os.getenv("PROMPT_TOKEN_BUDGET_TOGETHER", "4000"))
+# Word 3-gram Jaccard similarity above which two abstracts count as near-duplicates.
+PROMPT_DEDUP_THRESHOLD = float(os.getenv("PROMPT_DEDUP_THRESHOLD", "0.8"))
+if not 0.0 < PROMPT_DEDUP_THRESHOLD <= 1.0:
+    raise ValueError(f"FATAL ERROR: PROMPT_DEDUP_THRESHOLD must be in (0, 1], got {PROMPT_DEDUP_THRESHOLD}.")
+
+# --- LLM provider rate limits ---
+# Every provider call is admitted through a token bucket on requests per minute and one on tokens
+# per minute (the prompt plus LLM_EXPECTED_COMPLETION_TOKENS); set them a little under the quota
+# of your API tier, or to 0 for no limit. Queued calls are admitted interactive first, then batch.
+# A 429 pauses the provider for its Retry-After, or for an exponential backoff from
+# LLM_RATE_LIMIT_BACKOFF_SECONDS without one, and analyses go to the provider free soonest.
+LLM_GEMINI_RPM = int(os.getenv("LLM_GEMINI_RPM", "0"))
+LLM_GEMINI_TPM = int(os.getenv("LLM_GEMINI_TPM", "0"))
+LLM_TOGETHER_RPM = int(os.getenv("LLM_TOGETHER_RPM", "0"))
+LLM_TOGETHER_TPM = int(os.getenv("LLM_TOGETHER_TPM", "0"))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "700"))
+# A call that would wait longer than this for admission fails over (or gets 503) instead.
+LLM_SCHEDULER_MAX_WAIT_SECONDS = float(os.getenv("LLM_SCHEDULER_MAX_WAIT_SECONDS", "20"))
+LLM_RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_SECONDS", "2"))
+# Further attempts, after both providers answered 429, on whichever provider is free first.
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "2"))
+
+# --- LLM hedging ---
+# When enabled, the fallback provider is also started if the primary has not answered within
+# the hedge delay, and the first response that passes quality validation wins.
+# LLM_HEDGE_DELAY is either a number of seconds or a percentile of observed primary latency
+# such as "p90"; percentiles fall back to LLM_HEDGE_DELAY_SECONDS until enough samples exist.
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_DELAY_SECONDS = 10.0
+LLM_HEDGE_PERCENTILE = None
+_hedge_delay = os.getenv("LLM_HEDGE_DELAY", "p90").strip().lower()
+if _hedge_delay.startswith("p"):
+    LLM_HEDGE_PERCENTILE = float(_hedge_delay[1:]) / 100.0
+else:
+    LLM_HEDGE_DELAY_SECONDS = float(_hedge_delay)
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import config, metrics
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a pool already holds as much running and queued work as it is allowed to."""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"The server is busy ({pool_name} capacity reached). Please retry in {retry_after} seconds.")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    A thread pool with a hard cap on queued work.
+
+    Up to `max_workers` calls run at once and up to `max_queue` more may wait. Anything beyond
+    that is rejected immediately with PoolSaturatedError, so latency under overload stays bounded
+    and the API can answer 503 + Retry-After instead of queueing forever.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _release(self, _future: Future = None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise PoolSaturatedError(self.name, self.retry_after)
+            self._in_flight += 1
+        try:
+            # Run in a copy of the caller's context so the request id and timing stages follow the work.
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs `fn` on the pool and awaits it without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncLimiter:
+    """
+    The event-loop counterpart of BoundedExecutor, for work that is already non-blocking (such as
+    native async LLM clients). At most `max_concurrent` holders run at once, `max_queue` more may
+    wait, and anything beyond that is rejected with PoolSaturatedError.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.capacity = max_concurrent + max_queue
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def ensure_capacity(self):
+        """Raises PoolSaturatedError now if slot() would; lets callers reject before committing to a response."""
+        if self._in_flight >= self.capacity:
+            raise PoolSaturatedError(self.name, self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.ensure_capacity()
+        self._in_flight += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self._in_flight -= 1
+
+
+# CPU-bound: SentenceTransformer.encode releases the GIL inside torch, so threads scale until
+# the cores are busy. Keep this small; each encode already uses several intra-op threads.
+embedding_pool = BoundedExecutor(
+    "embedding", config.EMBEDDING_POOL_SIZE, config.EMBEDDING_QUEUE_LIMIT, config.OVERLOAD_RETRY_AFTER_SECONDS
+)
+
+# I/O-bound: each LLM call mostly waits on the provider, so many can be in flight at once.
+# The pool serves the remaining synchronous SDK calls; the limiter caps native async LLM calls.
+llm_pool = BoundedExecutor(
+    "llm", config.LLM_POOL_SIZE, config.LLM_QUEUE_LIMIT, config.OVERLOAD_RETRY_AFTER_SECONDS
+)
+llm_limiter = AsyncLimiter(
+    "llm", config.LLM_POOL_SIZE, config.LLM_QUEUE_LIMIT, config.OVERLOAD_RETRY_AFTER_SECONDS
+)
+
+# CPU-bound but short: in-process index lookups (BM25 and the local vector index), kept apart from encoding so a burst of
+# searches never queues behind model inference.
+search_pool = BoundedExecutor(
+    "search", config.SEARCH_POOL_SIZE, config.SEARCH_QUEUE_LIMIT, config.OVERLOAD_RETRY_AFTER_SECONDS
+)
+
+
+metrics.Gauge(
+    "patent_checker_pool_in_flight", "Calls running or queued on each executor pool and limiter.",
+    lambda: {(name, kind): pool.in_flight for name, kind, pool in (
+        ("embedding", "pool", embedding_pool), ("llm", "pool", llm_pool), ("llm", "limiter", llm_limiter),
+        ("search", "pool", search_pool),
+    )},
+    ("name", "kind"),
+)
+
+
+def shutdown():
+    embedding_pool.shutdown()
+    llm_pool.shutdown()
+    search_pool.shutdown()
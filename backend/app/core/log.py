@@ -0,0 +1,58 @@
+import logging
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+# The id of the request being handled, set by the middleware in main.py. Work handed to the
+# executors runs in a copy of the caller's context, so its log lines carry the same id.
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+_listener = None
+
+
+def new_request_id(incoming: str = None) -> str:
+    """Keeps a caller-supplied X-Request-ID (trimmed) so ids can be followed across services."""
+    value = (incoming or "").strip()[:64] or uuid.uuid4().hex[:16]
+    request_id.set(value)
+    return value
+
+
+class _RequestIdFilter(logging.Filter):
+    # Runs in the caller's thread before the record is queued, while the request's context is current.
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+def configure(level: str = "INFO"):
+    """
+    Routes the root logger through a queue: request handlers only enqueue records, and a
+    background thread formats and writes them, so a slow stdout never stalls the event loop.
+    Idempotent, since uvicorn may import the app more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(_FORMAT))
+    handler = QueueHandler(records)
+    handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # The LLM SDKs' HTTP client logs every request at INFO; keep that out of normal output.
+    logging.getLogger("httpx").setLevel(max(root.level, logging.WARNING))
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Flushes queued records; called when the app stops."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,184 @@
+import math
+import threading
+
+# Latency buckets in seconds, from a cached embedding (milliseconds) to a slow LLM call (a minute).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets per label set, with their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    A value read when /metrics is scraped. `callback` returns a number, or a dict mapping
+    label-value tuples to numbers, so existing counters (pools, caches) need no extra bookkeeping.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _samples(self) -> list[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items()) if value is not None]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered.")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Counts are per worker process, like /api/stats; Prometheus sums them across workers.
+REQUEST_SECONDS = Histogram(
+    "patent_checker_request_duration_seconds", "Time to produce an HTTP response, by handler and status.",
+    ("method", "handler", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "patent_checker_stage_duration_seconds", "Time spent in each pipeline stage (embedding, retrieval, map, llm, validation).",
+    ("stage",),
+)
+LLM_CALLS = Counter(
+    "patent_checker_llm_calls_total", "LLM provider calls by outcome (success, error, quality_failure, rate_limited, cancelled).",
+    ("provider", "outcome"),
+)
+LLM_FALLBACKS = Counter(
+    "patent_checker_llm_fallbacks_total", "Times the fallback provider was started, by orchestration mode.",
+    ("mode",),
+)
+LLM_QUALITY_FAILURES = Counter(
+    "patent_checker_llm_quality_failures_total", "Provider responses rejected by schema or quality validation, by reason.",
+    ("provider", "reason"),
+)
+LLM_TOKENS = Counter(
+    "patent_checker_llm_tokens_total", "Tokens reported by the providers, by direction (prompt, completion).",
+    ("provider", "direction"),
+)
+PROMPT_TOKENS_SAVED = Counter(
+    "patent_checker_prompt_tokens_saved_total", "Prompt tokens removed by packing the prior art into the token budget.",
+    ("provider",),
+)
+MAP_COMPARISONS = Counter(
+    "patent_checker_map_comparisons_total", "Per-patent comparisons in map-reduce analyses, by outcome (compared, cached, failed).",
+    ("outcome",),
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "patent_checker_llm_queue_wait_seconds", "Time an LLM call waited for admission under the provider's rate limits.",
+    ("provider", "priority"),
+)
+LLM_RATE_LIMITED = Counter(
+    "patent_checker_llm_rate_limited_total", "429 responses from the providers, each of which pauses that provider.",
+    ("provider",),
+)
@@ -0,0 +1,37 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from . import metrics
+
+# The stage durations of the request being handled. Set per request by the middleware in main.py;
+# tasks spawned while handling it inherit the same dict, so their stages are recorded too.
+_request_stages: ContextVar[dict | None] = ContextVar("request_stages", default=None)
+
+
+def start_request() -> dict:
+    stages = {}
+    _request_stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Adds the time spent in the block to the current request's `name` stage and to the stage
+    histogram on /metrics. Stages that run concurrently (hedged LLM calls, batch searches) are
+    summed per request, so a stage can exceed the request's wall time.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+
+def server_timing_header(stages: dict) -> str:
+    """Formats stages as a Server-Timing header value, in milliseconds."""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
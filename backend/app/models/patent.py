@@ -1,13 +1,70 @@
-from pydantic import BaseModel, Field
-from typing import List
+import re
+from datetime import date
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Literal, Optional
+from ..core import config
 
 # --- API Request Models ---
+class SearchFilters(BaseModel):
+    # Applied before the nearest-neighbour search, so they narrow what is searched rather than what is kept.
+    published_from: Optional[date] = Field(None, description="Earliest publication date, inclusive.")
+    published_to: Optional[date] = Field(None, description="Latest publication date, inclusive.")
+    cpc: List[str] = Field([], max_length=50, description="CPC classes, subclasses, groups or codes (e.g. 'G06', 'H04L', 'H04L9/32'); any may match.")
+    countries: List[str] = Field([], max_length=50, description="Publication countries (e.g. 'US', 'EP', 'WO'); any may match.")
+
+    @field_validator("cpc")
+    @classmethod
+    def _normalize_cpc(cls, codes: List[str]) -> List[str]:
+        codes = [re.sub(r"\s+", "", code).upper() for code in codes]
+        if any(len(code) < 3 for code in codes):
+            raise ValueError("CPC filters must be at least a class, e.g. 'G06'.")
+        return codes
+
+    @field_validator("countries")
+    @classmethod
+    def _normalize_countries(cls, countries: List[str]) -> List[str]:
+        countries = [country.strip().upper() for country in countries]
+        if any(not re.fullmatch(r"[A-Z]{2}", country) for country in countries):
+            raise ValueError("Countries must be two-letter codes, e.g. 'US'.")
+        return countries
+
+    @model_validator(mode="after")
+    def _check_dates(self):
+        if self.published_from and self.published_to and self.published_from > self.published_to:
+            raise ValueError("published_from must not be after published_to.")
+        return self
+
 class InitialIdeaRequest(BaseModel):
     idea_text: str
+    # Vector search knobs, defaulting to VECTOR_SEARCH_*; benchmarks/bench_vector_search.py shows what each costs.
+    num_results: int = Field(config.VECTOR_SEARCH_NUM_RESULTS, ge=1, le=100, description="Patents to return.")
+    limit: Optional[int] = Field(None, ge=1, le=1000, description="Nearest neighbours fetched before the score threshold; defaults to max(VECTOR_SEARCH_LIMIT, num_results).")
+    num_candidates: Optional[int] = Field(None, ge=1, le=config.VECTOR_SEARCH_MAX_CANDIDATES, description="Candidates the ANN search considers; more costs latency for recall.")
+    min_score: float = Field(config.VECTOR_SEARCH_MIN_SCORE, ge=0.0, le=1.0, description="Relevance threshold on the [0, 1] cosine score.")
+    filters: Optional[SearchFilters] = None
+
+    @model_validator(mode="after")
+    def _check_search_knobs(self):
+        if self.limit is not None and self.limit < self.num_results:
+            raise ValueError("limit must be at least num_results.")
+        if self.num_candidates is not None and self.num_candidates < self.search_limit:
+            raise ValueError("num_candidates must be at least limit.")
+        return self
+
+    @property
+    def search_limit(self) -> int:
+        return self.limit if self.limit is not None else max(config.VECTOR_SEARCH_LIMIT, self.num_results)
+
+    def search_params(self) -> dict:
+        """Keyword arguments for retrieval_service.find_similar."""
+        return {"num_results": self.num_results, "limit": self.search_limit,
+                "num_candidates": self.num_candidates, "min_score": self.min_score, "filters": self.filters}
 
 class LandscapeAnalysisRequest(BaseModel):
     user_idea: str
     matched_patents: List['MatchedPatent'] 
+    # Batch jobs queue behind interactive requests when the LLM providers are at their rate limits.
+    priority: Literal["interactive", "batch"] = "interactive"
 
 # --- API Response & Data Models ---
 class MatchedPatent(BaseModel):
@@ -15,10 +72,21 @@ class MatchedPatent(BaseModel):
     title: str
     abstract: str
     score: float
+    # Near-duplicates and family members of this patent, collapsed into it at ingestion or search time.
+    family_members: List[str] = []
 
 class StartChatResponse(BaseModel):
     matched_patents: List[MatchedPatent]
 
+# One entry per submitted idea, in request order. A failed idea carries `error` instead of failing the batch.
+class BatchSimilarResult(BaseModel):
+    index: int
+    matched_patents: List[MatchedPatent] = []
+    error: Optional[str] = None
+
+class BatchSimilarResponse(BaseModel):
+    results: List[BatchSimilarResult]
+
 # --- NEW: A sub-model to enforce evidence-based analysis ---
 class PointOfAnalysis(BaseModel):
     description: str = Field(..., description="A specific, detailed point of similarity or difference.")
@@ -36,4 +104,10 @@ class HolisticAnalysis(BaseModel):
     keySimilarities: List[PointOfAnalysis] = Field(..., description="A list of specific areas where the user's idea overlaps with the prior art, with citations.")
     keyDifferences: List[PointOfAnalysis] = Field(..., description="A list of specific, unique aspects of the user's idea, with citations for contrast.")
     
-    expertRecommendation: str = Field(..., description="A concluding paragraph offering strategic advice for a non-expert on how to proceed, focusing on patentability.")
\ No newline at end of file
+    expertRecommendation: str = Field(..., description="A concluding paragraph offering strategic advice for a non-expert on how to proceed, focusing on patentability.")
+
+# --- Map-reduce analysis: one structured comparison per patent, synthesized into a HolisticAnalysis ---
+class PatentComparison(BaseModel):
+    noveltyScore: int = Field(..., ge=1, le=10, description="How distinct the idea is from this one patent.")
+    keySimilarities: List[str] = Field(default_factory=list, description="Points the idea shares with the patent.")
+    keyDifferences: List[str] = Field(default_factory=list, description="Points where the idea departs from the patent.")
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import deque
+from ..core.executors import BoundedExecutor, PoolSaturatedError
+
+# How many recent batches/requests the stats percentiles are computed over.
+_STATS_WINDOW = 2000
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into one batched encode.
+
+    If an encoder thread is idle, whatever arrived in the current event-loop tick is dispatched
+    straight away, so light traffic pays no extra latency. While every encoder is busy, requests
+    accumulate for up to `max_wait_ms` (or until `max_batch_size` texts are waiting) and then go
+    out as a single `encode_batch` call. Each caller gets its own vector back through a future.
+    """
+
+    def __init__(self, encode_batch, executor: BoundedExecutor, max_batch_size: int, max_wait_ms: float, max_pending: int):
+        self._encode_batch = encode_batch
+        self._executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_pending = max_pending
+        self._pending = []  # (text, future, enqueued_at)
+        self._flush_handle = None
+        self._batches_in_flight = 0
+        self.total_batches = 0
+        self.total_items = 0
+        self._batch_sizes = deque(maxlen=_STATS_WINDOW)
+        self._queue_waits = deque(maxlen=_STATS_WINDOW)
+
+    async def embed(self, text: str) -> list[float]:
+        if len(self._pending) >= self.max_pending:
+            raise PoolSaturatedError(self._executor.name, self._executor.retry_after)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        else:
+            self._schedule_flush()
+        return await future
+
+    def _encoder_idle(self) -> bool:
+        return self._batches_in_flight < self._executor.max_workers
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None or not self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        if self._encoder_idle():
+            self._flush_handle = loop.call_soon(self._flush)
+        else:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = [item for item in self._pending[:self.max_batch_size] if not item[1].done()]
+        self._pending = self._pending[self.max_batch_size:]
+        if batch:
+            self._dispatch(batch)
+        self._schedule_flush()
+
+    def _dispatch(self, batch: list):
+        dispatched_at = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            self._queue_waits.append(dispatched_at - enqueued_at)
+        self._batch_sizes.append(len(batch))
+        self.total_batches += 1
+        self.total_items += len(batch)
+
+        try:
+            encode_future = self._executor.submit(self._encode_batch, [text for text, _, _ in batch])
+        except PoolSaturatedError as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._batches_in_flight += 1
+        asyncio.wrap_future(encode_future).add_done_callback(lambda done: self._on_batch_done(batch, done))
+
+    def _on_batch_done(self, batch: list, done: asyncio.Future):
+        self._batches_in_flight -= 1
+        error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+        vectors = done.result() if error is None else None
+        for index, (_, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[index])
+        # An encoder just freed up; don't make waiting requests sit out the rest of the window.
+        if self._pending:
+            self._flush()
+
+    def stats(self) -> dict:
+        sizes = list(self._batch_sizes)
+        waits = list(self._queue_waits)
+        return {
+            "batches": self.total_batches,
+            "items": self.total_items,
+            "mean_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch_size": max(sizes) if sizes else 0,
+            "queue_wait_ms_p50": round(_percentile(waits, 0.50) * 1000, 3),
+            "queue_wait_ms_p95": round(_percentile(waits, 0.95) * 1000, 3),
+            "pending": len(self._pending),
+            "batches_in_flight": self._batches_in_flight,
+        }
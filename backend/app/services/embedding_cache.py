@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from functools import lru_cache
+from ..core import config, metrics
+from ..core.cache import LRUTTLCache
+
+# SQLite caps the number of bound parameters per statement.
+_SQLITE_CHUNK = 500
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalises and collapses whitespace so trivially re-typed ideas share a key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteVectorStore:
+    """Persistent tier: survives restarts and is shared by every uvicorn worker on the host (WAL mode)."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_CHUNK):
+                chunk = keys[start:start + _SQLITE_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: list[tuple[str, list[float]]]):
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed on sha256(model name + normalised text).
+
+    Tier 1 is a per-process LRU with TTL; tier 2 is an optional SQLite file. Disk hits are
+    promoted into memory. Disk errors are logged and treated as misses, never as request failures.
+    """
+
+    def __init__(self, memory: LRUTTLCache, store: SQLiteVectorStore = None):
+        self.memory = memory
+        self.store = store
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_from_memory(self, model_name: str, text: str):
+        """Cheap enough to call on the event loop; counts memory hits only."""
+        vector = self.memory.peek(cache_key(model_name, text))
+        if vector is not None:
+            with self._lock:
+                self.memory_hits += 1
+        return vector
+
+    def get_many(self, model_name: str, texts: list[str]) -> list:
+        """Returns one vector per text, or None where neither tier has it."""
+        keys = [cache_key(model_name, text) for text in texts]
+        vectors = [self.memory.peek(key) for key in keys]
+        memory_hits = sum(vector is not None for vector in vectors)
+
+        missing_keys = [key for key, vector in zip(keys, vectors) if vector is None]
+        disk_found = {}
+        if missing_keys and self.store is not None:
+            try:
+                disk_found = self.store.get_many(missing_keys)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache read failed, treating as miss: %s", e)
+        for index, key in enumerate(keys):
+            if vectors[index] is None and key in disk_found:
+                vectors[index] = disk_found[key]
+                self.memory.set(key, vectors[index])
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += len(disk_found)
+            self.misses += sum(vector is None for vector in vectors)
+        return vectors
+
+    def put_many(self, model_name: str, texts: list[str], vectors: list[list[float]]):
+        items = [(cache_key(model_name, text), vector) for text, vector in zip(texts, vectors)]
+        for key, vector in items:
+            self.memory.set(key, vector)
+        if self.store is not None:
+            try:
+                self.store.put_many(items)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache write failed, continuing without persisting: %s", e)
+
+    def get(self, model_name: str, text: str):
+        return self.get_many(model_name, [text])[0]
+
+    def put(self, model_name: str, text: str, vector: list[float]):
+        self.put_many(model_name, [text], [vector])
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_items": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "persistent": self.store is not None,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache:
+    memory = LRUTTLCache(config.EMBEDDING_CACHE_MAX_ITEMS, config.EMBEDDING_CACHE_TTL_SECONDS)
+    store = SQLiteVectorStore(config.EMBEDDING_CACHE_PATH) if config.EMBEDDING_CACHE_PATH else None
+    return EmbeddingCache(memory, store)
+
+
+metrics.Gauge(
+    "patent_checker_embedding_cache", "Query embedding cache items and hits by tier, and misses.",
+    lambda: {(stat,): value for stat, value in get_embedding_cache().stats().items() if stat not in ("hit_rate", "persistent")},
+    ("stat",),
+)
@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .. import shared
+from ..core import config
+from ..core.executors import PoolSaturatedError
+from ..shared import EmbeddingServerOverloaded
+
+
+class EmbeddingClient(shared.EmbeddingClient):
+    """
+    The blocking client from app/shared.py (which ingestion uses too), with an overloaded server
+    reported like any other full pool (503 + Retry-After).
+    """
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        try:
+            return super().encode(texts)
+        except EmbeddingServerOverloaded as e:
+            raise PoolSaturatedError("embedding server", e.retry_after or config.OVERLOAD_RETRY_AFTER_SECONDS) from None
+
+
+@lru_cache(maxsize=1)
+def get_client() -> EmbeddingClient:
+    return EmbeddingClient(config.EMBEDDING_SERVER_SOCKET, config.EMBEDDING_SERVER_TIMEOUT_SECONDS)
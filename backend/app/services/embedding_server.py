@@ -0,0 +1,102 @@
+"""
+The node's embedding server: one process loads the embedding model and serves every worker over
+the Unix socket EMBEDDING_SERVER_SOCKET, so model memory no longer grows with the worker count.
+Requests of up to EMBEDDING_BATCH_MAX_SIZE texts, from all workers, are micro-batched together
+through EmbeddingBatcher; larger ones are encoded as they arrive. Vectors go back as raw float32
+(the wire format is described in app/shared.py). Run from the backend directory, with the
+same EMBEDDING_* settings as the workers:
+
+    EMBEDDING_SERVER_SOCKET=/run/patent_checker/embeddings.sock python -m app.services.embedding_server
+"""
+import asyncio
+import json
+import logging
+import os
+
+import numpy as np
+
+from ..core import config, log
+from ..core.executors import PoolSaturatedError, embedding_pool
+from ..shared import LENGTH_PREFIX, SHAPE_HEADER, STATUS_ERROR, STATUS_OK, STATUS_OVERLOADED
+from . import local_embedding_service
+
+# Far above any real request; a larger length means the stream is not speaking this protocol.
+_MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    if len(texts) <= config.EMBEDDING_BATCH_MAX_SIZE:
+        vectors = await asyncio.gather(*(local_embedding_service.create_embedding_async(text) for text in texts))
+    else:
+        vectors = await local_embedding_service.create_embeddings_async(texts)
+    return np.asarray(vectors, dtype="<f4").reshape(len(texts), -1)
+
+
+def _failure(status: int, detail: dict) -> bytes:
+    body = json.dumps(detail).encode("utf-8")
+    return bytes([status]) + LENGTH_PREFIX.pack(len(body)) + body
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serves one worker thread's connection: requests are answered in order until it closes."""
+    try:
+        while True:
+            try:
+                (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(LENGTH_PREFIX.size))
+            except asyncio.IncompleteReadError:
+                return
+            if length > _MAX_REQUEST_BYTES:
+                logger.warning("Dropping a connection that sent a %d-byte request.", length)
+                return
+            try:
+                texts = json.loads(await reader.readexactly(length))["texts"]
+                vectors = await _embed(texts)
+                response = bytes([STATUS_OK]) + SHAPE_HEADER.pack(*vectors.shape) + vectors.tobytes()
+            except asyncio.IncompleteReadError:
+                return
+            except PoolSaturatedError as e:
+                response = _failure(STATUS_OVERLOADED, {"error": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                logger.exception("Embedding request failed.")
+                response = _failure(STATUS_ERROR, {"error": f"{type(e).__name__}: {e}"})
+            writer.write(response)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(path: str):
+    local_embedding_service.use_local_model()
+    # The model is loaded before the socket appears, so workers waiting on it meet a warm model.
+    await embedding_pool.run(local_embedding_service.warm_up)
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = await asyncio.start_unix_server(_handle, path=path)
+    logger.info("Embedding server listening on '%s' (%s backend).", path, config.EMBEDDING_BACKEND)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    log.configure(config.LOG_LEVEL)
+    if not config.EMBEDDING_SERVER_SOCKET:
+        raise SystemExit("Set EMBEDDING_SERVER_SOCKET to the Unix socket path the workers connect to.")
+    try:
+        asyncio.run(serve(config.EMBEDDING_SERVER_SOCKET))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.shutdown()
+
+
+if __name__ == "__main__":
+    main()
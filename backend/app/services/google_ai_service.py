@@ -1,21 +1,35 @@
 import json
+import logging
 import re
 from functools import lru_cache
-from vertexai.generative_models import GenerativeModel
-from vertexai.language_models import TextEmbeddingModel
+from .embedding_cache import get_embedding_cache
 
+EMBEDDING_MODEL_NAME = "text-embedding-004"
+
+logger = logging.getLogger(__name__)
+
+# vertexai is imported on first use, so importing this module does not load the Vertex SDK.
 @lru_cache(maxsize=1)
 def get_embedding_model():
-    return TextEmbeddingModel.from_pretrained("text-embedding-004")
+    from vertexai.language_models import TextEmbeddingModel
+    return TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
 
 @lru_cache(maxsize=1)
 def get_generative_model():
+    from vertexai.generative_models import GenerativeModel
     return GenerativeModel("gemini-1.0-pro")
 
 def create_embedding(text: str) -> list[float]:
+    # Every cache hit here also saves a paid Vertex AI call.
+    cache = get_embedding_cache()
+    cached = cache.get(EMBEDDING_MODEL_NAME, text)
+    if cached is not None:
+        return cached
     model = get_embedding_model()
     response = model.get_embeddings([text])
-    return response[0].values
+    vector = list(response[0].values)
+    cache.put(EMBEDDING_MODEL_NAME, text, vector)
+    return vector
 
 def get_comparison_from_gemini(user_idea: str, patent_abstract: str) -> dict:
     model = get_generative_model()
@@ -44,5 +58,5 @@ def get_comparison_from_gemini(user_idea: str, patent_abstract: str) -> dict:
         json_str = json_str_match.group(1) if json_str_match else response.text
         return json.loads(json_str)
     except Exception as e:
-        print(f"CRITICAL: Gemini response parsing failed. Raw text: {response.text}. Error: {e}")
+        logger.error("Gemini response parsing failed. Raw text: %s. Error: %s", response.text, e)
         return {"similarities": ["Error: The AI analysis could not be parsed."], "dissimilarities": ["Please try selecting the patent again."]}
\ No newline at end of file
@@ -0,0 +1,136 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Parses a single JSON object as it streams in and reports each part the moment it is complete.
+
+    `feed(chunk)` returns a list of events:
+      ("field", key, value)        a top-level scalar/string/object value has been closed
+      ("item", key, index, value)  one element of a top-level array has been closed
+
+    Text before the first "{" (such as a ```json fence) is ignored, as is anything after the
+    object closes. The parser only scans each character once, so feeding is linear overall.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.finished = False
+        # Top-level state: "key" -> "key_string" -> "colon" -> "value" -> "in_value" -> "comma"
+        self._expect = "key"
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._array_key = None
+        self._item_start = None
+        self._item_index = 0
+        self.result = {}
+
+    def feed(self, chunk: str) -> list[tuple]:
+        self._text += chunk
+        events = []
+        while self._pos < len(self._text) and not self.finished:
+            self._step(self._text[self._pos], events)
+            self._pos += 1
+        return events
+
+    def _emit_field(self, end: int, events: list):
+        value = json.loads(self._text[self._value_start:end])
+        self.result[self._key] = value
+        if self._array_key is None:
+            events.append(("field", self._key, value))
+
+    def _emit_item(self, end: int, events: list):
+        value = json.loads(self._text[self._item_start:end])
+        events.append(("item", self._array_key, self._item_index, value))
+        self._item_start = None
+        self._item_index += 1
+
+    def _step(self, ch: str, events: list):
+        pos = self._pos
+        if not self._started:
+            if ch == "{":
+                self._started = True
+                self._depth = 1
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._depth == 1 and self._expect == "key_string":
+                    self._key = json.loads(self._text[self._key_start:pos + 1])
+                    self._expect = "colon"
+            return
+
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect == "key":
+                self._key_start = pos
+                self._expect = "key_string"
+            elif self._depth == 1 and self._expect == "value":
+                self._value_start = pos
+                self._expect = "in_value"
+            elif self._depth == 2 and self._array_key is not None and self._item_start is None:
+                self._item_start = pos
+            return
+
+        if ch in _WHITESPACE:
+            return
+
+        if self._depth == 1:
+            if self._expect == "colon" and ch == ":":
+                self._expect = "value"
+            elif self._expect == "value":
+                self._value_start = pos
+                self._expect = "in_value"
+                if ch in "[{":
+                    self._depth = 2
+                    if ch == "[":
+                        self._array_key = self._key
+                        self._item_index = 0
+                        self._item_start = None
+            elif self._expect == "in_value" and ch in ",}":
+                # A scalar or string value ends at the next top-level separator.
+                self._emit_field(pos, events)
+                self._expect = "key"
+                if ch == "}":
+                    self.finished = True
+            elif self._expect in ("key", "comma"):
+                if ch == ",":
+                    self._expect = "key"
+                elif ch == "}":
+                    self.finished = True
+            return
+
+        # Inside a top-level container value (depth >= 2).
+        if ch in "[{":
+            if self._depth == 2 and self._array_key is not None and self._item_start is None:
+                self._item_start = pos
+            self._depth += 1
+        elif ch in "]}":
+            self._depth -= 1
+            if self._depth == 1:
+                if self._array_key is not None and self._item_start is not None:
+                    self._emit_item(pos, events)
+                self._emit_field(pos + 1, events)
+                self._array_key = None
+                self._expect = "comma"
+            elif self._depth == 2 and self._array_key is not None and self._item_start is not None:
+                self._emit_item(pos + 1, events)
+        elif self._depth == 2 and self._array_key is not None:
+            if ch == ",":
+                if self._item_start is not None:
+                    self._emit_item(pos, events)
+            elif self._item_start is None:
+                self._item_start = pos
@@ -0,0 +1,161 @@
+import json
+import logging
+import mmap
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from ..core import config
+from ..shared import tokenize
+from .search_filters import FilterColumns
+
+# Upper bound on the rows examined per term when tightening the top-k threshold.
+_THRESHOLD_SAMPLE_ROWS = 16384
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalIndex:
+    """
+    An in-process BM25 index over patent titles and abstracts.
+
+    The index directory is written by data_ingestion/build_lexical_index.py and holds:
+      - terms.json            the vocabulary; a term's position is its term id
+      - postings_offsets.npy  start of every term's postings (terms + 1 entries)
+      - postings_docs.npy     int32 row ids, ascending within each term
+      - postings_impacts.npy  float32 precomputed BM25 contribution of the term to the row
+      - max_impacts.npy       float32 largest impact per term, the bound used for early termination
+      - metadata.jsonl        one {publication_number, title, abstract, cluster_id, family_members} object per row
+      - metadata_offsets.npy  byte offset of every metadata row (count + 1 entries)
+      - filter_*.npy, filters.json  publication date, country and CPC columns for filtered search
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, "terms.json"), encoding="utf-8") as f:
+            self.term_ids = {term: term_id for term_id, term in enumerate(json.load(f))}
+        self.postings_offsets = np.load(os.path.join(index_dir, "postings_offsets.npy"))
+        self.postings_docs = np.load(os.path.join(index_dir, "postings_docs.npy"), mmap_mode="r")
+        self.postings_impacts = np.load(os.path.join(index_dir, "postings_impacts.npy"), mmap_mode="r")
+        self.max_impacts = np.load(os.path.join(index_dir, "max_impacts.npy"))
+        self.offsets = np.load(os.path.join(index_dir, "metadata_offsets.npy"))
+        self._metadata_file = open(os.path.join(index_dir, "metadata.jsonl"), "rb")
+        self._metadata = mmap.mmap(self._metadata_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.filters = FilterColumns(index_dir, len(self))
+
+    def __len__(self) -> int:
+        return int(self.manifest["count"])
+
+    def metadata(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._metadata[start:end])
+
+    def _postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return self.postings_docs[start:end], self.postings_impacts[start:end]
+
+    def top_k(self, text: str, k: int, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (rows, BM25 scores) of the k best rows, best first. Exact, using MaxScore pruning.
+        With `rows` (from FilterColumns.rows) only those rows can be returned.
+
+        Terms are scanned in descending order of their best possible contribution. Once the
+        remaining terms together could not lift an unseen row past the current k-th score, only
+        rows that can still make the top k are scored further, by binary search into the
+        remaining postings. Common, low-IDF terms with the longest postings come last, so they
+        are the ones that get probed instead of scanned.
+        """
+        term_ids = sorted({self.term_ids[t] for t in tokenize(text) if t in self.term_ids},
+                          key=lambda term_id: -self.max_impacts[term_id])
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        if rows is not None:
+            # Thresholds drawn from rows the filter excludes would prune rows it keeps, so every
+            # term is scanned in full.
+            for term_id in term_ids:
+                docs, impacts = self._postings(term_id)
+                scores[docs] += impacts
+            return self._best(rows[scores[rows] > 0], scores, k)
+        remaining = float(sum(self.max_impacts[term_id] for term_id in term_ids))
+        scanned_bound = 0.0
+        # A lower bound on the final k-th score: the k-th best of any subset of rows is no higher
+        # than the k-th best overall, and scores only grow. Taking it from an evenly spaced sample
+        # of the rows this term touched keeps each check cheap however long the postings are.
+        threshold = 0.0
+        for position, term_id in enumerate(term_ids):
+            remaining -= float(self.max_impacts[term_id])
+            scanned_bound += float(self.max_impacts[term_id])
+            docs, impacts = self._postings(term_id)
+            scores[docs] += impacts
+            # The k-th score can never exceed what the scanned terms can add up to, so there is
+            # no point looking for a threshold until the remaining terms are bounded below that.
+            if position == len(term_ids) - 1 or remaining >= scanned_bound:
+                continue
+            sample = docs[::len(docs) // _THRESHOLD_SAMPLE_ROWS + 1]
+            if len(sample) >= k:
+                threshold = max(threshold, float(np.partition(scores[sample], -k)[-k]))
+            if remaining < threshold:
+                rows = np.flatnonzero(scores)
+                # Same dtype as the postings, so searchsorted does not upcast a copy of them.
+                candidates = rows[scores[rows] + remaining >= threshold].astype(self.postings_docs.dtype)
+                for probe_id in term_ids[position + 1:]:
+                    self._add_term(probe_id, candidates, scores)
+                return self._best(candidates, scores, k)
+        return self._best(np.flatnonzero(scores), scores, k)
+
+    @staticmethod
+    def _best(rows: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(rows))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return best.astype(np.int64), scores[best]
+
+    def _add_term(self, term_id: int, rows: np.ndarray, scores: np.ndarray):
+        """
+        Adds the term's impact to those of `rows` (ascending) that appear in its postings, by
+        binary search when the rows are few compared with the postings and by a scan otherwise.
+        """
+        docs, impacts = self._postings(term_id)
+        if len(rows) * 16 >= len(docs):
+            scores[docs] += impacts
+            return
+        positions = np.searchsorted(docs, rows)
+        in_range = positions < len(docs)
+        hits = np.zeros(len(rows), dtype=bool)
+        hits[in_range] = docs[positions[in_range]] == rows[in_range]
+        scores[rows[hits]] += impacts[positions[hits]]
+
+
+@lru_cache(maxsize=1)
+def get_index() -> LexicalIndex:
+    logger.info("Loading lexical index from '%s'...", config.LEXICAL_INDEX_DIR)
+    index = LexicalIndex(config.LEXICAL_INDEX_DIR)
+    logger.info("Lexical index loaded: %d patents, %d terms.", len(index), len(index.term_ids))
+    return index
+
+
+def search(text: str, num_results: int, filters=None) -> list[dict]:
+    """
+    BM25 search over title + abstract, among the patents matching `filters` (a SearchFilters).
+    Scores are raw BM25, so only their order is meaningful.
+    """
+    index = get_index()
+    rows, scores = index.top_k(text, num_results, index.filters.rows(filters))
+    results = []
+    for row, score in zip(rows, scores):
+        patent = index.metadata(int(row))
+        results.append({
+            "publication_number": patent.get("publication_number"),
+            "title": patent.get("title"),
+            "abstract": patent.get("abstract"),
+            "score": float(score),
+            "cluster_id": patent.get("cluster_id"),
+            "family_members": patent.get("family_members", []),
+        })
+    return results
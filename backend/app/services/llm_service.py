@@ -1,11 +1,32 @@
+import asyncio
+import hashlib
 import json
-import traceback
+import logging
+import math
+import time
 import re
-from openai import OpenAI
-import google.generativeai as genai
-from ..core import config
-from ..models.patent import HolisticAnalysis, MatchedPatent, PointOfAnalysis
-from typing import List
+from collections import deque
+from functools import lru_cache
+from pydantic import ValidationError
+from ..core import config, metrics, timing
+from ..core.cache import LRUTTLCache, SingleFlight
+from ..core.executors import PoolSaturatedError, llm_limiter, llm_pool
+from ..models.patent import HolisticAnalysis, MatchedPatent, PatentComparison, PointOfAnalysis
+from . import prompt_packer, provider_scheduler
+from .embedding_cache import normalize_text
+from .json_stream import IncrementalJSONParser
+from .provider_scheduler import RateLimitedError
+from typing import TYPE_CHECKING, AsyncIterator, Callable, List
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+config.require_llm_keys()
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+TOGETHER_MODEL_NAME = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+
+logger = logging.getLogger(__name__)
 
 # --- REWRITTEN AND REINFORCED PROMPT TEMPLATE ---
 PROMPT_TEMPLATE = """
@@ -47,6 +68,75 @@ You are a meticulous, evidence-based Patent Analyst AI. Your credibility depends
 </PRIOR_ART_PATENTS>
 """
 
+# --- MAP-REDUCE PROMPTS: ONE COMPARISON PER PATENT, THEN A SYNTHESIS OF THE COMPARISONS ---
+# The per-patent shape follows together_ai_service.get_comparison, kept short so that the reduce
+# prompt stays compact even for a hundred patents.
+COMPARISON_PROMPT_TEMPLATE = """
+You are a meticulous Patent Analyst AI. Compare a "User's Idea" with ONE prior art patent. Be specific and factual, and use only what the two texts say.
+
+Your entire output must be a single, valid JSON object in exactly this format:
+{{
+  "noveltyScore": <An integer from 1 (the patent already covers the idea) to 10 (the idea is entirely distinct from it)>,
+  "keySimilarities": ["At most 3 short, specific points the idea shares with this patent."],
+  "keyDifferences": ["At most 3 short, specific points where the idea goes beyond or departs from this patent."]
+}}
+
+<USER_IDEA>
+{user_idea}
+</USER_IDEA>
+
+<PATENT_UNDER_COMPARISON>
+Publication Number: {publication_number}
+Title: {title}
+Abstract: {abstract}
+</PATENT_UNDER_COMPARISON>
+"""
+
+REDUCE_PROMPT_TEMPLATE = """
+You are a meticulous, evidence-based Patent Analyst AI. A "User's Idea" has already been compared with each prior art patent, one patent at a time. Combine these per-patent comparisons into one verifiable, structured report on the whole prior-art landscape.
+
+**CRITICAL INSTRUCTIONS:**
+1.  **Use Only The Comparisons:** Every point must be supported by the comparisons below. Do not invent details.
+2.  **Merge And Rank:** Merge points that several patents share into one point citing all of them, and list the points that matter most for novelty first.
+3.  **Mandatory Citations:** For every point of analysis, you MUST cite the `publication_number` of the patent(s) that justify your claim in the `cited_patents` field.
+4.  **Strict JSON Output:** Your entire output must be a single, valid JSON object that strictly adheres to the format defined below.
+
+**JSON OUTPUT FORMAT:**
+{{
+  "noveltyScore": <An integer from 1 (highly derivative) to 10 (highly novel), weighing the closest patents most>,
+  "synthesisOfPriorArt": "A dense paragraph summarizing the state of the art that the compared patents describe together.",
+  "keySimilarities": [
+    {{
+      "description": "A specific point of overlap between the user's idea and the prior art.",
+      "cited_patents": ["<publication_number_of_relevant_patent_1>", "..."]
+    }}
+  ],
+  "keyDifferences": [
+    {{
+      "description": "A specific point of novelty in the user's idea when contrasted with the prior art.",
+      "cited_patents": ["<publication_number_of_patent_being_contrasted>", "..."]
+    }}
+  ],
+  "expertRecommendation": "A final, concise paragraph of strategic advice. Summarize patentability, highlight the strongest novel aspects to pursue, and warn about the most significant challenges based on your analysis."
+}}
+
+---
+**DATA FOR ANALYSIS:**
+
+<USER_IDEA>
+{user_idea}
+</USER_IDEA>
+
+<PER_PATENT_COMPARISONS>
+{formatted_comparisons}
+</PER_PATENT_COMPARISONS>
+"""
+
+# Any edit to the prompts changes this hash and so invalidates previously cached analyses.
+PROMPT_VERSION = hashlib.sha256(
+    (PROMPT_TEMPLATE + COMPARISON_PROMPT_TEMPLATE + REDUCE_PROMPT_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
+
 # --- UTILITIES (Unchanged) ---
 def _clean_and_parse_json(text: str) -> dict:
     match = re.search(r'```(json)?(.*)```', text, re.DOTALL)
@@ -54,94 +144,641 @@ def _clean_and_parse_json(text: str) -> dict:
     else: json_str = text.strip()
     return json.loads(json_str)
 
-def _format_patents_for_prompt(patents: List[MatchedPatent]) -> str:
+_PROMPT_TOKEN_BUDGETS = {"gemini": config.PROMPT_TOKEN_BUDGET_GEMINI, "together": config.PROMPT_TOKEN_BUDGET_TOGETHER}
+
+def _format_patents_for_prompt(patents: List[MatchedPatent], user_idea: str = "", provider: str = "") -> str:
+    """The prior-art section, packed into what is left of `provider`'s token budget after the template and idea."""
+    if not config.PROMPT_PACKING_ENABLED or provider not in _PROMPT_TOKEN_BUDGETS:
+        return prompt_packer.format_patents(patents)
+    fixed = prompt_packer.count_tokens(PROMPT_TEMPLATE.format(user_idea=user_idea, formatted_patents=""))
+    budget = _PROMPT_TOKEN_BUDGETS[provider] - fixed
+    return prompt_packer.pack(user_idea, patents, budget, config.PROMPT_DEDUP_THRESHOLD, provider).text
+
+def _build_prompt(provider: str, user_idea: str, patents: List[MatchedPatent]) -> str:
+    return PROMPT_TEMPLATE.format(user_idea=user_idea, formatted_patents=_format_patents_for_prompt(patents, user_idea, provider))
+
+def _format_comparisons_for_prompt(comparisons: List[tuple[MatchedPatent, PatentComparison]]) -> str:
     formatted_list = [
-        f"<PATENT>\nPublication Number: {p.publication_number}\nTitle: {p.title}\nAbstract: {p.abstract}\n</PATENT>"
-        for p in patents
+        f"<COMPARISON>\nPublication Number: {p.publication_number}\nTitle: {p.title}\n"
+        f"Novelty Against This Patent: {c.noveltyScore}/10\n"
+        f"Similarities: {'; '.join(c.keySimilarities) or 'none'}\nDifferences: {'; '.join(c.keyDifferences) or 'none'}\n</COMPARISON>"
+        for p, c in comparisons
     ]
     return "\n\n".join(formatted_list)
 
 # --- NEW: POST-PROCESSING QUALITY VALIDATION ---
+class QualityCheckError(ValueError):
+    """An analysis that parsed but is not good enough to show; `reason` labels the failure metric."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
 def _validate_analysis_quality(analysis: HolisticAnalysis):
     """
     Performs semantic checks on the AI's output.
-    Raises ValueError if the quality is too low.
+    Raises QualityCheckError (a ValueError) if the quality is too low.
     """
     if len(analysis.synthesisOfPriorArt.split()) < 15:
-        raise ValueError("AI analysis failed quality check: 'synthesisOfPriorArt' is too short or empty.")
+        raise QualityCheckError("synthesis_too_short", "AI analysis failed quality check: 'synthesisOfPriorArt' is too short or empty.")
     
     if len(analysis.expertRecommendation.split()) < 20:
-        raise ValueError("AI analysis failed quality check: 'expertRecommendation' is too short or empty.")
+        raise QualityCheckError("recommendation_too_short", "AI analysis failed quality check: 'expertRecommendation' is too short or empty.")
         
     # An analysis MUST find some similarities and differences to be useful.
     # If either list is empty, the AI was lazy or couldn't perform the task.
     if not analysis.keySimilarities:
-        raise ValueError("AI analysis failed quality check: 'keySimilarities' list is empty.")
+        raise QualityCheckError("no_similarities", "AI analysis failed quality check: 'keySimilarities' list is empty.")
     
     if not analysis.keyDifferences:
-        raise ValueError("AI analysis failed quality check: 'keyDifferences' list is empty.")
-    
-    print("✅ AI response passed quality validation.")
+        raise QualityCheckError("no_differences", "AI analysis failed quality check: 'keyDifferences' list is empty.")
+
+
+# --- PERSISTENT PROVIDER CLIENTS ---
+# Created once per process so every analysis reuses the same HTTP/gRPC connection pool.
+# Each SDK is imported on a provider's first call, and never for a provider without a key,
+# so importing this module (and starting a worker) stays fast.
+@lru_cache(maxsize=1)
+def _get_gemini_model():
+    import google.generativeai as genai
+    if config.GEMINI_API_ENDPOINT:
+        genai.configure(api_key=config.GOOGLE_API_KEY, transport="rest",
+                        client_options={"api_endpoint": config.GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=config.GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL_NAME, generation_config={"response_mime_type": "application/json"})
+
+@lru_cache(maxsize=1)
+def _get_together_client() -> "AsyncOpenAI":
+    from openai import AsyncOpenAI
+    # No SDK retries: a 429 goes back to the provider scheduler, which pauses Together AI for every caller.
+    return AsyncOpenAI(api_key=config.TOGETHER_API_KEY, base_url=config.TOGETHER_BASE_URL, timeout=45.0, max_retries=0)
+
 
+async def _gemini_generate(prompt: str, stream: bool = False):
+    """
+    The REST transport used with GEMINI_API_ENDPOINT has no async client: its calls are
+    synchronous, so they run on the LLM pool instead of being awaited directly.
+    """
+    model = _get_gemini_model()
+    if not config.GEMINI_API_ENDPOINT:
+        return await model.generate_content_async(prompt, stream=stream)
+    return await llm_pool.run(model.generate_content, prompt, stream=stream)
+
+async def _iterate_gemini_stream(response) -> AsyncIterator:
+    if not config.GEMINI_API_ENDPOINT:
+        async for chunk in response:
+            yield chunk
+        return
+    chunks = iter(response)
+    while (chunk := await llm_pool.run(next, chunks, None)) is not None:
+        yield chunk
 
-# --- AI IMPLEMENTATIONS (Unchanged function signatures) ---
-def _get_gemini_analysis(user_idea: str, patents: List[MatchedPatent]) -> dict:
-    # (Implementation is the same as before, just uses the new prompt)
+
+# --- AI IMPLEMENTATIONS (each takes a finished prompt and returns or streams JSON) ---
+async def _get_gemini_analysis(prompt: str) -> dict:
     if not config.GOOGLE_API_KEY: raise ConnectionRefusedError("Google API Key not configured.")
-    genai.configure(api_key=config.GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash-latest', generation_config={"response_mime_type": "application/json"})
-    prompt = PROMPT_TEMPLATE.format(user_idea=user_idea, formatted_patents=_format_patents_for_prompt(patents))
-    print("-----> Sending new landscape analysis request to Primary AI (Gemini 1.5 Flash)...")
-    response = model.generate_content(prompt)
-    print("<----- Successfully received response from Primary AI.")
+    logger.debug("Sending landscape analysis request to Primary AI (Gemini 1.5 Flash).")
+    response = await _gemini_generate(prompt)
+    logger.debug("Received response from Primary AI.")
+    _record_gemini_usage(response)
     return _clean_and_parse_json(response.text)
 
-def _get_togetherai_analysis(user_idea: str, patents: List[MatchedPatent]) -> dict:
-    # (Implementation is the same as before, just uses the new prompt)
+async def _get_togetherai_analysis(prompt: str) -> dict:
     if not config.TOGETHER_API_KEY: raise ConnectionRefusedError("Together AI API Key not configured.")
-    client = OpenAI(api_key=config.TOGETHER_API_KEY, base_url='https://api.together.xyz/v1', timeout=45.0)
-    prompt = PROMPT_TEMPLATE.format(user_idea=user_idea, formatted_patents=_format_patents_for_prompt(patents))
-    print("-----> Sending new landscape analysis request to Fallback AI (Together AI)...")
-    chat_completion = client.chat.completions.create(messages=[{"role": "user", "content": prompt}], model="mistralai/Mixtral-8x7B-Instruct-v0.1", temperature=0.7, response_format={"type": "json_object"})
-    print("<----- Successfully received response from Fallback AI.")
+    client = _get_together_client()
+    logger.debug("Sending landscape analysis request to Fallback AI (Together AI).")
+    chat_completion = await client.chat.completions.create(messages=[{"role": "user", "content": prompt}], model=TOGETHER_MODEL_NAME, temperature=0.7, response_format={"type": "json_object"})
+    logger.debug("Received response from Fallback AI.")
+    if chat_completion.usage is not None:
+        _record_tokens("together", chat_completion.usage.prompt_tokens, chat_completion.usage.completion_tokens)
     return _clean_and_parse_json(chat_completion.choices[0].message.content)
 
+async def _stream_gemini_analysis(prompt: str) -> AsyncIterator[str]:
+    if not config.GOOGLE_API_KEY: raise ConnectionRefusedError("Google API Key not configured.")
+    logger.debug("Streaming landscape analysis from Primary AI (Gemini 1.5 Flash).")
+    response = await _gemini_generate(prompt, stream=True)
+    last_chunk = None
+    async for chunk in _iterate_gemini_stream(response):
+        last_chunk = chunk
+        if chunk.text:
+            yield chunk.text
+    # Every chunk carries the running usage; the last one has the totals.
+    if last_chunk is not None:
+        _record_gemini_usage(last_chunk)
+
+async def _stream_togetherai_analysis(prompt: str) -> AsyncIterator[str]:
+    if not config.TOGETHER_API_KEY: raise ConnectionRefusedError("Together AI API Key not configured.")
+    client = _get_together_client()
+    logger.debug("Streaming landscape analysis from Fallback AI (Together AI).")
+    stream = await client.chat.completions.create(messages=[{"role": "user", "content": prompt}], model=TOGETHER_MODEL_NAME, temperature=0.7, response_format={"type": "json_object"}, stream=True)
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+# --- PROVIDER METRICS ---
+def _record_tokens(provider: str, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        metrics.LLM_TOKENS.inc(prompt_tokens, provider=provider, direction="prompt")
+    if completion_tokens:
+        metrics.LLM_TOKENS.inc(completion_tokens, provider=provider, direction="completion")
+
+def _record_gemini_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        _record_tokens("gemini", usage.prompt_token_count, usage.candidates_token_count)
+
+def _record_failure(provider: str, error: Exception):
+    """Counts a failed call, separating rejected output (by reason) and rate limits from provider errors."""
+    if isinstance(error, RateLimitedError):
+        metrics.LLM_CALLS.inc(provider=provider, outcome="rate_limited")
+        return
+    if isinstance(error, QualityCheckError):
+        reason = error.reason
+    elif isinstance(error, json.JSONDecodeError):
+        reason = "invalid_json"
+    elif isinstance(error, ValidationError):
+        reason = "schema"
+    else:
+        metrics.LLM_CALLS.inc(provider=provider, outcome="error")
+        return
+    metrics.LLM_CALLS.inc(provider=provider, outcome="quality_failure")
+    metrics.LLM_QUALITY_FAILURES.inc(provider=provider, reason=reason)
+
+
+# --- PER-PROVIDER LATENCY AND WIN-RATE STATS ---
+class ProviderStats:
+    """Tracks how each provider performs so the hedge delay and provider order can be tuned."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.wins = 0
+        self._latencies = deque(maxlen=500)
+
+    def record_success(self, elapsed: float):
+        # Only successful calls feed the latency percentiles used for the hedge delay.
+        self.successes += 1
+        self._latencies.append(elapsed)
+
+    def latency_percentile(self, fraction: float):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(fraction * (len(ordered) - 1))]
+
+    def snapshot(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "wins": self.wins,
+            "win_rate": round(self.wins / self.attempts, 4) if self.attempts else 0.0,
+            "latency_ms_p50": ms(self.latency_percentile(0.50)),
+            "latency_ms_p90": ms(self.latency_percentile(0.90)),
+            "latency_ms_p99": ms(self.latency_percentile(0.99)),
+        }
+
+_PROVIDERS = {
+    "gemini": ("Primary AI (Gemini)", _get_gemini_analysis),
+    "together": ("Fallback AI (Together AI)", _get_togetherai_analysis),
+}
+_STREAMING_PROVIDERS = {
+    "gemini": _stream_gemini_analysis,
+    "together": _stream_togetherai_analysis,
+}
+_provider_stats = {name: ProviderStats(name) for name in _PROVIDERS}
+
+def _rank_providers(providers=_PROVIDERS) -> List[str]:
+    """Provider names, the one that can take a call soonest first (Gemini on a tie)."""
+    return provider_scheduler.rank(list(providers))
+
+async def _admit(provider: str, prompt: str):
+    """Waits for the provider scheduler to admit one call with this prompt."""
+    await provider_scheduler.acquire(provider, provider_scheduler.estimate_tokens(prompt_packer.count_tokens(prompt)))
+
+def _rate_limit_error(provider: str, error: Exception) -> Exception:
+    """`error` as a RateLimitedError if it is a 429, after pausing the provider; otherwise `error` itself."""
+    retry_after = provider_scheduler.observe_error(provider, error)
+    if retry_after is None:
+        return error
+    return RateLimitedError(provider, retry_after)
+
+async def _call_provider(provider: str, prompt: str) -> dict:
+    """One scheduled provider call; a 429 pauses the provider and is raised as RateLimitedError."""
+    await _admit(provider, prompt)
+    try:
+        result = await _PROVIDERS[provider][1](prompt)
+    except Exception as e:
+        error = _rate_limit_error(provider, e)
+        if error is e:
+            raise
+        raise error from e
+    provider_scheduler.record_success(provider)
+    return result
+
+async def _attempt_provider(provider: str, prompt_for: Callable[[str], str]) -> HolisticAnalysis:
+    """
+    One provider call plus schema and quality validation; records latency and outcome.
+    `prompt_for(provider)` builds the prompt, since packing depends on the provider's token budget.
+    """
+    label = _PROVIDERS[provider][0]
+    stats = _provider_stats[provider]
+    stats.attempts += 1
+    started = time.perf_counter()
+    try:
+        with timing.stage("llm"):
+            analysis_dict = await _call_provider(provider, prompt_for(provider))
+        with timing.stage("validation"):
+            analysis = HolisticAnalysis(**analysis_dict)
+            _validate_analysis_quality(analysis) # <-- NEW QUALITY CHECK
+    except asyncio.CancelledError:
+        stats.cancelled += 1
+        metrics.LLM_CALLS.inc(provider=provider, outcome="cancelled")
+        raise
+    except Exception as e:
+        stats.failures += 1
+        _record_failure(provider, e)
+        raise
+    stats.record_success(time.perf_counter() - started)
+    metrics.LLM_CALLS.inc(provider=provider, outcome="success")
+    logger.info("%s succeeded with a high-quality analysis.", label)
+    return analysis
+
+def _hedge_delay(provider: str) -> float:
+    """Seconds to give the primary before also starting the fallback."""
+    if config.LLM_HEDGE_PERCENTILE is None:
+        return config.LLM_HEDGE_DELAY_SECONDS
+    primary = _provider_stats[provider]
+    if primary.successes < config.LLM_HEDGE_MIN_SAMPLES:
+        return config.LLM_HEDGE_DELAY_SECONDS
+    return primary.latency_percentile(config.LLM_HEDGE_PERCENTILE)
+
+def _log_provider_failure(label: str, error: Exception):
+    logger.warning("%s failed: %s - %s", label, type(error).__name__, error)
+
+
+# --- MAP-REDUCE: PER-PATENT COMPARISONS ---
+# Each (idea, patent) comparison is cached on its own, so a follow-up analysis that adds or drops
+# a few patents only pays for the new ones.
+_comparison_cache = LRUTTLCache(config.ANALYSIS_COMPARISON_CACHE_MAX_ITEMS, config.ANALYSIS_CACHE_TTL_SECONDS)
+_comparison_flight = SingleFlight()
+
+def _use_map_reduce(matched_patents: List[MatchedPatent]) -> bool:
+    if config.ANALYSIS_MODE == "auto":
+        return len(matched_patents) >= config.ANALYSIS_MAP_REDUCE_MIN_PATENTS
+    return config.ANALYSIS_MODE == "map_reduce"
+
+def _comparison_cache_key(user_idea: str, patent: MatchedPatent) -> str:
+    providers = f"{GEMINI_MODEL_NAME}|{TOGETHER_MODEL_NAME}"
+    payload = json.dumps([normalize_text(user_idea), patent.publication_number, providers, PROMPT_VERSION])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def _compare_with_fallback(user_idea: str, patent: MatchedPatent) -> PatentComparison:
+    """One comparison from the provider free soonest, or from the other if that call or its JSON fails."""
+    prompt = COMPARISON_PROMPT_TEMPLATE.format(user_idea=user_idea, publication_number=patent.publication_number,
+                                               title=patent.title, abstract=patent.abstract)
+    last_error = None
+    for provider in _rank_providers():
+        try:
+            comparison = PatentComparison(**await _call_provider(provider, prompt))
+        except asyncio.CancelledError:
+            metrics.LLM_CALLS.inc(provider=provider, outcome="cancelled")
+            raise
+        except Exception as e:
+            _record_failure(provider, e)
+            last_error = e
+            continue
+        metrics.LLM_CALLS.inc(provider=provider, outcome="success")
+        return comparison
+    raise last_error
+
+async def _compare_patent(user_idea: str, patent: MatchedPatent) -> PatentComparison:
+    key = _comparison_cache_key(user_idea, patent)
+    cached = _comparison_cache.get(key)
+    if cached is not None:
+        metrics.MAP_COMPARISONS.inc(outcome="cached")
+        return cached
+
+    async def run_comparison():
+        comparison = await _compare_with_fallback(user_idea, patent)
+        _comparison_cache.set(key, comparison)
+        return comparison
+
+    comparison = await _comparison_flight.do(key, run_comparison)
+    metrics.MAP_COMPARISONS.inc(outcome="compared")
+    return comparison
+
+async def _map_comparisons(user_idea: str, matched_patents: List[MatchedPatent]) -> List[tuple[MatchedPatent, PatentComparison]]:
+    """
+    Compares every patent with the idea, at most ANALYSIS_MAP_CONCURRENCY at a time, so the wall
+    time stays close to one comparison until the set outgrows the fan-out. A patent whose
+    comparison fails on both providers is left out; the analysis fails only if all of them do.
+    """
+    semaphore = asyncio.Semaphore(config.ANALYSIS_MAP_CONCURRENCY)
+
+    async def compare(patent: MatchedPatent):
+        async with semaphore:
+            return await _compare_patent(user_idea, patent)
+
+    ordered = sorted(matched_patents, key=lambda p: p.score, reverse=True)
+    with timing.stage("map"):
+        outcomes = await asyncio.gather(*(compare(p) for p in ordered), return_exceptions=True)
+    comparisons = []
+    for patent, outcome in zip(ordered, outcomes):
+        if isinstance(outcome, BaseException):
+            metrics.MAP_COMPARISONS.inc(outcome="failed")
+            logger.warning("Comparison with %s failed: %s - %s", patent.publication_number, type(outcome).__name__, outcome)
+        else:
+            comparisons.append((patent, outcome))
+    if not comparisons:
+        raise Exception("No per-patent comparison succeeded, so there is nothing to synthesize.") from outcomes[0]
+    return comparisons
+
+async def _prompt_builder(user_idea: str, matched_patents: List[MatchedPatent]) -> Callable[[str], str]:
+    """Returns prompt_for(provider) for the analysis call, running the map step first in map-reduce mode."""
+    if not _use_map_reduce(matched_patents):
+        # Packed for every provider up front, so a PromptBudgetError surfaces once, here, instead of
+        # being counted as a provider failure and retried on the fallback.
+        prompts = {provider: _build_prompt(provider, user_idea, matched_patents) for provider in _PROVIDERS}
+        return prompts.__getitem__
+    comparisons = await _map_comparisons(user_idea, matched_patents)
+    prompt = REDUCE_PROMPT_TEMPLATE.format(user_idea=user_idea, formatted_comparisons=_format_comparisons_for_prompt(comparisons))
+    return lambda provider: prompt
+
 
 # --- UPDATED PUBLIC ORCHESTRATOR FUNCTION ---
-def get_holistic_analysis(user_idea: str, matched_patents: List[MatchedPatent]) -> HolisticAnalysis:
+async def get_holistic_analysis(user_idea: str, matched_patents: List[MatchedPatent]) -> HolisticAnalysis:
     """
     Orchestrates the AI landscape analysis with a primary/fallback system
     and now includes a post-processing quality validation step.
+
+    With LLM_HEDGING_ENABLED the fallback is also started once the primary has been running for
+    the hedge delay; the first response that passes validation wins and the other call is cancelled.
+
+    In map-reduce mode (see _use_map_reduce) every patent is first compared with the idea on its
+    own, concurrently, and the single call above then synthesizes those comparisons instead.
+
+    Every call is admitted by provider_scheduler under the providers' rate limits, and the primary
+    is whichever provider can take it soonest. A 429 pauses that provider for everyone; when both
+    providers answer 429 the analysis waits for the first to free up rather than failing outright.
     """
+    prompt_for = await _prompt_builder(user_idea, matched_patents)
+    if config.LLM_HEDGING_ENABLED:
+        return await _get_hedged_analysis(prompt_for)
+
+    # The provider scheduler orders them: Gemini first, unless it is paused or queued behind its rate limits.
+    primary, fallback = _rank_providers()
     try:
-        # --- ATTEMPT 1: PRIMARY AI (GEMINI) ---
-        print("\n--- Attempting Primary AI: Gemini ---")
-        analysis_dict = _get_gemini_analysis(user_idea, matched_patents)
-        analysis = HolisticAnalysis(**analysis_dict)
-        _validate_analysis_quality(analysis) # <-- NEW QUALITY CHECK
-        print("✅ Primary AI (Gemini) Succeeded with High Quality.")
+        # --- ATTEMPT 1: PRIMARY AI ---
+        analysis = await _attempt_provider(primary, prompt_for)
+        _provider_stats[primary].wins += 1
         return analysis
 
-    except Exception as gemini_error:
-        # --- PRIMARY AI FAILED (API Error, JSON Error, OR Quality Error) ---
-        print("\n" + "!"*25 + " PRIMARY AI FAILED " + "!"*25)
-        print(f"Reason: {type(gemini_error).__name__} - {gemini_error}")
-        print("Attempting fallback...")
-        print("!"*70 + "\n")
-        
+    except Exception as primary_error:
+        # --- PRIMARY AI FAILED (API Error, Rate Limit, JSON Error, OR Quality Error) ---
+        _log_provider_failure(_PROVIDERS[primary][0], primary_error)
+        metrics.LLM_FALLBACKS.inc(mode="sequential")
+
         try:
-            # --- ATTEMPT 2: FALLBACK AI (TOGETHER AI) ---
-            print("\n--- Attempting Fallback AI: Together AI ---")
-            analysis_dict = _get_togetherai_analysis(user_idea, matched_patents)
-            analysis = HolisticAnalysis(**analysis_dict)
-            _validate_analysis_quality(analysis) # <-- NEW QUALITY CHECK
-            print("✅ Fallback AI (Together AI) Succeeded with High Quality.")
+            # --- ATTEMPT 2: FALLBACK AI ---
+            logger.info("Attempting %s.", _PROVIDERS[fallback][0])
+            analysis = await _attempt_provider(fallback, prompt_for)
+            _provider_stats[fallback].wins += 1
             return analysis
-            
+
         except Exception as fallback_error:
+            if isinstance(primary_error, RateLimitedError) and isinstance(fallback_error, RateLimitedError):
+                # --- BOTH RATE LIMITED: WAIT FOR WHICHEVER FREES UP FIRST ---
+                return await _retry_rate_limited(prompt_for, fallback_error)
             # --- FALLBACK AI ALSO FAILED ---
-            print("\n" + "="*25 + " FALLBACK AI FAILED " + "="*25)
-            print(f"Reason: {type(fallback_error).__name__} - {fallback_error}")
-            traceback.print_exc()
-            print("="*70 + "\n")
-            raise Exception("Both primary and fallback AIs failed to produce a quality analysis.") from fallback_error
\ No newline at end of file
+            logger.error("Fallback AI failed: %s - %s", type(fallback_error).__name__, fallback_error,
+                         exc_info=fallback_error)
+            raise Exception("Both primary and fallback AIs failed to produce a quality analysis.") from fallback_error
+
+async def _retry_rate_limited(prompt_for: Callable[[str], str], last_error: RateLimitedError) -> HolisticAnalysis:
+    """
+    Up to LLM_RATE_LIMIT_RETRIES more attempts on whichever provider's pause ends first; each waits
+    in the scheduler's queue for at most LLM_SCHEDULER_MAX_WAIT_SECONDS. Raises PoolSaturatedError,
+    which the API answers with 503 + Retry-After, if the providers stay rate limited.
+    """
+    for _ in range(config.LLM_RATE_LIMIT_RETRIES):
+        provider = _rank_providers()[0]
+        logger.info("Both providers are rate limited; retrying on %s.", _PROVIDERS[provider][0])
+        try:
+            analysis = await _attempt_provider(provider, prompt_for)
+        except RateLimitedError as e:
+            last_error = e
+            continue
+        except Exception as e:
+            raise Exception("Both primary and fallback AIs failed to produce a quality analysis.") from e
+        _provider_stats[provider].wins += 1
+        return analysis
+    retry_after = max(1, math.ceil(provider_scheduler.shortest_wait()))
+    raise PoolSaturatedError("LLM provider rate limit", retry_after) from last_error
+
+async def _get_hedged_analysis(prompt_for: Callable[[str], str]) -> HolisticAnalysis:
+    primary, fallback = _rank_providers()
+    tasks = {asyncio.ensure_future(_attempt_provider(primary, prompt_for)): primary}
+    fallback_started = False
+    errors = []
+    try:
+        while tasks:
+            timeout = None if fallback_started else _hedge_delay(primary)
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = tasks.pop(task)
+                if task.exception() is None:
+                    _provider_stats[provider].wins += 1
+                    return task.result()
+                errors.append(task.exception())
+                _log_provider_failure(_PROVIDERS[provider][0], errors[-1])
+            if not fallback_started:
+                # Either the primary failed outright or it is slower than the hedge budget.
+                logger.info("Starting %s (hedged).", _PROVIDERS[fallback][0])
+                metrics.LLM_FALLBACKS.inc(mode="hedged")
+                tasks[asyncio.ensure_future(_attempt_provider(fallback, prompt_for))] = fallback
+                fallback_started = True
+    finally:
+        for task in tasks:
+            task.cancel()
+    if all(isinstance(error, RateLimitedError) for error in errors):
+        # --- BOTH RATE LIMITED: WAIT FOR WHICHEVER FREES UP FIRST ---
+        return await _retry_rate_limited(prompt_for, errors[-1])
+    raise Exception("Both primary and fallback AIs failed to produce a quality analysis.") from errors[-1]
+
+def get_provider_stats() -> dict:
+    return {name: stats.snapshot() for name, stats in _provider_stats.items()}
+
+
+# --- CACHED, SINGLE-FLIGHT ENTRY POINT FOR THE API ---
+_analysis_cache = LRUTTLCache(config.ANALYSIS_CACHE_MAX_ITEMS, config.ANALYSIS_CACHE_TTL_SECONDS)
+_analysis_flight = SingleFlight()
+
+def analysis_cache_key(user_idea: str, matched_patents: List[MatchedPatent]) -> str:
+    publication_numbers = sorted({p.publication_number for p in matched_patents})
+    providers = f"{GEMINI_MODEL_NAME}|{TOGETHER_MODEL_NAME}"
+    mode = "map_reduce" if _use_map_reduce(matched_patents) else "single"
+    payload = json.dumps([normalize_text(user_idea), publication_numbers, providers, PROMPT_VERSION, mode])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def analyze_landscape(user_idea: str, matched_patents: List[MatchedPatent]) -> HolisticAnalysis:
+    """
+    Returns a cached analysis when the same idea was analysed against the same patents recently.
+    Otherwise runs get_holistic_analysis once, within the LLM concurrency limit, sharing that single
+    call with any identical requests that arrive while it is in flight. Only validated analyses are cached.
+    """
+    key = analysis_cache_key(user_idea, matched_patents)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def run_analysis():
+        async with llm_limiter.slot():
+            analysis = await get_holistic_analysis(user_idea=user_idea, matched_patents=matched_patents)
+        _analysis_cache.set(key, analysis)
+        return analysis
+
+    return await _analysis_flight.do(key, run_analysis)
+
+def get_analysis_cache_stats() -> dict:
+    return {**_analysis_cache.stats(), "coalesced": _analysis_flight.coalesced, "in_flight": _analysis_flight.in_flight()}
+
+def get_comparison_cache_stats() -> dict:
+    return {**_comparison_cache.stats(), "coalesced": _comparison_flight.coalesced, "in_flight": _comparison_flight.in_flight()}
+
+metrics.Gauge(
+    "patent_checker_analysis_cache", "Landscape analysis cache items, hits, misses and coalesced calls.",
+    lambda: {(stat,): value for stat, value in get_analysis_cache_stats().items() if stat != "hit_rate"},
+    ("stat",),
+)
+
+
+
+# --- STREAMING ORCHESTRATOR (SERVER-SENT EVENTS) ---
+_LIST_FIELDS = ("keySimilarities", "keyDifferences")
+
+def _stream_event(parsed: tuple):
+    """Turns an IncrementalJSONParser event into an (event, data) pair, or None to skip it."""
+    if parsed[0] == "item":
+        _, field, index, value = parsed
+        if field not in _LIST_FIELDS:
+            return None
+        try:
+            point = PointOfAnalysis(**value)
+        except Exception:
+            # A malformed point is left to the final validation of the full analysis.
+            return None
+        return "item", {"field": field, "index": index, "value": point.model_dump()}
+    _, field, value = parsed
+    if field not in HolisticAnalysis.model_fields:
+        return None
+    return "field", {"field": field, "value": value}
+
+def _analysis_events(analysis: HolisticAnalysis):
+    for field in HolisticAnalysis.model_fields:
+        value = getattr(analysis, field)
+        if field in _LIST_FIELDS:
+            for index, point in enumerate(value):
+                yield "item", {"field": field, "index": index, "value": point.model_dump()}
+        else:
+            yield "field", {"field": field, "value": value}
+
+async def stream_holistic_analysis(user_idea: str, matched_patents: List[MatchedPatent]) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Streaming counterpart of analyze_landscape. Yields (event, data) pairs as the provider generates:
+      map       {"patents"}                   map-reduce mode: the patents are being compared one by one first
+      provider  {"provider"}                  a provider has started generating
+      field     {"field", "value"}            a scalar field of HolisticAnalysis is complete
+      item      {"field", "index", "value"}   one PointOfAnalysis in keySimilarities/keyDifferences is complete
+      retry     {"provider", "reason"}        the previous provider failed; discard the partial fields
+      done      the full HolisticAnalysis, sent only after _validate_analysis_quality passes
+      error     {"detail"[, "retry_after"]}   both providers (or every per-patent comparison) failed;
+                                              retry_after (seconds) when they stayed rate limited
+    """
+    key = analysis_cache_key(user_idea, matched_patents)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        for event in _analysis_events(cached):
+            yield event
+        yield "done", cached.model_dump()
+        return
+
+    last_error = None
+    errors = []
+    rate_limit_retries = 0
+    async with llm_limiter.slot():
+        if _use_map_reduce(matched_patents):
+            yield "map", {"patents": len(matched_patents)}
+        try:
+            prompt_for = await _prompt_builder(user_idea, matched_patents)
+        except Exception as e:
+            yield "error", {"detail": str(e)}
+            return
+        providers = _rank_providers(_STREAMING_PROVIDERS)
+        while providers:
+            provider = providers.pop(0)
+            label, stream = _PROVIDERS[provider][0], _STREAMING_PROVIDERS[provider]
+            if last_error is None:
+                yield "provider", {"provider": provider}
+            else:
+                metrics.LLM_FALLBACKS.inc(mode="streaming")
+                yield "retry", {"provider": provider, "reason": f"{type(last_error).__name__}: {last_error}"}
+
+            stats = _provider_stats[provider]
+            stats.attempts += 1
+            started = time.perf_counter()
+            parser = IncrementalJSONParser()
+            chunks = []
+            try:
+                prompt = prompt_for(provider)
+                await _admit(provider, prompt)
+                async for chunk in stream(prompt):
+                    chunks.append(chunk)
+                    for parsed in parser.feed(chunk):
+                        event = _stream_event(parsed)
+                        if event is not None:
+                            yield event
+                analysis = HolisticAnalysis(**_clean_and_parse_json("".join(chunks)))
+                _validate_analysis_quality(analysis)
+            except (asyncio.CancelledError, GeneratorExit):
+                stats.cancelled += 1
+                metrics.LLM_CALLS.inc(provider=provider, outcome="cancelled")
+                raise
+            except Exception as e:
+                e = _rate_limit_error(provider, e)
+                stats.failures += 1
+                _record_failure(provider, e)
+                last_error = e
+                errors.append(e)
+                _log_provider_failure(label, e)
+                if not providers and all(isinstance(error, RateLimitedError) for error in errors) \
+                        and rate_limit_retries < config.LLM_RATE_LIMIT_RETRIES:
+                    # --- ALL RATE LIMITED: RETRY ON WHICHEVER FREES UP FIRST (as _retry_rate_limited does) ---
+                    rate_limit_retries += 1
+                    providers = _rank_providers(_STREAMING_PROVIDERS)[:1]
+                    logger.info("Both providers are rate limited; retrying on %s.", _PROVIDERS[providers[0]][0])
+                continue
+
+            provider_scheduler.record_success(provider)
+            stats.record_success(time.perf_counter() - started)
+            stats.wins += 1
+            metrics.LLM_CALLS.inc(provider=provider, outcome="success")
+            logger.info("%s succeeded with a high-quality analysis (streamed).", label)
+            _analysis_cache.set(key, analysis)
+            yield "done", analysis.model_dump()
+            return
+
+    if errors and all(isinstance(error, RateLimitedError) for error in errors):
+        retry_after = max(1, math.ceil(provider_scheduler.shortest_wait()))
+        error = PoolSaturatedError("LLM provider rate limit", retry_after)
+        yield "error", {"detail": str(error), "retry_after": retry_after}
+        return
+    yield "error", {"detail": "Both primary and fallback AIs failed to produce a quality analysis."}
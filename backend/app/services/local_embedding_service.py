@@ -1,13 +1,99 @@
-from sentence_transformers import SentenceTransformer
+import logging
+import threading
 from functools import lru_cache
+from ..core import config
+from ..core.executors import embedding_pool
+from ..shared import cache_key, load_model
+from . import embedding_client
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import get_embedding_cache
+
+# model.encode sorts texts by length and runs them through the model this many at a time,
+# so a large batch is padded per chunk rather than to its single longest text.
+ENCODE_CHUNK_SIZE = 64
+# int8 vectors are cached apart from the float ones (see cache_key).
+CACHE_KEY = cache_key(config.EMBEDDING_BACKEND)
+
+logger = logging.getLogger(__name__)
+
+# The startup warm-up and early requests may ask for the model at the same time; the lock
+# makes them share one load instead of each loading a copy.
+_model_lock = threading.Lock()
+
+# Where encodes run: the node's embedding server when EMBEDDING_SERVER_SOCKET is set, else this
+# process's own model. The server process itself always uses its own (see use_local_model).
+_use_server = bool(config.EMBEDDING_SERVER_SOCKET)
 
 @lru_cache(maxsize=1)
-def get_embedding_model():
-    print("Loading local AI model for vector search embeddings...")
-    model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-    print("Local AI model loaded.")
+def _load_embedding_model():
+    logger.info("Loading local AI model for vector search embeddings (%s backend, %d threads)...",
+                config.EMBEDDING_BACKEND, config.EMBEDDING_THREADS)
+    model = load_model(config.EMBEDDING_BACKEND, config.EMBEDDING_THREADS, config.EMBEDDING_ONNX_QUANTIZATION)
+    logger.info("Local AI model loaded.")
     return model
 
+def get_embedding_model():
+    with _model_lock:
+        return _load_embedding_model()
+
+def use_local_model():
+    """Encodes with this process's own model even when EMBEDDING_SERVER_SOCKET is set."""
+    global _use_server
+    _use_server = False
+
+def warm_up():
+    """
+    Loads the model and runs one throwaway encode, so the first request meets a warm model. With
+    an embedding server, waits for it to answer instead (it may start after the workers).
+    """
+    if _use_server:
+        embedding_client.get_client().wait_until_ready(config.EMBEDDING_SERVER_TIMEOUT_SECONDS)
+        return
+    get_embedding_model().encode(["warm-up"], batch_size=1)
+
+def _encode(texts: list[str]):
+    if _use_server:
+        return embedding_client.get_client().encode(texts)
+    return get_embedding_model().encode(texts, batch_size=min(len(texts), ENCODE_CHUNK_SIZE))
+
 def create_embedding(text: str) -> list[float]:
-    model = get_embedding_model()
-    return model.encode(text).tolist()
\ No newline at end of file
+    return create_embeddings([text])[0]
+
+def create_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Encodes several texts in one model.encode call; far cheaper per text than calling create_embedding in a loop.
+    Texts already in the embedding cache, and repeats within `texts`, are not re-encoded.
+    """
+    cache = get_embedding_cache()
+    vectors = cache.get_many(CACHE_KEY, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        encoded = _encode(missing_texts).tolist()
+        by_text = dict(zip(missing_texts, encoded))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+        cache.put_many(CACHE_KEY, missing_texts, encoded)
+    return vectors
+
+@lru_cache(maxsize=1)
+def get_batcher() -> EmbeddingBatcher:
+    return EmbeddingBatcher(
+        create_embeddings,
+        executor=embedding_pool,
+        max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=config.EMBEDDING_BATCH_WAIT_MS,
+        max_pending=config.EMBEDDING_QUEUE_LIMIT,
+    )
+
+async def create_embedding_async(text: str) -> list[float]:
+    """Embeds one text from an async handler; concurrent calls are micro-batched into a single encode."""
+    # Memory hits are answered on the loop; the disk tier is checked on the embedding pool.
+    cached = get_embedding_cache().get_from_memory(CACHE_KEY, text)
+    if cached is not None:
+        return cached
+    return await get_batcher().embed(text)
+
+async def create_embeddings_async(texts: list[str]) -> list[list[float]]:
+    """Embeds a whole list in one vectorized encode on the embedding pool, bypassing the micro-batcher."""
+    return await embedding_pool.run(create_embeddings, texts)
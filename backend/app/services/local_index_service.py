@@ -0,0 +1,200 @@
+import json
+import logging
+import mmap
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from ..core import config
+from . import quantization
+from .search_filters import FilterColumns
+
+logger = logging.getLogger(__name__)
+
+# Rows are scored in blocks so float16 indexes never get upcast all at once.
+_SCORE_BLOCK_ROWS = 65536
+
+
+class LocalVectorIndex:
+    """
+    An in-process replacement for Atlas $vectorSearch.
+
+    The index directory is written by data_ingestion/build_local_index.py and holds:
+      - embeddings.npy        L2-normalised float32/float16 matrix, memory-mapped read-only
+      - metadata.jsonl        one {publication_number, title, abstract} object per row
+      - metadata_offsets.npy  byte offset of every metadata row (count + 1 entries)
+      - hnsw.bin              optional HNSW graph for large corpora (requires hnswlib)
+      - embeddings_int8.npy   optional int8 codes, with per-row scales in int8_scales.npy
+      - embeddings_bits.npy   optional packed sign bits
+      - filter_*.npy, filters.json  publication date, country and CPC columns for filtered search
+
+    With VECTOR_QUANTIZATION set, the exact scan runs over the quantized codes (which stay
+    resident) and only the oversampled candidates are read back from embeddings.npy for
+    rescoring, so the full-precision matrix can stay on disk.
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "metadata_offsets.npy"))
+        self._metadata_file = open(os.path.join(index_dir, "metadata.jsonl"), "rb")
+        self._metadata = mmap.mmap(self._metadata_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.graph = self._load_graph(os.path.join(index_dir, "hnsw.bin"))
+        # hnswlib's search breadth is set on the graph, not per query.
+        self._graph_lock = threading.Lock()
+        self.codes, self.scales = self._load_codes(index_dir, config.VECTOR_QUANTIZATION)
+        self.filters = FilterColumns(index_dir, len(self))
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def _load_graph(self, path: str):
+        if not os.path.exists(path):
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib is not installed; using exact search over the local index.")
+            return None
+        graph = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+        graph.load_index(path, max_elements=len(self))
+        graph.set_ef(max(config.LOCAL_INDEX_EF_SEARCH, 1))
+        return graph
+
+    def _load_codes(self, index_dir: str, mode: str):
+        if mode == "none":
+            return None, None
+        name = "embeddings_int8.npy" if mode == "int8" else "embeddings_bits.npy"
+        if not os.path.exists(os.path.join(index_dir, name)):
+            logger.warning("Local index has no %s codes (rebuild with --quantize %s); using full-precision search.", mode, mode)
+            return None, None
+        codes = np.load(os.path.join(index_dir, name))
+        scales = np.load(os.path.join(index_dir, "int8_scales.npy")) if mode == "int8" else None
+        return codes, scales
+
+    def metadata(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._metadata[start:end])
+
+    def _exact_scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Scores of every row, or of `rows` (ascending) only."""
+        if rows is None and self.embeddings.dtype == np.float32:
+            return self.embeddings @ query
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _SCORE_BLOCK_ROWS):
+            block = self.embeddings[start:start + _SCORE_BLOCK_ROWS] if rows is None \
+                else self.embeddings[rows[start:start + _SCORE_BLOCK_ROWS]]
+            scores[start:start + len(block)] = np.asarray(block, dtype=np.float32) @ query
+        return scores
+
+    def _candidate_rows(self, query: np.ndarray, count: int, rows: np.ndarray = None) -> np.ndarray:
+        """Rows of the `count` best matches by the quantized codes (among `rows`, if given), in no particular order."""
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.scales is not None:
+            scales = self.scales if rows is None else self.scales[rows]
+            scores = np.empty(len(codes), dtype=np.float32)
+            for start in range(0, len(codes), _SCORE_BLOCK_ROWS):
+                block = codes[start:start + _SCORE_BLOCK_ROWS]
+                scores[start:start + len(block)] = (block @ query) * scales[start:start + len(block)]
+        else:
+            scores = -quantization.hamming_distances(codes, quantization.binarize(query)[0])
+        picked = np.arange(len(codes)) if count >= len(codes) else np.argpartition(-scores, count - 1)[:count]
+        return picked if rows is None else rows[picked]
+
+    def _graph_query(self, query: np.ndarray, k: int, num_candidates: int = None, allowed: np.ndarray = None):
+        """HNSW search; with an `allowed` row mask, other rows are skipped during the walk."""
+        # hnswlib takes `filter` from 0.7 on; unfiltered searches leave it out.
+        kwargs = {} if allowed is None else {"filter": lambda label: bool(allowed[label])}
+        if num_candidates is None:
+            return self.graph.knn_query(query, k=k, **kwargs)
+        with self._graph_lock:
+            self.graph.set_ef(max(num_candidates, k))
+            try:
+                return self.graph.knn_query(query, k=k, **kwargs)
+            finally:
+                self.graph.set_ef(max(config.LOCAL_INDEX_EF_SEARCH, 1))
+
+    def top_k(self, query_embedding: list[float], k: int, num_candidates: int = None,
+              rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (rows, cosine similarities) of the k nearest rows, best first. `num_candidates` is the
+        local counterpart of Atlas' numCandidates: the HNSW search breadth (ef), or how many quantized
+        matches are rescored; exact search ignores it.
+        With `rows` (ascending, from FilterColumns.rows) only those rows are searched: scanned when
+        there are at most LOCAL_INDEX_EXACT_FILTER_ROWS of them, else by a filtered graph walk.
+        """
+        k = min(k, len(self) if rows is None else len(rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        if self.graph is not None and (rows is None or len(rows) > config.LOCAL_INDEX_EXACT_FILTER_ROWS):
+            allowed = None
+            if rows is not None:
+                allowed = np.zeros(len(self), dtype=bool)
+                allowed[rows] = True
+            labels, distances = self._graph_query(query, k, num_candidates, allowed)
+            # hnswlib's inner-product distance is 1 - dot.
+            return labels[0].astype(np.int64), 1.0 - distances[0]
+
+        if self.codes is not None:
+            # Sorted rows keep the reads from the memory-mapped full matrix sequential.
+            count = max(num_candidates, k) if num_candidates is not None else k * config.VECTOR_RESCORE_FACTOR
+            candidates = np.sort(self._candidate_rows(query, count, rows))
+            scores = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+            order = np.argsort(-scores)[:k]
+            return candidates[order], scores[order]
+
+        scores = self._exact_scores(query, rows)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return (best if rows is None else rows[best]), scores[best]
+
+
+@lru_cache(maxsize=1)
+def get_index() -> LocalVectorIndex:
+    logger.info("Loading local vector index from '%s'...", config.LOCAL_INDEX_DIR)
+    index = LocalVectorIndex(config.LOCAL_INDEX_DIR)
+    if index.graph is not None:
+        mode = "HNSW"
+    elif index.codes is not None:
+        mode = f"{config.VECTOR_QUANTIZATION} + rescoring"
+    else:
+        mode = "exact"
+    logger.info("Local vector index loaded: %d patents, %s search.", len(index), mode)
+    return index
+
+
+def vector_search(query_embedding: list[float], num_results: int, limit: int, min_score: float,
+                  num_candidates: int = None, filters=None) -> list[dict]:
+    """
+    Mirrors the Atlas pipeline: take the `limit` neighbours matching `filters` (a SearchFilters),
+    apply the score threshold, keep `num_results`.
+    """
+    index = get_index()
+    rows, similarities = index.top_k(query_embedding, limit, num_candidates, index.filters.rows(filters))
+    results = []
+    for row, similarity in zip(rows, similarities):
+        # Atlas reports cosine similarity normalised to [0, 1]; keep the same scale.
+        score = min(1.0, (1.0 + float(similarity)) / 2.0)
+        if score < min_score:
+            continue
+        patent = index.metadata(int(row))
+        results.append({
+            "publication_number": patent.get("publication_number"),
+            "title": patent.get("title"),
+            "abstract": patent.get("abstract"),
+            "score": score,
+            "cluster_id": patent.get("cluster_id"),
+            "family_members": patent.get("family_members", []),
+        })
+        if len(results) >= num_results:
+            break
+    return results
@@ -1,30 +1,216 @@
-from pymongo import MongoClient
+import logging
+from functools import lru_cache
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo import AsyncMongoClient, MongoClient
 from ..core import config
+from ..core.executors import search_pool
+from . import local_index_service, quantization
+from .search_filters import atlas_filter
 
-# Set a reasonable score threshold to filter out truly irrelevant results
-MINIMUM_RELEVANCE_SCORE = 0.5 
+# Set a reasonable score threshold to filter out truly irrelevant results (VECTOR_SEARCH_MIN_SCORE)
+MINIMUM_RELEVANCE_SCORE = config.VECTOR_SEARCH_MIN_SCORE
 
-def vector_search(query_embedding: list[float], num_results: int = 5) -> list[dict]:
-    """Performs vector search and filters out results below the relevance threshold."""
-    client = MongoClient(config.MONGO_URI)
-    collection = client[config.MONGO_DB_NAME]["patents"]
-    
-    pipeline = [
-        {
+logger = logging.getLogger(__name__)
+
+def _client_options() -> dict:
+    return {
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+    }
+
+# --- PROCESS-WIDE CLIENTS ---
+# Both clients are created once and reuse their connection pools for every request.
+# connect()/close() are called from the app lifespan in main.py.
+@lru_cache(maxsize=1)
+def get_client() -> MongoClient:
+    return MongoClient(config.MONGO_URI, **_client_options())
+
+@lru_cache(maxsize=1)
+def get_async_client() -> AsyncMongoClient:
+    return AsyncMongoClient(config.MONGO_URI, **_client_options())
+
+async def connect():
+    """Opens the async pool at startup so the first search does not pay for discovery and TLS."""
+    if config.VECTOR_BACKEND != "atlas":
+        return
+    await get_async_client().admin.command("ping")
+    logger.info("MongoDB connection pool ready.")
+
+async def close():
+    if get_async_client.cache_info().currsize:
+        await get_async_client().close()
+        get_async_client.cache_clear()
+    if get_client.cache_info().currsize:
+        get_client().close()
+        get_client.cache_clear()
+
+def num_candidates_for(limit: int, num_candidates: int = None) -> int:
+    """The ANN candidate count: as requested, else VECTOR_SEARCH_NUM_CANDIDATES, else max(150, 15 * limit)."""
+    num_candidates = num_candidates or config.VECTOR_SEARCH_NUM_CANDIDATES or max(150, 15 * limit)
+    return min(max(num_candidates, limit), config.VECTOR_SEARCH_MAX_CANDIDATES)
+
+def _with_filter(stage: dict, filters) -> dict:
+    # A pre-filter: Atlas only considers matching documents as candidates, instead of dropping
+    # non-matching neighbours afterwards.
+    search_filter = atlas_filter(filters)
+    if search_filter is not None:
+        stage["$vectorSearch"]["filter"] = search_filter
+    return stage
+
+def _build_pipeline(query_embedding: list[float], num_results: int, limit: int = 10,
+                    min_score: float = MINIMUM_RELEVANCE_SCORE, num_candidates: int = None, filters=None) -> list[dict]:
+    return [
+        _with_filter({
             "$vectorSearch": {
                 # --- THE DEFINITIVE FIX: Use the correct index name ---
-                "index": "vector_index", 
+                "index": "vector_index",
                 "path": "embedding",
                 "queryVector": query_embedding,
-                "numCandidates": 150,
-                "limit": 10
+                "numCandidates": num_candidates_for(limit, num_candidates),
+                "limit": limit
             }
-        },
+        }, filters),
         {"$addFields": { "score": { "$meta": "vectorSearchScore" }}},
-        {"$match": { "score": { "$gte": MINIMUM_RELEVANCE_SCORE }}},
+        {"$match": { "score": { "$gte": min_score }}},
         {"$limit": num_results},
-        {"$project": { "_id": 0, "publication_number": 1, "title": 1, "abstract": 1, "score": 1 }}
+        {"$project": { "_id": 0, "publication_number": 1, "title": 1, "abstract": 1, "score": 1,
+                       "cluster_id": 1, "family_members": 1 }}
+    ]
+
+# --- QUANTIZED SEARCH ---
+# Atlas searches the compact codes, then the candidates are rescored here against the full
+# query vector, using the stored float vector when present and the dequantized int8 otherwise.
+_QUANTIZED_PATHS = {"int8": "embedding_int8", "binary": "embedding_bits"}
+
+def _quantized_query_vector(query_embedding: list[float]) -> Binary:
+    if config.VECTOR_QUANTIZATION == "int8":
+        codes, _ = quantization.quantize_int8(query_embedding)
+        return Binary.from_vector(codes[0].tolist(), BinaryVectorDtype.INT8)
+    return Binary.from_vector(quantization.binarize(query_embedding)[0].tolist(), BinaryVectorDtype.PACKED_BIT)
+
+def _build_quantized_pipeline(query_embedding: list[float], limit: int = 10, num_candidates: int = None,
+                              filters=None) -> list[dict]:
+    factor = config.VECTOR_RESCORE_FACTOR
+    return [
+        _with_filter({
+            "$vectorSearch": {
+                "index": config.VECTOR_QUANTIZED_INDEX,
+                "path": _QUANTIZED_PATHS[config.VECTOR_QUANTIZATION],
+                "queryVector": _quantized_query_vector(query_embedding),
+                "numCandidates": min(num_candidates_for(limit, num_candidates) * factor, config.VECTOR_SEARCH_MAX_CANDIDATES),
+                "limit": limit * factor
+            }
+        }, filters),
+        {"$project": {
+            "_id": 0, "publication_number": 1, "title": 1, "abstract": 1, "cluster_id": 1, "family_members": 1,
+            "embedding": 1, "embedding_int8": 1, "embedding_scale": 1
+        }}
     ]
-    results = list(collection.aggregate(pipeline))
-    client.close()
-    return results
\ No newline at end of file
+
+def _full_precision_vector(document: dict):
+    if document.get("embedding") is not None:
+        return document["embedding"]
+    if document.get("embedding_int8") is not None:
+        codes = document["embedding_int8"].as_vector().data
+        return quantization.dequantize_int8(codes, document.get("embedding_scale", 1.0))
+    return None
+
+def _rescore(query_embedding: list[float], candidates: list[dict], num_results: int, limit: int = 10,
+             min_score: float = MINIMUM_RELEVANCE_SCORE) -> list[dict]:
+    candidates = [(doc, vector) for doc in candidates if (vector := _full_precision_vector(doc)) is not None]
+    if not candidates:
+        return []
+    vectors = np.stack([np.asarray(vector, dtype=np.float32) for _, vector in candidates])
+    similarities = quantization.cosine_similarities(query_embedding, vectors)
+    results = []
+    for i in np.argsort(-similarities)[:limit]:
+        # Same [0, 1] scale as Atlas' cosine vectorSearchScore.
+        score = min(1.0, (1.0 + float(similarities[i])) / 2.0)
+        if score < min_score:
+            break
+        doc = candidates[i][0]
+        results.append({
+            "publication_number": doc.get("publication_number"),
+            "title": doc.get("title"),
+            "abstract": doc.get("abstract"),
+            "score": score,
+            "cluster_id": doc.get("cluster_id"),
+            "family_members": doc.get("family_members", []),
+        })
+        if len(results) >= num_results:
+            break
+    return results
+
+def collapse_clusters(results: list[dict], num_results: int) -> list[dict]:
+    """
+    Keeps the best-scoring patent of each near-duplicate cluster, up to `num_results`; the others
+    join its family_members. `results` must be best first. Patents without a cluster_id stand alone.
+    """
+    kept = {}
+    for result in results:
+        cluster = result.pop("cluster_id", None) or result["publication_number"]
+        if cluster not in kept:
+            if len(kept) < num_results:
+                kept[cluster] = result
+            continue
+        members = kept[cluster].setdefault("family_members", [])
+        if result["publication_number"] not in members:
+            members.append(result["publication_number"])
+    return list(kept.values())
+
+def _fetch_count(num_results: int, limit: int) -> int:
+    # Collapsing may drop results, so all `limit` neighbours are kept for it to choose from.
+    return limit if config.VECTOR_SEARCH_COLLAPSE_CLUSTERS else num_results
+
+def _collapse(results: list[dict], num_results: int) -> list[dict]:
+    return collapse_clusters(results, num_results) if config.VECTOR_SEARCH_COLLAPSE_CLUSTERS else results
+
+def _local_search(query_embedding: list[float], num_results: int, limit: int, min_score: float,
+                  num_candidates: int = None, filters=None) -> list[dict]:
+    # Without a requested or configured count the local index keeps its own (LOCAL_INDEX_EF_SEARCH, VECTOR_RESCORE_FACTOR).
+    results = local_index_service.vector_search(query_embedding, num_results=_fetch_count(num_results, limit), limit=limit,
+                                                min_score=min_score,
+                                                num_candidates=num_candidates or config.VECTOR_SEARCH_NUM_CANDIDATES or None,
+                                                filters=filters)
+    return _collapse(results, num_results)
+
+def vector_search(query_embedding: list[float], num_results: int = config.VECTOR_SEARCH_NUM_RESULTS,
+                  limit: int = config.VECTOR_SEARCH_LIMIT, min_score: float = MINIMUM_RELEVANCE_SCORE,
+                  num_candidates: int = None, filters=None) -> list[dict]:
+    """
+    Performs vector search and filters out results below the relevance threshold.
+    `limit` nearest neighbours, out of `num_candidates` considered (see num_candidates_for), are
+    fetched before the threshold and `num_results` cut apply, and near-duplicate clusters are
+    collapsed (VECTOR_SEARCH_COLLAPSE_CLUSTERS). `filters` (a SearchFilters) restricts the
+    search to matching patents before the neighbours are found.
+    """
+    if config.VECTOR_BACKEND == "local":
+        return _local_search(query_embedding, num_results, limit, min_score, num_candidates, filters)
+
+    collection = get_client()[config.MONGO_DB_NAME]["patents"]
+    if config.VECTOR_QUANTIZATION != "none":
+        candidates = list(collection.aggregate(_build_quantized_pipeline(query_embedding, limit, num_candidates, filters)))
+        return _collapse(_rescore(query_embedding, candidates, _fetch_count(num_results, limit), limit, min_score), num_results)
+    pipeline = _build_pipeline(query_embedding, _fetch_count(num_results, limit), limit, min_score, num_candidates, filters)
+    return _collapse(list(collection.aggregate(pipeline)), num_results)
+
+async def vector_search_async(query_embedding: list[float], num_results: int = config.VECTOR_SEARCH_NUM_RESULTS,
+                              limit: int = config.VECTOR_SEARCH_LIMIT, min_score: float = MINIMUM_RELEVANCE_SCORE,
+                              num_candidates: int = None, filters=None) -> list[dict]:
+    """
+    Same as vector_search, without blocking the event loop: Atlas is awaited, and the local index,
+    whose exact and filtered scans grow with the corpus, is searched on the search pool.
+    """
+    if config.VECTOR_BACKEND == "local":
+        return await search_pool.run(_local_search, query_embedding, num_results, limit, min_score, num_candidates, filters)
+
+    collection = get_async_client()[config.MONGO_DB_NAME]["patents"]
+    if config.VECTOR_QUANTIZATION != "none":
+        cursor = await collection.aggregate(_build_quantized_pipeline(query_embedding, limit, num_candidates, filters))
+        return _collapse(_rescore(query_embedding, await cursor.to_list(), _fetch_count(num_results, limit), limit, min_score),
+                         num_results)
+    cursor = await collection.aggregate(_build_pipeline(query_embedding, _fetch_count(num_results, limit), limit, min_score,
+                                                        num_candidates, filters))
+    return _collapse(await cursor.to_list(), num_results)
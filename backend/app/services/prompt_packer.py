@@ -0,0 +1,235 @@
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List
+
+from ..core import metrics
+from ..models.patent import MatchedPatent
+from .lexical_index_service import tokenize
+
+# Splits after sentence-ending punctuation; patent abstracts rarely use abbreviations that would confuse it.
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+")
+_SHINGLE_SIZE = 3
+_TRIMMED_MARK = " [...]"
+# A patent that cannot keep at least this many abstract tokens is dropped rather than cut to a stub.
+MIN_ABSTRACT_TOKENS = 24
+
+logger = logging.getLogger(__name__)
+
+
+class PromptBudgetError(ValueError):
+    """The token budget cannot hold even the best-matching patent: a request or configuration problem."""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken is optional, and fetches its vocabulary on first use; either failing means the estimate is used.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        logger.info("tiktoken unavailable; estimating prompt tokens from text length.")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in `text` by tiktoken's cl100k_base, or about 3.5 characters per token without it.
+    Neither is the Gemini or Mixtral tokenizer, so budgets should leave some headroom.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 3.5)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def format_patent(publication_number: str, title: str, abstract: str) -> str:
+    return f"<PATENT>\nPublication Number: {publication_number}\nTitle: {title}\nAbstract: {abstract}\n</PATENT>"
+
+
+def format_patents(patents: List[MatchedPatent]) -> str:
+    return "\n\n".join(format_patent(p.publication_number, p.title, p.abstract) for p in patents)
+
+
+@dataclass
+class PackedPatents:
+    """The prior-art section of one prompt, and what packing did to get it under the budget."""
+    text: str
+    tokens_before: int
+    tokens_after: int
+    duplicates: list = field(default_factory=list)
+    trimmed: list = field(default_factory=list)
+    dropped: list = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class PackingStats:
+    def __init__(self):
+        self.prompts = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.duplicates = 0
+        self.trimmed = 0
+        self.dropped = 0
+
+    def record(self, packed: PackedPatents):
+        self.prompts += 1
+        self.tokens_before += packed.tokens_before
+        self.tokens_after += packed.tokens_after
+        self.duplicates += len(packed.duplicates)
+        self.trimmed += len(packed.trimmed)
+        self.dropped += len(packed.dropped)
+
+    def snapshot(self) -> dict:
+        saved = self.tokens_before - self.tokens_after
+        return {
+            "prompts": self.prompts,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": saved,
+            "saved_ratio": round(saved / self.tokens_before, 4) if self.tokens_before else None,
+            "duplicates": self.duplicates,
+            "trimmed": self.trimmed,
+            "dropped": self.dropped,
+        }
+
+
+_stats = PackingStats()
+
+
+def get_stats() -> dict:
+    return _stats.snapshot()
+
+
+def _shingles(text: str) -> set:
+    terms = tokenize(text)
+    if len(terms) < _SHINGLE_SIZE:
+        return {tuple(terms)}
+    return {tuple(terms[i:i + _SHINGLE_SIZE]) for i in range(len(terms) - _SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _similarity(query: Counter, sentence: str) -> float:
+    terms = Counter(tokenize(sentence))
+    dot = sum(count * query[term] for term, count in terms.items())
+    if not dot:
+        return 0.0
+    return dot / math.sqrt(sum(c * c for c in terms.values()) * sum(c * c for c in query.values()))
+
+
+def _trim_abstract(abstract: str, query: Counter, limit: int) -> str:
+    """The sentences most similar to the idea, in their original order, within `limit` tokens."""
+    abstract = abstract.strip()
+    if abstract.endswith(_TRIMMED_MARK.strip()):
+        abstract = abstract[:-len(_TRIMMED_MARK.strip())].rstrip()
+    sentences = [s for s in _SENTENCE_BREAK.split(abstract) if s]
+    if not sentences:
+        return abstract
+    limit -= count_tokens(_TRIMMED_MARK)
+    sizes = [count_tokens(s) + 1 for s in sentences]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-_similarity(query, sentences[i]), i))
+    kept, used = [], 0
+    for i in ranked:
+        if used + sizes[i] <= limit:
+            kept.append(i)
+            used += sizes[i]
+    if not kept:
+        # Even the best sentence is too long: keep its leading words.
+        words = sentences[ranked[0]].split()
+        return " ".join(words[:max(1, len(words) * limit // sizes[ranked[0]])]) + _TRIMMED_MARK
+    return " ".join(sentences[i] for i in sorted(kept)) + _TRIMMED_MARK
+
+
+def _water_level(sizes: list[int], available: int) -> int:
+    """The largest per-patent cap c with sum(min(size, c)) <= available."""
+    remaining, ordered = available, sorted(sizes)
+    for n, size in enumerate(ordered):
+        share = remaining // (len(ordered) - n)
+        if size > share:
+            return share
+        remaining -= size
+    return ordered[-1] if ordered else 0
+
+
+def pack(user_idea: str, patents: List[MatchedPatent], budget: int,
+         dedup_threshold: float = 0.8, provider: str = "") -> PackedPatents:
+    """
+    Formats `patents` for the prompt within `budget` tokens:
+
+      1. orders them by score, best first
+      2. replaces an abstract that is a near-duplicate (word 3-gram Jaccard >= dedup_threshold) of a
+         better-scored one with a pointer to it, so the patent can still be cited
+      3. if the section is still over budget, caps every patent at an equal share and cuts the long
+         abstracts down to their sentences most similar to the idea; when the share is too small
+         to be useful, the lowest-scored patents are dropped instead; the best one is always kept,
+         cut to whatever fits, and PromptBudgetError is raised if the budget cannot hold even its header
+    """
+    tokens_before = count_tokens(format_patents(patents))
+    ordered = sorted(patents, key=lambda p: p.score, reverse=True)
+    abstracts = []
+    duplicates = []
+    kept_shingles = []
+    for patent in ordered:
+        shingles = _shingles(patent.abstract)
+        original = next((number for number, seen in kept_shingles if _jaccard(shingles, seen) >= dedup_threshold), None)
+        if original is None:
+            kept_shingles.append((patent.publication_number, shingles))
+            abstracts.append(patent.abstract)
+        else:
+            abstracts.append(f"Near-duplicate of {original}.")
+            duplicates.append(patent.publication_number)
+
+    query = Counter(tokenize(user_idea))
+    separator = count_tokens("\n\n")
+    trimmed, dropped = [], []
+    while True:
+        blocks = [format_patent(p.publication_number, p.title, abstract) for p, abstract in zip(ordered, abstracts)]
+        text = "\n\n".join(blocks)
+        overshoot = count_tokens(text) - budget
+        if overshoot <= 0 or not ordered:
+            break
+        headers = [count_tokens(format_patent(p.publication_number, p.title, "")) for p in ordered]
+        sizes = [count_tokens(block) for block in blocks]
+        cap = _water_level(sizes, budget - separator * len(ordered))
+        changed = False
+        if cap - max(headers) >= MIN_ABSTRACT_TOKENS:
+            for i, (patent, header, size) in enumerate(zip(ordered, headers, sizes)):
+                if size > cap:
+                    shorter = _trim_abstract(abstracts[i], query, cap - header)
+                    changed = changed or shorter != abstracts[i]
+                    abstracts[i] = shorter
+                    if patent.publication_number not in trimmed:
+                        trimmed.append(patent.publication_number)
+        if changed:
+            continue
+        if len(ordered) > 1:
+            abstracts.pop()
+            dropped.append(ordered.pop().publication_number)
+            continue
+        # Without the best patent the analysis would have no prior art to compare against.
+        room = count_tokens(abstracts[0]) - overshoot
+        shorter = _trim_abstract(abstracts[0], query, room) if room > count_tokens(_TRIMMED_MARK) else abstracts[0]
+        if shorter == abstracts[0]:
+            raise PromptBudgetError(f"A prompt token budget of {budget} tokens cannot hold even the best-matching patent "
+                             f"({ordered[0].publication_number}); raise PROMPT_TOKEN_BUDGET_* or shorten the idea.")
+        abstracts[0] = shorter
+        if ordered[0].publication_number not in trimmed:
+            trimmed.append(ordered[0].publication_number)
+
+    packed = PackedPatents(text, tokens_before, count_tokens(text), duplicates, trimmed, dropped)
+    _stats.record(packed)
+    if packed.tokens_saved > 0:
+        metrics.PROMPT_TOKENS_SAVED.inc(packed.tokens_saved, provider=provider or "unknown")
+    logger.debug("Packed %d patents for %s: %d -> %d tokens (%d near-duplicates, %d trimmed, %d dropped).",
+                 len(patents), provider or "prompt", packed.tokens_before, packed.tokens_after,
+                 len(duplicates), len(trimmed), len(dropped))
+    return packed
@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+from ..core import config, metrics
+
+# Interactive requests (someone is waiting on the page) are admitted ahead of batch jobs.
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# The priority of the calls made for the current request, set by the API handler; tasks started
+# for the request (hedges, map comparisons, single-flight calls) inherit it with the context.
+priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+
+_MAX_BACKOFF_SECONDS = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedError(Exception):
+    """A provider answered 429, or is paused after one for longer than a call may wait."""
+
+    def __init__(self, provider: str, retry_after: float, message: str = ""):
+        super().__init__(message or f"{provider} is rate limited; retry in {retry_after:.1f}s.")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` per second up to one minute's worth, the window the providers
+    meter quotas over. Not thread-safe: it is only touched from the event loop.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def available(self) -> float:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._level
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` can be taken, counting nothing else as queued ahead."""
+        return max(0.0, (amount - self.available()) / self.rate)
+
+    def take(self, amount: float):
+        self._level = self.available() - amount
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """
+    None unless `error` is a rate limit (HTTP 429); otherwise the provider's Retry-After in seconds,
+    or 0.0 when it sent none. Covers openai.RateLimitError and google.api_core's ResourceExhausted,
+    which both carry the HTTP status and, over REST, the response.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ProviderQueue:
+    """
+    Admission for one provider: a call waits until both the request and the token bucket can
+    cover it and any 429 pause has passed. Waiting calls are admitted by priority, then in
+    arrival order, by one dispatcher task that runs only while calls are queued.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paused_until = 0.0
+        self.rate_limits = 0
+        self._streak = 0
+        self._waiters = []  # heap of (priority, sequence, tokens, future)
+        self._sequence = itertools.count()
+        self._wake = asyncio.Event()
+        self._dispatcher = None
+
+    def _live_waiters(self) -> list:
+        return [w for w in self._waiters if not w[3].done()]
+
+    def depth(self) -> dict:
+        counts = dict.fromkeys(PRIORITIES, 0)
+        names = {rank: name for name, rank in PRIORITIES.items()}
+        for rank, _, _, _ in self._live_waiters():
+            counts[names[rank]] += 1
+        return counts
+
+    def _ready_in(self, tokens: float, queued_requests: int = 0, queued_tokens: float = 0.0) -> float:
+        wait = max(0.0, self.paused_until - time.monotonic())
+        if self.requests is not None:
+            wait = max(wait, self.requests.time_until(queued_requests + 1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.time_until(queued_tokens + tokens))
+        return wait
+
+    def estimated_wait(self, tokens: float = 0.0) -> float:
+        """Seconds before a new call would be admitted behind everything already queued."""
+        waiters = self._live_waiters()
+        return self._ready_in(self._clamp(tokens), len(waiters), sum(w[2] for w in waiters))
+
+    def _clamp(self, tokens: float) -> float:
+        # A prompt larger than a minute's quota would never fit; it waits for a full bucket instead.
+        return min(tokens, self.tokens.capacity) if self.tokens is not None else tokens
+
+    def _take(self, tokens: float):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    async def acquire(self, tokens: float, priority_name: str):
+        """Waits for admission; RateLimitedError if that would take longer than LLM_SCHEDULER_MAX_WAIT_SECONDS."""
+        tokens = self._clamp(tokens)
+        started = time.monotonic()
+        try:
+            if not self._live_waiters() and self._ready_in(tokens) <= 0:
+                self._take(tokens)
+                return
+            wait = self.estimated_wait(tokens)
+            if wait > config.LLM_SCHEDULER_MAX_WAIT_SECONDS:
+                raise RateLimitedError(self.name, wait, f"{self.name} is at its rate limit; the next slot is {wait:.1f}s away.")
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES[priority_name], next(self._sequence), tokens, future))
+            self._wake.set()
+            if self._dispatcher is None:
+                self._dispatcher = asyncio.create_task(self._dispatch())
+            try:
+                await asyncio.wait_for(future, config.LLM_SCHEDULER_MAX_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                raise RateLimitedError(self.name, self.estimated_wait(tokens)) from None
+        finally:
+            metrics.LLM_QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, provider=self.name, priority=priority_name)
+
+    async def _dispatch(self):
+        try:
+            while self._waiters:
+                _, _, tokens, future = self._waiters[0]
+                if future.done():
+                    heapq.heappop(self._waiters)
+                    continue
+                delay = self._ready_in(tokens)
+                if delay > 0:
+                    # Woken early when a call joins the queue, since it may go ahead of the head.
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                heapq.heappop(self._waiters)
+                self._take(tokens)
+                future.set_result(None)
+        finally:
+            self._dispatcher = None
+
+    def record_rate_limit(self, retry_after: Optional[float]):
+        """Pauses the provider for its Retry-After, or for an exponential backoff when it sent none."""
+        self.rate_limits += 1
+        self._streak += 1
+        if not retry_after:
+            backoff = config.LLM_RATE_LIMIT_BACKOFF_SECONDS * 2 ** (self._streak - 1)
+            retry_after = min(_MAX_BACKOFF_SECONDS, backoff) * random.uniform(0.8, 1.2)
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        metrics.LLM_RATE_LIMITED.inc(provider=self.name)
+        logger.warning("%s rate limited the call; pausing it for %.1fs.", self.name, retry_after)
+
+    def record_success(self):
+        self._streak = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self.depth(),
+            "paused_for_s": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            "rate_limits": self.rate_limits,
+            "requests_available": round(self.requests.available(), 1) if self.requests is not None else None,
+            "tokens_available": round(self.tokens.available()) if self.tokens is not None else None,
+            "estimated_wait_s": round(self.estimated_wait(), 2),
+        }
+
+
+_queues = {
+    "gemini": ProviderQueue("gemini", config.LLM_GEMINI_RPM, config.LLM_GEMINI_TPM),
+    "together": ProviderQueue("together", config.LLM_TOGETHER_RPM, config.LLM_TOGETHER_TPM),
+}
+
+
+def estimate_tokens(prompt_tokens: int) -> int:
+    """What a call counts against the token bucket: its prompt plus the completion expected back."""
+    return prompt_tokens + config.LLM_EXPECTED_COMPLETION_TOKENS
+
+
+async def acquire(provider: str, tokens: float):
+    await _queues[provider].acquire(tokens, priority.get())
+
+
+def rank(providers: List[str]) -> List[str]:
+    """`providers` ordered by how soon each could take a call; ties keep the given (preference) order."""
+    return sorted(providers, key=lambda name: round(_queues[name].estimated_wait(), 1))
+
+
+def observe_error(provider: str, error: Exception) -> Optional[float]:
+    """Pauses `provider` if `error` is a 429 and returns the pause's Retry-After (None otherwise)."""
+    retry_after = rate_limit_delay(error)
+    if retry_after is not None:
+        _queues[provider].record_rate_limit(retry_after)
+    return retry_after
+
+
+def record_success(provider: str):
+    _queues[provider].record_success()
+
+
+def shortest_wait() -> float:
+    return min(queue.estimated_wait() for queue in _queues.values())
+
+
+def get_stats() -> dict:
+    return {name: queue.snapshot() for name, queue in _queues.items()}
+
+
+metrics.Gauge(
+    "patent_checker_llm_queue_depth", "LLM calls waiting for admission, by provider and priority.",
+    lambda: {(name, level): count for name, queue in _queues.items() for level, count in queue.depth().items()},
+    ("provider", "priority"),
+)
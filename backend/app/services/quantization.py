@@ -0,0 +1,33 @@
+"""
+Compact embedding encodings used for the cheap first pass of a vector search.
+
+  int8    symmetric scalar quantization with one float32 scale per vector (4x smaller than float32)
+  binary  one sign bit per dimension, packed 8 per byte and compared by Hamming distance (32x smaller)
+
+Candidates found with either encoding are rescored against the full-precision query, so the
+encodings only need to keep the true neighbours inside the oversampled candidate set.
+The encoders live in app/shared.py, so data_ingestion/quantization.py writes the stored codes with the same ones.
+"""
+import numpy as np
+
+from ..shared import binarize, quantize_int8
+
+# Number of set bits in every byte value, for Hamming distance over packed bit vectors.
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dequantize_int8(codes, scales) -> np.ndarray:
+    return np.asarray(codes, dtype=np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+def hamming_distances(packed_matrix: np.ndarray, packed_query: np.ndarray) -> np.ndarray:
+    """Hamming distance from one packed query (1-D) to every row of a packed matrix."""
+    return _POPCOUNT[np.bitwise_xor(packed_matrix, packed_query)].sum(axis=1, dtype=np.int32)
+
+
+def cosine_similarities(query, vectors) -> np.ndarray:
+    query = np.asarray(query, dtype=np.float32)
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1.0
+    return (vectors @ query) / norms
@@ -0,0 +1,92 @@
+import asyncio
+from ..core import config, timing
+from ..core.executors import search_pool
+from . import lexical_index_service, local_embedding_service, mongo_service
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], num_results: int, k: int = 60) -> list[dict]:
+    """
+    Merges rankings by summing 1 / (k + rank) per patent. Only ranks are used, so BM25 and
+    cosine scores never have to be put on a common scale. The returned score is the fused value
+    divided by its maximum (first in every ranking), which keeps it in (0, 1].
+    """
+    fused = {}
+    patents = {}
+    for ranking in rankings:
+        for rank, patent in enumerate(ranking, start=1):
+            key = patent["publication_number"]
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            patents.setdefault(key, patent)
+    best_possible = len(rankings) / (k + 1)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:num_results]
+    return [{**patents[key], "score": fused[key] / best_possible} for key in ordered]
+
+
+async def hybrid_search(idea_text: str, num_results: int = 5, embedding: list[float] = None,
+                        num_candidates: int = None, filters=None) -> list[dict]:
+    """
+    BM25 and dense retrieval fused by RRF. The lexical lookup starts first and runs on the search
+    pool while the idea is embedded (unless `embedding` is given) and the vector search is awaited.
+    Dense candidates are not cut at MINIMUM_RELEVANCE_SCORE here: a weak dense match still counts
+    if BM25 ranks it highly. Near-duplicate clusters are collapsed after fusion, so a BM25 hit
+    cannot bring back a patent the dense ranking already folded into its cluster.
+    """
+    depth = max(config.HYBRID_CANDIDATES, num_results)
+    lexical = asyncio.ensure_future(search_pool.run(lexical_index_service.search, idea_text, depth, filters))
+    try:
+        if embedding is None:
+            with timing.stage("embedding"):
+                embedding = await local_embedding_service.create_embedding_async(idea_text)
+        with timing.stage("retrieval"):
+            dense = await mongo_service.vector_search_async(embedding, num_results=depth, limit=depth, min_score=0.0,
+                                                            num_candidates=num_candidates, filters=filters)
+            lexical_results = await lexical
+    except BaseException:
+        lexical.cancel()
+        raise
+    if not config.VECTOR_SEARCH_COLLAPSE_CLUSTERS:
+        return reciprocal_rank_fusion([dense, lexical_results], num_results, config.RRF_K)
+    fused = reciprocal_rank_fusion([dense, lexical_results], 2 * depth, config.RRF_K)
+    return mongo_service.collapse_clusters(fused, num_results)
+
+
+async def find_similar(idea_text: str, num_results: int = config.VECTOR_SEARCH_NUM_RESULTS,
+                       limit: int = config.VECTOR_SEARCH_LIMIT, num_candidates: int = None,
+                       min_score: float = mongo_service.MINIMUM_RELEVANCE_SCORE, filters=None) -> list[dict]:
+    """
+    Retrieval for /find-similar, dense only or hybrid depending on RETRIEVAL_MODE. The knobs are
+    passed on to mongo_service.vector_search; hybrid mode uses only num_results, num_candidates
+    and filters, which it applies to both rankings.
+    """
+    if config.RETRIEVAL_MODE == "hybrid":
+        return await hybrid_search(idea_text, num_results, num_candidates=num_candidates, filters=filters)
+    with timing.stage("embedding"):
+        embedding = await local_embedding_service.create_embedding_async(idea_text)
+    with timing.stage("retrieval"):
+        return await mongo_service.vector_search_async(embedding, num_results, limit, min_score, num_candidates, filters)
+
+
+async def find_similar_batch(idea_texts: list[str], search_params: list[dict] = None) -> list:
+    """
+    Retrieval for many ideas at once. All ideas are embedded in one vectorized encode, then
+    searched concurrently (at most BATCH_SEARCH_CONCURRENCY at a time) over the shared pools,
+    each with its own entry of `search_params` (find_similar's knobs). Returns one entry per idea, in order: its patent
+    list, or the exception its search raised.
+    """
+    search_params = search_params or [{} for _ in idea_texts]
+    with timing.stage("embedding"):
+        embeddings = await local_embedding_service.create_embeddings_async(idea_texts)
+    semaphore = asyncio.Semaphore(config.BATCH_SEARCH_CONCURRENCY)
+
+    async def search(idea_text: str, embedding: list[float], params: dict) -> list[dict]:
+        async with semaphore:
+            if config.RETRIEVAL_MODE == "hybrid":
+                num_results = params.get("num_results", config.VECTOR_SEARCH_NUM_RESULTS)
+                return await hybrid_search(idea_text, num_results, embedding, params.get("num_candidates"),
+                                           params.get("filters"))
+            return await mongo_service.vector_search_async(embedding, **params)
+
+    with timing.stage("retrieval"):
+        return await asyncio.gather(
+            *(search(*entry) for entry in zip(idea_texts, embeddings, search_params)), return_exceptions=True
+        )
@@ -0,0 +1,82 @@
+"""
+Metadata filters for /find-similar: publication date range, CPC codes and countries. On Atlas they
+become $vectorSearch pre-filters; on the local indexes they select the rows that are searched at
+all, from the filter columns data_ingestion/patent_metadata.py writes. The two must stay in step.
+"""
+import json
+import logging
+import os
+from datetime import datetime, time, timezone
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _yyyymmdd(day) -> int:
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def atlas_filter(filters) -> Optional[dict]:
+    """The $vectorSearch `filter` for a SearchFilters, or None when it filters nothing."""
+    if filters is None:
+        return None
+    clauses = []
+    if filters.published_from is not None:
+        start = datetime.combine(filters.published_from, time.min, tzinfo=timezone.utc)
+        clauses.append({"publication_date": {"$gte": start}})
+    if filters.published_to is not None:
+        end = datetime.combine(filters.published_to, time.min, tzinfo=timezone.utc)
+        clauses.append({"publication_date": {"$lte": end}})
+    if filters.countries:
+        clauses.append({"country_code": {"$in": filters.countries}})
+    if filters.cpc:
+        # cpc_prefixes holds every level of every code, so a class, subclass, group or full code matches.
+        clauses.append({"cpc_prefixes": {"$in": filters.cpc}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class FilterColumns:
+    """
+    The filter columns of a local index directory. An index built before they existed has none,
+    and then, as on Atlas for patents without the fields, no row matches a filter.
+    """
+
+    def __init__(self, index_dir: str, count: int):
+        self.count = count
+        path = os.path.join(index_dir, "filters.json")
+        self.available = os.path.exists(path)
+        if not self.available:
+            return
+        with open(path, encoding="utf-8") as f:
+            values = json.load(f)
+        self.country_ids = {country: i for i, country in enumerate(values["countries"]) if country}
+        self.cpc_ranges = values["cpc"]
+        self.dates = np.load(os.path.join(index_dir, "filter_dates.npy"))
+        self.countries = np.load(os.path.join(index_dir, "filter_countries.npy"))
+        self.cpc_rows = np.load(os.path.join(index_dir, "filter_cpc_rows.npy"), mmap_mode="r")
+
+    def rows(self, filters) -> Optional[np.ndarray]:
+        """The ascending rows matching `filters`, or None when it filters nothing."""
+        if filters is None or atlas_filter(filters) is None:
+            return None
+        if not self.available:
+            logger.warning("The local index has no filter columns (rebuild it); no patent matches the filters.")
+            return np.empty(0, dtype=np.int64)
+        mask = np.ones(self.count, dtype=bool)
+        if filters.published_from is not None:
+            mask &= self.dates >= _yyyymmdd(filters.published_from)
+        if filters.published_to is not None:
+            mask &= (self.dates <= _yyyymmdd(filters.published_to)) & (self.dates > 0)
+        if filters.countries:
+            mask &= np.isin(self.countries, [self.country_ids[c] for c in filters.countries if c in self.country_ids])
+        if filters.cpc:
+            in_class = np.zeros(self.count, dtype=bool)
+            for prefix in filters.cpc:
+                start, end = self.cpc_ranges.get(prefix, (0, 0))
+                in_class[self.cpc_rows[start:end]] = True
+            mask &= in_class
+        return np.flatnonzero(mask)
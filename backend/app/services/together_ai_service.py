@@ -1,8 +1,10 @@
 import json
-import traceback
+import logging
 from openai import OpenAI
 from ..core import config
 
+logger = logging.getLogger(__name__)
+
 if not config.TOGETHER_API_KEY:
     raise ValueError("FATAL ERROR: TOGETHER_API_KEY is not defined in your .env file. The application cannot start.")
 
@@ -28,23 +30,18 @@ def get_comparison(user_idea: str, patent_abstract: str) -> dict:
     """
 
     try:
-        print("-----> Sending new analysis request to Together AI...")
+        logger.debug("Sending analysis request to Together AI.")
         chat_completion = client.chat.completions.create(
             messages=[{"role": "user", "content": prompt}],
             model="mistralai/Mixtral-8x7B-Instruct-v0.1",
             temperature=0.7,
             response_format={"type": "json_object"},
         )
-        print("<----- Successfully received response from Together AI.")
+        logger.debug("Received response from Together AI.")
         response_text = chat_completion.choices[0].message.content
         return json.loads(response_text)
     except Exception as e:
-        print("\n" + "="*80)
-        print("!!!!!!!!!   CRITICAL ERROR DURING TOGETHER AI API CALL   !!!!!!!!!")
-        print(f"This is the definitive point of failure. The issue is likely with your API Key, network connection, or an outage at Together AI.")
-        print(f"Error Type:    {type(e).__name__}")
-        print(f"Error Details: {e}")
-        traceback.print_exc()
-        print("="*80 + "\n")
+        # Most likely the API key, the network connection, or an outage at Together AI.
+        logger.exception("Together AI API call failed: %s - %s", type(e).__name__, e)
         # Re-raise the exception to send a 500 error back to the frontend
         raise e
\ No newline at end of file
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from ..core import config
+from ..core.executors import embedding_pool, search_pool
+from . import lexical_index_service, local_embedding_service, local_index_service
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """What /ready reports: whether warm-up has finished, how long each step took, and any failure."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.started_at = None
+        self.steps = {}
+
+    def snapshot(self) -> dict:
+        status = "ready" if self.ready else ("failed" if self.error else "warming_up")
+        return {"status": status, "error": self.error, "steps_ms": dict(self.steps)}
+
+
+state = WarmupState()
+
+
+async def _step(name: str, pool, fn):
+    started = time.perf_counter()
+    await pool.run(fn)
+    state.steps[name] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Warm-up step '%s' finished in %.0f ms.", name, state.steps[name])
+
+
+async def run():
+    """
+    Loads everything the first request would otherwise wait for, off the event loop and in
+    parallel: the embedding model (plus one dummy encode) and, when they are in use, the local
+    vector index and the lexical index. The app serves requests meanwhile; /ready says when it is done.
+    """
+    state.started_at = time.time()
+    steps = [("embedding_model", embedding_pool, local_embedding_service.warm_up)]
+    if config.VECTOR_BACKEND == "local":
+        steps.append(("vector_index", search_pool, local_index_service.get_index))
+    if config.RETRIEVAL_MODE == "hybrid":
+        steps.append(("lexical_index", search_pool, lexical_index_service.get_index))
+    try:
+        await asyncio.gather(*(_step(*step) for step in steps))
+    except Exception as e:
+        # Stay not-ready, so the orchestrator keeps traffic away and eventually restarts the worker.
+        state.error = f"{type(e).__name__}: {e}"
+        logger.exception("Warm-up failed; /ready will keep answering 503.")
+        return
+    state.ready = True
+    logger.info("Warm-up complete in %.0f ms; worker is ready.", (time.time() - state.started_at) * 1000)
+
+
+def mark_ready():
+    """Used when WARMUP_ON_STARTUP is off: everything loads lazily, so there is nothing to wait for."""
+    state.ready = True
@@ -0,0 +1,235 @@
+"""
+The pure pieces the backend and the ingestion scripts (data_ingestion/) must agree on: the local
+embedding model and the key its vectors are cached and fingerprinted under, the BM25 tokenizer,
+the vector quantizers, and the embedding server's wire format and blocking client. It imports nothing else from the app, so ingestion can import it
+without loading the backend's settings or services (see data_ingestion/backend_shared.py).
+"""
+import json
+import platform
+import re
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+# --- Local embedding model ---
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+# Dynamically quantized int8 exports published with the model, one per instruction set.
+QUANTIZED_ONNX_FILES = {
+    "arm64": "onnx/model_qint8_arm64.onnx",
+    "avx2": "onnx/model_quint8_avx2.onnx",
+    "avx512": "onnx/model_qint8_avx512.onnx",
+    "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+}
+
+
+def cache_key(backend: str) -> str:
+    """
+    Which vectors `backend` produces: int8 ones differ slightly from the float ones, so they get
+    their own key; the float ONNX export matches torch and shares its key.
+    """
+    return f"{MODEL_NAME}|int8" if backend == "onnx-int8" else MODEL_NAME
+
+
+def embedding_model_id(backend: str = "torch") -> str:
+    """The embedding_model fingerprint ingestion stores; switching to or from int8 re-embeds."""
+    return f"sentence-transformers/{cache_key(backend)}"
+
+
+def detect_quantization_target() -> str:
+    """The int8 export that suits this CPU: arm64, avx512_vnni, avx512, or avx2 as the safe default."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def load_model(backend: str = "torch", threads: int = 0, quantization: str = "auto"):
+    """
+    Loads all-MiniLM-L6-v2 for `backend` (torch, onnx or onnx-int8) with `threads` intra-op
+    threads (0 leaves the library default). All three return the same SentenceTransformer
+    interface, so callers do not need to know which one is running. The ONNX backends need
+    `pip install "sentence-transformers[onnx]"`.
+    """
+    # Imported here: sentence_transformers pulls in torch, which takes seconds to import.
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(MODEL_NAME, device='cpu')
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    # Concurrent encodes already run side by side on the embedding pool.
+    options.inter_op_num_threads = 1
+    if backend == "onnx-int8":
+        target = detect_quantization_target() if quantization == "auto" else quantization
+        file_name = QUANTIZED_ONNX_FILES[target]
+    else:
+        file_name = "onnx/model.onnx"
+    model_kwargs = {"file_name": file_name, "provider": "CPUExecutionProvider", "session_options": options}
+    return SentenceTransformer(MODEL_NAME, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+
+
+# --- BM25 tokenizer ---
+# Keeps hyphenated and dotted runs together, so chemical names and part numbers such as
+# "ti-6al-4v" or "m3.5" stay single terms.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN_PATTERN.findall((text or "").lower()) if token not in STOP_WORDS]
+
+
+# --- Vector quantizers ---
+def quantize_int8(vectors) -> tuple[np.ndarray, np.ndarray]:
+    """Returns (codes, scales) such that vectors ~= codes * scales[:, None]."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def binarize(vectors) -> np.ndarray:
+    """Packs the sign of every dimension into bits (1 for positive), eight dimensions per byte."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+# --- Embedding server wire format (backend/app/services/embedding_server.py) ---
+# Request:  <I byte length> + UTF-8 JSON {"texts": [...]}
+# Response: <B status> then, for STATUS_OK, <I count><I dim> + count * dim little-endian float32;
+#           otherwise <I byte length> + UTF-8 JSON {"error": ..., "retry_after": ...}.
+# Vectors travel as raw float32, so the client maps them with np.frombuffer instead of parsing.
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_OVERLOADED = 2
+LENGTH_PREFIX = struct.Struct("<I")
+SHAPE_HEADER = struct.Struct("<II")
+
+
+class EmbeddingServerError(RuntimeError):
+    """The embedding server failed the request, or could not be reached."""
+
+
+class EmbeddingServerOverloaded(EmbeddingServerError):
+    """The embedding server's pool is full; retry after `retry_after` seconds (None if it did not say)."""
+
+    def __init__(self, retry_after):
+        super().__init__("The embedding server is busy.")
+        self.retry_after = retry_after
+
+
+def recv_exactly(sock: socket.socket, size: int) -> memoryview:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("The embedding server closed the connection.")
+        received += count
+    return view
+
+
+class EmbeddingClient:
+    """
+    Blocking client for the node's embedding server. Each thread (the embedding pool's workers)
+    keeps its own connection, so requests never interleave on a socket.
+    """
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sockets = set()
+        self._sockets_lock = threading.Lock()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise EmbeddingServerError(f"Cannot reach the embedding server at '{self.path}': {e}") from e
+            self._local.sock = sock
+            with self._sockets_lock:
+                self._sockets.add(sock)
+        return sock
+
+    def _reset(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+            with self._sockets_lock:
+                self._sockets.discard(sock)
+
+    def close(self):
+        """Closes every thread's connection; a later encode reconnects."""
+        with self._sockets_lock:
+            sockets, self._sockets = self._sockets, set()
+        for sock in sockets:
+            sock.close()
+        self._local = threading.local()
+
+    def _request(self, payload: bytes) -> np.ndarray:
+        sock = self._connection()
+        sock.sendall(LENGTH_PREFIX.pack(len(payload)) + payload)
+        status = recv_exactly(sock, 1)[0]
+        if status == STATUS_OK:
+            count, dim = SHAPE_HEADER.unpack(recv_exactly(sock, SHAPE_HEADER.size))
+            return np.frombuffer(recv_exactly(sock, count * dim * 4), dtype="<f4").reshape(count, dim)
+        (length,) = LENGTH_PREFIX.unpack(recv_exactly(sock, LENGTH_PREFIX.size))
+        detail = json.loads(bytes(recv_exactly(sock, length)))
+        if status == STATUS_OVERLOADED:
+            raise EmbeddingServerOverloaded(detail.get("retry_after"))
+        raise EmbeddingServerError(detail.get("error") or "The embedding server failed the request.")
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """(len(texts), dim) float32 vectors. A dropped connection (say, a server restart) is retried once."""
+        payload = json.dumps({"texts": texts}, ensure_ascii=False).encode("utf-8")
+        for attempt in range(2):
+            try:
+                return self._request(payload)
+            except ConnectionError as e:
+                self._reset()
+                if attempt:
+                    raise EmbeddingServerError(f"Lost the connection to the embedding server: {e}") from e
+            except (OSError, ValueError, struct.error):
+                # Timed out or desynchronised mid-response; the connection cannot be reused.
+                self._reset()
+                raise
+
+    def wait_until_ready(self, timeout: float):
+        """Retries until the server answers an encode, for a worker that starts before its sidecar."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.encode(["warm-up"])
+                return
+            except EmbeddingServerError:
+                self._reset()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
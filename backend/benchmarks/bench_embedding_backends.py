@@ -0,0 +1,125 @@
+"""
+Parity and speed report for the local embedding backends (EMBEDDING_BACKEND).
+
+Embeds the same texts with eager PyTorch and with each ONNX Runtime backend, then reports:
+
+  parity      mean and worst cosine similarity of every vector against its torch counterpart,
+              and how many of each text's top-k neighbours (among the texts) stay the same
+  single      p50/p95 latency of one-text encodes, the shape of an uncached /find-similar query
+  batch       texts per second for batched encodes, the shape of ingestion and /find-similar/batch
+
+for every --threads value. Texts are generated patent-like ideas, or the abstracts of a JSONL
+file such as data_ingestion/patents.json. Exits non-zero when a backend's worst cosine falls
+below --min-cosine, so it can gate a switch of EMBEDDING_BACKEND. Run from the backend directory:
+
+    python -m benchmarks.bench_embedding_backends --backends torch onnx onnx-int8 --threads 1 4
+    python -m benchmarks.bench_embedding_backends --input ../data_ingestion/patents.json --json backends.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from app.services.local_embedding_service import ENCODE_CHUNK_SIZE
+from app.shared import load_model
+from .load_test import make_idea, percentile
+
+
+def load_texts(path: str, count: int) -> list[str]:
+    if not path:
+        return [make_idea(i) for i in range(count)]
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and (abstract := json.loads(line).get("abstract")):
+                texts.append(abstract)
+                if len(texts) == count:
+                    break
+    return texts
+
+
+def neighbour_agreement(reference: np.ndarray, vectors: np.ndarray, k: int) -> float:
+    """Mean overlap of each text's top-k neighbours under the two sets of vectors."""
+    k = min(k, len(reference) - 1)
+    if k < 1:
+        return 1.0
+    expected = np.argsort(-(reference @ reference.T), axis=1)[:, 1:k + 1]
+    actual = np.argsort(-(vectors @ vectors.T), axis=1)[:, 1:k + 1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, actual)]))
+
+
+def measure(model, texts: list[str], singles: int, batch_size: int, rounds: int) -> dict:
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    latencies = []
+    for text in texts[:singles]:
+        started = time.perf_counter()
+        model.encode([text], batch_size=1)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        model.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    return {
+        "single_p50_ms": round(percentile(latencies, 0.50), 2),
+        "single_p95_ms": round(percentile(latencies, 0.95), 2),
+        "single_mean_ms": round(statistics.fmean(latencies), 2),
+        "batch_texts_per_s": round(len(texts) * rounds / elapsed, 1),
+    }
+
+
+def main(args) -> tuple[list[dict], bool]:
+    texts = load_texts(args.input, args.count)
+    print(f"{len(texts)} texts, batch size {args.batch_size}, {args.singles} single-text encodes per run.")
+    reference = load_model("torch").encode(texts, batch_size=args.batch_size, normalize_embeddings=True)
+    results, parity_ok = [], True
+    for backend in args.backends:
+        for threads in args.threads:
+            model = load_model(backend, threads, args.quantization)
+            result = {"backend": backend, "threads": threads,
+                      **measure(model, texts, args.singles, args.batch_size, args.rounds)}
+            vectors = model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True)
+            cosines = np.sum(reference * vectors, axis=1)
+            result.update(
+                mean_cosine=round(float(np.mean(cosines)), 6),
+                min_cosine=round(float(np.min(cosines)), 6),
+                **{f"top{args.k}_agreement": round(neighbour_agreement(reference, vectors, args.k), 4)},
+            )
+            if result["min_cosine"] < args.min_cosine:
+                parity_ok = False
+            results.append(result)
+            print(f"{backend:<10} {threads:>2} threads   single p50 {result['single_p50_ms']:>7} ms "
+                  f"p95 {result['single_p95_ms']:>7} ms   batch {result['batch_texts_per_s']:>8} texts/s   "
+                  f"cosine mean {result['mean_cosine']:.6f} min {result['min_cosine']:.6f}   "
+                  f"top{args.k} agreement {result[f'top{args.k}_agreement']:.4f}")
+    return results, parity_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=["torch", "onnx", "onnx-int8"],
+                        default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="Intra-op thread counts to try.")
+    parser.add_argument("--quantization", default="auto", help="int8 export for onnx-int8 (auto, arm64, avx2, ...).")
+    parser.add_argument("--input", help="JSONL file whose abstracts are embedded instead of generated ideas.")
+    parser.add_argument("--count", type=int, default=512, help="Texts to embed.")
+    parser.add_argument("--singles", type=int, default=200, help="One-text encodes timed per run.")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_CHUNK_SIZE)
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the texts for the batch timing.")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared for the agreement score.")
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="Fail when any vector's cosine with the torch one is lower.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results, parity_ok = main(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to '{args.json}'.")
+    if not parity_ok:
+        print(f"Parity check failed: some vectors have cosine < {args.min_cosine} with the torch ones.")
+        sys.exit(1)
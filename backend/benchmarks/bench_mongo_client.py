@@ -0,0 +1,94 @@
+"""
+Compares requests/sec for the three ways the API has talked to MongoDB:
+
+  per-request  a new MongoClient for every search (the original behaviour)
+  pooled       one shared MongoClient, searches run from a thread pool
+  async        one shared AsyncMongoClient, searches awaited on the event loop
+
+Run from the backend directory against the same MONGO_URI the API uses:
+
+    python -m benchmarks.bench_mongo_client --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient
+
+from app.core import config
+from app.services import mongo_service
+
+
+def _random_vector(dim: int) -> list[float]:
+    return [random.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def _summary(name: str, latencies: list[float], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    result = {
+        "mode": name,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+    }
+    print(f"{name:<12} {result['requests_per_sec']:>8} req/s   p50 {result['p50_ms']:>8} ms   p95 {result['p95_ms']:>8} ms")
+    return result
+
+
+def _per_request_search(vector: list[float]) -> float:
+    start = time.perf_counter()
+    client = MongoClient(config.MONGO_URI)
+    list(client[config.MONGO_DB_NAME]["patents"].aggregate(mongo_service._build_pipeline(vector, 5)))
+    client.close()
+    return time.perf_counter() - start
+
+
+def _pooled_search(vector: list[float]) -> float:
+    start = time.perf_counter()
+    collection = mongo_service.get_client()[config.MONGO_DB_NAME]["patents"]
+    list(collection.aggregate(mongo_service._build_pipeline(vector, 5)))
+    return time.perf_counter() - start
+
+
+def run_threaded(name: str, search, vectors: list[list[float]], concurrency: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(search, vectors))
+    return _summary(name, latencies, time.perf_counter() - start)
+
+
+async def run_async(vectors: list[list[float]], concurrency: int) -> dict:
+    await mongo_service.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(vector):
+        async with semaphore:
+            start = time.perf_counter()
+            collection = mongo_service.get_async_client()[config.MONGO_DB_NAME]["patents"]
+            cursor = await collection.aggregate(mongo_service._build_pipeline(vector, 5))
+            await cursor.to_list()
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(search(vector) for vector in vectors))
+    elapsed = time.perf_counter() - start
+    await mongo_service.close()
+    return _summary("async", list(latencies), elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size of the indexed collection.")
+    args = parser.parse_args()
+
+    vectors = [_random_vector(args.dim) for _ in range(args.requests)]
+    print(f"{args.requests} vector searches at concurrency {args.concurrency}")
+    run_threaded("per-request", _per_request_search, vectors, args.concurrency)
+    run_threaded("pooled", _pooled_search, vectors, args.concurrency)
+    asyncio.run(run_async(vectors, args.concurrency))
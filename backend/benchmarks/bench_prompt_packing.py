@@ -0,0 +1,144 @@
+"""
+Token and latency report for prompt packing (PROMPT_PACKING_ENABLED).
+
+By default, packs synthetic candidate sets, the shape /api/analyze-landscape receives, into a
+token budget and reports tokens before and after, the share saved, what was deduplicated,
+trimmed or dropped, and the time packing adds. Every set includes near-duplicate abstracts, as
+patent families do in real results. --input packs abstracts from a JSONL file instead.
+
+--end-to-end also runs benchmarks/offline_suite.py twice on the analyze scenario, with packing off
+and then on, and prints the latency change. The fake LLM server charges --ms-per-1k-prompt-tokens
+for reading the prompt, so the shorter prompts show up in the LLM stage the way they would with a
+real provider. An analysis gets at most the patents one /find-similar call returns, so use a
+budget that is tight for that many. Run from the backend directory:
+
+    python -m benchmarks.bench_prompt_packing --patents 20 --budget 3000
+    python -m benchmarks.bench_prompt_packing --end-to-end --patents 5 --budget 1200 --requests 100
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.models.patent import MatchedPatent
+from app.services import llm_service, prompt_packer
+from .load_test import make_idea, percentile
+from .synthetic_index import synthetic_metadata
+
+
+def near_duplicate(abstract: str, rng: random.Random) -> str:
+    """The same abstract with a few words changed, like two members of one patent family."""
+    words = abstract.split()
+    for i in rng.sample(range(len(words)), max(1, len(words) // 40)):
+        words[i] = rng.choice(("improved", "modular", "said", "further", "wherein"))
+    return " ".join(words)
+
+
+def candidate_sets(rows: list[dict], sets: int, size: int, duplicate_rate: float, seed: int):
+    rng = random.Random(seed)
+    for _ in range(sets):
+        patents = []
+        for i, row in enumerate(rng.sample(rows, size)):
+            abstract = row["abstract"]
+            if patents and rng.random() < duplicate_rate:
+                abstract = near_duplicate(rng.choice(patents).abstract, rng)
+            patents.append(MatchedPatent(publication_number=row["publication_number"], title=row["title"],
+                                         abstract=abstract, score=round(1.0 - i * 0.01 - rng.random() * 0.005, 4)))
+        yield make_idea(len(patents)), patents
+
+
+def load_rows(path: str, count: int) -> list[dict]:
+    if not path:
+        return list(synthetic_metadata(count, seed=7))
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and (row := json.loads(line)).get("abstract"):
+                rows.append(row)
+                if len(rows) == count:
+                    break
+    return rows
+
+
+def token_report(args) -> dict:
+    rows = load_rows(args.input, max(args.patents * 20, 1000))
+    fixed = prompt_packer.count_tokens(llm_service.PROMPT_TEMPLATE.format(user_idea=make_idea(0), formatted_patents=""))
+    before, after, elapsed, duplicates, trimmed, dropped = [], [], [], 0, 0, 0
+    for idea, patents in candidate_sets(rows, args.sets, args.patents, args.duplicate_rate, args.seed):
+        started = time.perf_counter()
+        packed = prompt_packer.pack(idea, patents, args.budget - fixed, args.dedup_threshold)
+        elapsed.append((time.perf_counter() - started) * 1000)
+        before.append(packed.tokens_before + fixed)
+        after.append(packed.tokens_after + fixed)
+        duplicates += len(packed.duplicates)
+        trimmed += len(packed.trimmed)
+        dropped += len(packed.dropped)
+    elapsed.sort()
+    result = {
+        "sets": args.sets, "patents_per_set": args.patents, "budget": args.budget,
+        "tokenizer": "tiktoken cl100k_base" if prompt_packer._encoding() else "estimate (3.5 chars/token)",
+        "prompt_tokens_before": round(statistics.fmean(before), 1),
+        "prompt_tokens_after": round(statistics.fmean(after), 1),
+        "saved_ratio": round(1 - sum(after) / sum(before), 4),
+        "over_budget_before": sum(b > args.budget for b in before),
+        "over_budget_after": sum(a > args.budget for a in after),
+        "duplicates_per_set": round(duplicates / args.sets, 2),
+        "trimmed_per_set": round(trimmed / args.sets, 2),
+        "dropped_per_set": round(dropped / args.sets, 2),
+        "pack_p50_ms": round(percentile(elapsed, 0.50), 3),
+        "pack_p95_ms": round(percentile(elapsed, 0.95), 3),
+    }
+    print(f"Packed {args.sets} sets of {args.patents} patents into {args.budget} tokens ({result['tokenizer']}):")
+    print(f"  prompt tokens   {result['prompt_tokens_before']:>9} -> {result['prompt_tokens_after']:>9} "
+          f"({result['saved_ratio']:.1%} saved)")
+    print(f"  over budget     {result['over_budget_before']:>9} -> {result['over_budget_after']:>9} sets")
+    print(f"  per set         {result['duplicates_per_set']} near-duplicates, {result['trimmed_per_set']} trimmed, "
+          f"{result['dropped_per_set']} dropped")
+    print(f"  packing time    p50 {result['pack_p50_ms']} ms   p95 {result['pack_p95_ms']} ms")
+    return result
+
+
+def end_to_end(args):
+    """Runs the offline suite with packing off, then on, comparing the second run with the first."""
+    baseline = os.path.join(tempfile.gettempdir(), "prompt_packing_off.json")
+    common = [sys.executable, "-m", "benchmarks.offline_suite", "--scenario", "analyze", "--count", str(args.count),
+              "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+              "--num-results", str(args.patents), "--ms-per-1k-prompt-tokens", str(args.ms_per_1k_prompt_tokens),
+              "--env", f"PROMPT_TOKEN_BUDGET_GEMINI={args.budget}", "--env", f"PROMPT_TOKEN_BUDGET_TOGETHER={args.budget}"]
+    backend_dir = os.path.join(os.path.dirname(__file__), "..")
+    subprocess.run(common + ["--env", "PROMPT_PACKING_ENABLED=false", "--label", "prompt packing off",
+                             "--output", baseline], cwd=backend_dir, check=True)
+    subprocess.run(common + ["--env", "PROMPT_PACKING_ENABLED=true", "--label", "prompt packing on",
+                             "--compare", baseline], cwd=backend_dir, check=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="JSONL file whose patents are packed instead of synthetic ones.")
+    parser.add_argument("--sets", type=int, default=200, help="Candidate sets to pack.")
+    parser.add_argument("--patents", type=int, default=20, help="Patents per set (and per analysis with --end-to-end).")
+    parser.add_argument("--budget", type=int, default=3000, help="Token budget for the whole prompt.")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="Share of patents that near-duplicate another.")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the token report to this file.")
+    parser.add_argument("--end-to-end", action="store_true", help="Also compare analysis latency with packing off and on.")
+    parser.add_argument("--count", type=int, default=20000, help="Patents in the synthetic index (--end-to-end).")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ms-per-1k-prompt-tokens", type=float, default=150.0,
+                        help="Prefill cost charged by the fake LLM server (--end-to-end).")
+    args = parser.parse_args()
+
+    report = token_report(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to '{args.json}'.")
+    if args.end_to_end:
+        end_to_end(args)
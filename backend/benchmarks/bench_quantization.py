@@ -0,0 +1,128 @@
+"""
+Recall-vs-memory report for quantized vector search (VECTOR_QUANTIZATION).
+
+For each storage mode, measures what stays resident in RAM per vector, recall@k against exact
+float32 search, and query latency. Quantized modes are shown without rescoring and with the
+top (k * factor) candidates rescored at full precision, which is what the backend does.
+
+Runs on a synthetic clustered corpus by default, or on a local index built by
+data_ingestion/build_local_index.py. Run from the backend directory:
+
+    python -m benchmarks.bench_quantization --count 200000 --dim 384
+    python -m benchmarks.bench_quantization --index ../data_ingestion/local_index --json quantization.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from app.services import quantization
+
+
+def synthetic_corpus(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, so neighbours are meaningful the way real patent embeddings are."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Perturbed corpus rows: a query resembles, but never exactly matches, an indexed patent."""
+    rng = np.random.default_rng(seed + 1)
+    dim = corpus.shape[1]
+    noise = rng.standard_normal((count, dim)).astype(np.float32) * (1.2 / np.sqrt(dim))
+    queries = corpus[rng.integers(0, len(corpus), count)] + noise
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    rows = np.argpartition(-scores, k - 1)[:k]
+    return rows[np.argsort(-scores[rows])]
+
+
+def rescore(corpus: np.ndarray, query: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    candidates = np.sort(candidates)
+    return candidates[top_rows(corpus[candidates] @ query, k)]
+
+
+def run_mode(name: str, search, queries: np.ndarray, truth: list[set], k: int, bytes_per_vector: float,
+             count: int) -> dict:
+    recalls = []
+    started = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        recalls.append(len(expected.intersection(search(query).tolist())) / len(expected))
+    elapsed = time.perf_counter() - started
+    result = {
+        "mode": name,
+        "bytes_per_vector": round(bytes_per_vector, 1),
+        "resident_mb": round(bytes_per_vector * count / 2**20, 1),
+        "gb_per_million": round(bytes_per_vector * 1_000_000 / 2**30, 2),
+        f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+        "ms_per_query": round(elapsed / len(queries) * 1000, 2),
+    }
+    print(f"{name:<22} {result['bytes_per_vector']:>8} B/vec {result['resident_mb']:>9} MB "
+          f"{result['gb_per_million']:>7} GB/1M   recall@{k} {result[f'recall_at_{k}']:.4f}   "
+          f"{result['ms_per_query']:>7} ms/query")
+    return result
+
+
+def main(args) -> list[dict]:
+    if args.index:
+        corpus = np.asarray(np.load(os.path.join(args.index, "embeddings.npy"), mmap_mode="r"), dtype=np.float32)
+        print(f"Loaded {len(corpus)} vectors of dimension {corpus.shape[1]} from '{args.index}'.")
+    else:
+        corpus = synthetic_corpus(args.count, args.dim, args.clusters, args.seed)
+        print(f"Synthetic corpus: {len(corpus)} vectors of dimension {corpus.shape[1]}.")
+    count, dim = corpus.shape
+    queries = make_queries(corpus, args.queries, args.seed)
+    k = args.k
+    truth = [set(top_rows(corpus @ query, k).tolist()) for query in queries]
+
+    corpus16 = corpus.astype(np.float16)
+    codes, scales = quantization.quantize_int8(corpus)
+    bits = quantization.binarize(corpus)
+
+    def int8_candidates(query, n):
+        return top_rows((codes @ query) * scales, n)
+
+    def binary_candidates(query, n):
+        return top_rows(-quantization.hamming_distances(bits, quantization.binarize(query)[0]).astype(np.float32), n)
+
+    results = [
+        run_mode("float32 exact", lambda q: top_rows(corpus @ q, k), queries, truth, k, 4 * dim, count),
+        run_mode("float16 exact", lambda q: top_rows(corpus16.astype(np.float32) @ q, k), queries, truth, k, 2 * dim, count),
+        run_mode("int8", lambda q: int8_candidates(q, k), queries, truth, k, dim + 4, count),
+        run_mode("binary", lambda q: binary_candidates(q, k), queries, truth, k, bits.shape[1], count),
+    ]
+    # With rescoring, only the codes are resident; the full vectors are read from disk per candidate.
+    for factor in args.factors:
+        results.append(run_mode(f"int8 + rescore x{factor}", lambda q: rescore(corpus, q, int8_candidates(q, k * factor), k),
+                                queries, truth, k, dim + 4, count))
+    for factor in args.factors:
+        results.append(run_mode(f"binary + rescore x{factor}", lambda q: rescore(corpus, q, binary_candidates(q, k * factor), k),
+                                queries, truth, k, bits.shape[1], count))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Local index directory to measure instead of a synthetic corpus.")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factors", type=int, nargs="+", default=[2, 4, 8], help="Rescoring oversampling factors.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = main(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to '{args.json}'.")
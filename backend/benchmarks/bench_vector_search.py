@@ -0,0 +1,205 @@
+"""
+Recall-vs-latency sweep of the vector search knobs (VECTOR_SEARCH_* and the /find-similar
+request parameters num_candidates, limit and min_score).
+
+Ground truth is an exact brute-force top-k over the stored embeddings. Every combination of the
+swept knobs then runs the same search the backend runs, and is reported with:
+
+  recall@k    share of the exact top k (those at or above min_score) that the search returned
+  returned    mean results per query, after the threshold and the num_results (= k) cut
+  p50/p95     per-query latency, one query at a time
+
+Within each min_score, the combinations no other one beats on both recall and p95 latency are
+marked as Pareto-optimal, and the cheapest one reaching --target-recall is suggested.
+
+The corpus is a local index (--index, searched with its HNSW graph or quantized codes just as
+VECTOR_BACKEND=local does; exact search ignores num_candidates), synthetic local indexes of each
+--counts size, or the Atlas collection itself (--atlas, which reads every stored embedding for
+the ground truth). Queries are perturbed corpus vectors, or the lines of --query-file embedded
+with the local model. Run from the backend directory:
+
+    python -m benchmarks.bench_vector_search --counts 10000 100000 --num-candidates 20 50 150 400
+    python -m benchmarks.bench_vector_search --index ../data_ingestion/local_index --limits 10 20 --json sweep.json
+    python -m benchmarks.bench_vector_search --atlas --queries 100 --num-candidates 50 150 500 1500
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.core import config
+from .bench_quantization import make_queries, top_rows
+from .load_test import percentile
+
+
+def to_score(similarities: np.ndarray) -> np.ndarray:
+    # The [0, 1] scale of Atlas' cosine vectorSearchScore, which min_score applies to.
+    return np.minimum(1.0, (1.0 + similarities) / 2.0)
+
+
+def ground_truth(corpus: np.ndarray, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    """The exact top k rows of every query, best first, with their scores."""
+    truth = []
+    for query in queries:
+        similarities = corpus @ query
+        rows = top_rows(similarities, k)
+        truth.append((rows, to_score(similarities[rows])))
+    return truth
+
+
+def load_queries(args, corpus: np.ndarray) -> np.ndarray:
+    if not args.query_file:
+        return make_queries(corpus, args.queries, args.seed)
+    from app.shared import load_model
+    with open(args.query_file, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()][:args.queries]
+    return np.asarray(load_model(config.EMBEDDING_BACKEND).encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def local_searcher(index_dir: str):
+    """search(query, k, limit, num_candidates, min_score) over a local index, as local_index_service does it."""
+    from app.services.local_index_service import LocalVectorIndex
+    index = LocalVectorIndex(index_dir)
+    mode = "HNSW" if index.graph is not None else f"{config.VECTOR_QUANTIZATION} + rescoring" if index.codes is not None else "exact"
+
+    def search(query, k, limit, num_candidates, min_score):
+        rows, similarities = index.top_k(query, limit, num_candidates)
+        keep = to_score(similarities) >= min_score
+        return rows[keep][:k]
+
+    corpus = np.asarray(index.embeddings, dtype=np.float32)
+    return corpus, search, mode
+
+
+def atlas_searcher():
+    """The corpus read back from Atlas, and a search that runs the backend's $vectorSearch pipeline."""
+    from app.services import mongo_service
+    collection = mongo_service.get_client()[config.MONGO_DB_NAME]["patents"]
+    numbers, vectors = [], []
+    for doc in collection.find({"embedding": {"$exists": True}}, {"_id": 0, "publication_number": 1, "embedding": 1}):
+        numbers.append(doc["publication_number"])
+        vectors.append(doc["embedding"])
+    corpus = np.asarray(vectors, dtype=np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    rows = {number: row for row, number in enumerate(numbers)}
+
+    def search(query, k, limit, num_candidates, min_score):
+        results = mongo_service.vector_search(query.tolist(), num_results=k, limit=limit, min_score=min_score,
+                                              num_candidates=num_candidates)
+        return np.asarray([rows.get(r["publication_number"], -1) for r in results])
+
+    mode = f"Atlas ({config.VECTOR_QUANTIZATION} vectors)" if config.VECTOR_QUANTIZATION != "none" else "Atlas"
+    return corpus, search, mode
+
+
+def sweep(search, queries: np.ndarray, truth: list, args) -> list[dict]:
+    k = args.k
+    results = []
+    for min_score, limit, num_candidates in itertools.product(args.min_scores, args.limits, args.num_candidates):
+        if limit < k or num_candidates < limit:
+            continue
+        recalls, returned, latencies = [], [], []
+        for query, (rows, scores) in zip(queries, truth):
+            started = time.perf_counter()
+            found = search(query, k, limit, num_candidates, min_score)
+            latencies.append((time.perf_counter() - started) * 1000)
+            expected = set(rows[scores >= min_score].tolist())
+            recalls.append(len(expected.intersection(found.tolist())) / len(expected) if expected else 1.0)
+            returned.append(len(found))
+        latencies.sort()
+        results.append({
+            "min_score": min_score, "limit": limit, "num_candidates": num_candidates,
+            f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+            "returned": round(float(np.mean(returned)), 2),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+        })
+    return results
+
+
+def mark_pareto(results: list[dict], k: int):
+    """Flags the combinations that no other one with the same min_score beats on both recall and p95."""
+    recall = f"recall_at_{k}"
+    for result in results:
+        peers = [r for r in results if r["min_score"] == result["min_score"] and r is not result]
+        result["pareto"] = not any(
+            p[recall] >= result[recall] and p["p95_ms"] <= result["p95_ms"]
+            and (p[recall] > result[recall] or p["p95_ms"] < result["p95_ms"])
+            for p in peers
+        )
+
+
+def report(label: str, mode: str, count: int, queries: int, results: list[dict], args):
+    recall = f"recall_at_{args.k}"
+    print(f"\n{label}: {count} vectors, {mode} search, {queries} queries, k={args.k}")
+    print(f"{'min_score':>9} {'limit':>6} {'candidates':>10} {recall:>12} {'returned':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in results:
+        print(f"{r['min_score']:>9} {r['limit']:>6} {r['num_candidates']:>10} {r[recall]:>12.4f} {r['returned']:>9} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {'*' if r['pareto'] else ''}")
+    for min_score in args.min_scores:
+        good = [r for r in results if r["min_score"] == min_score and r["pareto"] and r[recall] >= args.target_recall]
+        if good:
+            best = min(good, key=lambda r: r["p95_ms"])
+            print(f"min_score {min_score}: cheapest point with recall@{args.k} >= {args.target_recall} is "
+                  f"limit={best['limit']} num_candidates={best['num_candidates']} ({best['p95_ms']} ms p95).")
+        else:
+            print(f"min_score {min_score}: no swept point reaches recall@{args.k} >= {args.target_recall}.")
+    print("* Pareto-optimal within its min_score.")
+
+
+def run_corpus(label: str, corpus: np.ndarray, search, mode: str, args) -> dict:
+    queries = load_queries(args, corpus)
+    truth = ground_truth(corpus, queries, args.k)
+    results = sweep(search, queries, truth, args)
+    mark_pareto(results, args.k)
+    report(label, mode, len(corpus), len(queries), results, args)
+    return {"corpus": label, "count": len(corpus), "mode": mode, "results": results}
+
+
+def main(args) -> list[dict]:
+    if args.atlas:
+        corpus, search, mode = atlas_searcher()
+        return [run_corpus("atlas", corpus, search, mode, args)]
+    if args.index:
+        corpus, search, mode = local_searcher(args.index)
+        return [run_corpus(args.index, corpus, search, mode, args)]
+    from .synthetic_index import build
+    runs = []
+    for count in args.counts:
+        # Built with the codes VECTOR_QUANTIZATION searches, so the rescoring path can be swept too.
+        index_dir = os.path.join(args.work_dir, f"synthetic_{count}_{config.VECTOR_QUANTIZATION}")
+        build(index_dir, count, clusters=args.clusters, seed=args.seed, quantize=config.VECTOR_QUANTIZATION)
+        corpus, search, mode = local_searcher(index_dir)
+        runs.append(run_corpus(f"synthetic {count}", corpus, search, mode, args))
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--index", help="Local index directory to sweep.")
+    source.add_argument("--atlas", action="store_true", help="Sweep $vectorSearch on the MONGO_URI collection.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000], help="Synthetic corpus sizes.")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "patent_checker_vector_sweep"),
+                        help="Where synthetic indexes are built (and reused).")
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-file", help="Text file of ideas, one per line, embedded as the queries.")
+    parser.add_argument("--k", type=int, default=config.VECTOR_SEARCH_NUM_RESULTS, help="num_results; recall is measured at k.")
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 20, 50])
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[10, 20, 50, 100, 150, 300, 1000])
+    parser.add_argument("--min-scores", type=float, nargs="+", default=[0.0, config.VECTOR_SEARCH_MIN_SCORE])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    runs = main(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(runs, f, indent=2)
+        print(f"Results written to '{args.json}'.")
@@ -0,0 +1,238 @@
+"""
+A stand-in for both LLM providers, so the analysis path can be load-tested offline.
+
+Speaks the two protocols the backend uses:
+
+  POST /v1/chat/completions                         OpenAI / Together AI (plain and stream=true)
+  POST /v1beta/models/{model}:generateContent       Gemini REST
+  POST /v1beta/models/{model}:streamGenerateContent Gemini REST, streamed as a JSON array
+
+Every reply is a HolisticAnalysis that passes the backend's quality validation and cites the
+publication numbers found in the prompt, or a PatentComparison for a map-reduce comparison prompt. Latency and failures are configurable per provider:
+latency is log-normal around --latency-ms, plus --ms-per-1k-prompt-tokens for reading the prompt,
+so shorter prompts answer sooner as they do with a real model. Failures answer 500 and
+--rate-limit-rate answers 429.
+--invalid-rate returns JSON that fails quality validation, which exercises the fallback path.
+
+Point the backend at it with:
+
+    TOGETHER_BASE_URL=http://127.0.0.1:8001/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:8001
+
+and run it from the backend directory:
+
+    python -m benchmarks.fake_llm_server --port 8001 --latency-ms 1500 --gemini-failure-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_PUBLICATION_NUMBER = re.compile(r"Publication Number: (\S+)")
+_COMPARISON_MARKER = "<PATENT_UNDER_COMPARISON>"
+# Streamed replies are cut into this many chunks, spread over the latency budget.
+_STREAM_CHUNKS = 20
+
+
+@dataclass
+class Profile:
+    latency_ms: float = 1500.0
+    # Sigma of the log-normal latency; 0 gives a constant latency.
+    jitter: float = 0.35
+    failure_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    invalid_rate: float = 0.0
+    # Prefill cost: extra latency per thousand prompt tokens (estimated at 4 characters each).
+    ms_per_1k_prompt_tokens: float = 0.0
+
+
+@dataclass
+class Counters:
+    requests: int = 0
+    failures: int = 0
+    rate_limited: int = 0
+    invalid: int = 0
+
+
+def build_comparison(invalid: bool = False) -> str:
+    if invalid:
+        return json.dumps({"noveltyScore": 0, "keySimilarities": [], "keyDifferences": []})
+    return json.dumps({
+        "noveltyScore": random.randint(2, 9),
+        "keySimilarities": ["Both use a closed control loop with feedback from an embedded sensor."],
+        "keyDifferences": ["The idea adds an adaptive calibration step the patent does not describe."],
+    })
+
+
+def build_analysis(prompt: str, invalid: bool = False) -> str:
+    if _COMPARISON_MARKER in prompt:
+        return build_comparison(invalid)
+    cited = list(dict.fromkeys(_PUBLICATION_NUMBER.findall(prompt))) or ["US-0000000-A1"]
+    if invalid:
+        # Parses as a HolisticAnalysis but fails the quality check (lists are empty).
+        return json.dumps({"noveltyScore": 5, "synthesisOfPriorArt": "Too short.", "keySimilarities": [],
+                           "keyDifferences": [], "expertRecommendation": "None."})
+    return json.dumps({
+        "noveltyScore": random.randint(3, 8),
+        "synthesisOfPriorArt": (
+            f"The {len(cited)} retrieved patents describe closely related mechanisms, sharing a common "
+            "architecture for sensing, control and actuation, and differing mainly in materials and packaging."
+        ),
+        "keySimilarities": [
+            {"description": f"The idea reuses the control loop described in {number}, including its feedback path.",
+             "cited_patents": [number]}
+            for number in cited[:3]
+        ],
+        "keyDifferences": [
+            {"description": "The idea adds an adaptive calibration step that none of the cited patents describe.",
+             "cited_patents": cited[:2]}
+        ],
+        "expertRecommendation": (
+            "Focus the claims on the adaptive calibration step, document how it improves accuracy over the "
+            "cited prior art, and commission a professional search before filing a provisional application."
+        ),
+    })
+
+
+def create_app(profiles: dict[str, Profile]) -> FastAPI:
+    app = FastAPI(title="Fake LLM server")
+    counters = {name: Counters() for name in profiles}
+
+    def latency(profile: Profile, prompt: str) -> float:
+        seconds = profile.latency_ms / 1000
+        if profile.jitter:
+            seconds *= random.lognormvariate(0, profile.jitter)
+        return seconds + len(prompt) / 4 / 1000 * profile.ms_per_1k_prompt_tokens / 1000
+
+    def outcome(provider: str):
+        """Returns an error response to send, or None; also returns whether to send an invalid body."""
+        profile, count = profiles[provider], counters[provider]
+        count.requests += 1
+        draw = random.random()
+        if draw < profile.rate_limit_rate:
+            count.rate_limited += 1
+            return JSONResponse({"error": {"message": "Rate limit exceeded", "code": 429}}, status_code=429,
+                                headers={"Retry-After": "1"}), False
+        if draw < profile.rate_limit_rate + profile.failure_rate:
+            count.failures += 1
+            return JSONResponse({"error": {"message": "Injected failure", "code": 500}}, status_code=500), False
+        invalid = random.random() < profile.invalid_rate
+        count.invalid += invalid
+        return None, invalid
+
+    def chunks(text: str) -> list[str]:
+        size = max(1, len(text) // _STREAM_CHUNKS + 1)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error, invalid = outcome("together")
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        delay = latency(profiles["together"], prompt)
+        if error is not None:
+            await asyncio.sleep(delay / 4)
+            return error
+        content = build_analysis(prompt, invalid)
+        completion_id, model, created = f"chatcmpl-{uuid.uuid4().hex}", body.get("model", "fake"), int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            }
+
+        async def stream():
+            for piece in chunks(content):
+                await asyncio.sleep(delay / _STREAM_CHUNKS)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    def gemini_response(text: str, prompt: str, finished: bool = True) -> dict:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finished:
+            candidate["finishReason"] = "STOP"
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        return {"candidates": [candidate], "usageMetadata": usage}
+
+    @app.post("/v1beta/models/{model_method}")
+    async def gemini(model_method: str, request: Request):
+        body = await request.json()
+        error, invalid = outcome("gemini")
+        prompt = "\n".join(part.get("text", "") for content in body.get("contents", [])
+                           for part in content.get("parts", []))
+        delay = latency(profiles["gemini"], prompt)
+        if error is not None:
+            await asyncio.sleep(delay / 4)
+            return error
+        content = build_analysis(prompt, invalid)
+
+        if not model_method.endswith(":streamGenerateContent"):
+            await asyncio.sleep(delay)
+            return gemini_response(content, prompt)
+
+        async def stream():
+            # The REST transport reads server streams as one JSON array, element by element.
+            pieces = chunks(content)
+            yield "["
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(delay / _STREAM_CHUNKS)
+                yield ("," if i else "") + json.dumps(gemini_response(piece, prompt, finished=i == len(pieces) - 1))
+            yield "]"
+        return StreamingResponse(stream(), media_type="application/json")
+
+    @app.get("/stats")
+    def stats():
+        return {name: {"profile": asdict(profiles[name]), **asdict(counters[name])} for name in profiles}
+
+    return app
+
+
+def profiles_from_args(args) -> dict[str, Profile]:
+    profiles = {}
+    for provider in ("gemini", "together"):
+        profile = Profile(args.latency_ms, args.jitter, args.failure_rate, args.rate_limit_rate, args.invalid_rate,
+                          args.ms_per_1k_prompt_tokens)
+        for field in ("latency_ms", "failure_rate", "rate_limit_rate", "invalid_rate"):
+            override = getattr(args, f"{provider}_{field}")
+            if override is not None:
+                setattr(profile, field, override)
+        profiles[provider] = profile
+    return profiles
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=1500.0, help="Median response time.")
+    parser.add_argument("--jitter", type=float, default=0.35, help="Log-normal sigma of the latency.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls answered with 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with 429.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Fraction of replies that fail validation.")
+    parser.add_argument("--ms-per-1k-prompt-tokens", type=float, default=0.0, help="Added latency per 1k prompt tokens.")
+    for provider in ("gemini", "together"):
+        parser.add_argument(f"--{provider}-latency-ms", type=float)
+        parser.add_argument(f"--{provider}-failure-rate", type=float)
+        parser.add_argument(f"--{provider}-rate-limit-rate", type=float)
+        parser.add_argument(f"--{provider}-invalid-rate", type=float)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(profiles_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,229 @@
+"""
+Load generator for a running backend. Drives /api/find-similar and /api/analyze-landscape at a
+fixed concurrency and reports latency percentiles, throughput, errors and the per-stage split
+(embedding, retrieval, map, llm, validation) read from the Server-Timing header of every response.
+
+Scenarios:
+  find-similar  POST /api/find-similar with a fresh idea per request
+  analyze       POST /api/analyze-landscape with patents taken from one warm-up search
+  flow          both in sequence, the way the frontend calls them
+
+Every idea is unique, so the embedding and analysis caches cannot flatter the numbers.
+Results are written as JSON (with the git commit) so runs can be compared across commits:
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --scenario flow --concurrency 16 --requests 200
+    python -m benchmarks.load_test --scenario find-similar --compare benchmarks/results/<baseline>.json
+
+benchmarks/offline_suite.py starts the backend against local stand-ins and runs this for you.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SCENARIOS = ("find-similar", "analyze", "flow")
+STAGES = ("embedding", "retrieval", "map", "llm", "validation", "total")
+
+_SUBJECTS = ("A wearable", "A modular", "A low-cost", "An autonomous", "A self-calibrating", "A handheld")
+_DEVICES = ("glucose sensor", "drone gripper", "battery cooling plate", "water filter", "soil probe", "hearing aid")
+_FEATURES = (
+    "that harvests energy from ambient vibration", "with a replaceable ceramic membrane",
+    "controlled by an on-device neural model", "that reports over a low-power wireless network",
+    "using a shape-memory alloy actuator", "with an optical fiber strain gauge",
+)
+
+
+def make_idea(i: int) -> str:
+    # The trailing counter makes every idea distinct, so no request is answered from a cache.
+    return (f"{random.choice(_SUBJECTS)} {random.choice(_DEVICES)} {random.choice(_FEATURES)}, "
+            f"{random.choice(_FEATURES)}, variant {i}-{random.getrandbits(32):08x}.")
+
+
+def parse_server_timing(header: str) -> dict:
+    """'llm;dur=812.40, total;dur=901.2' -> {'llm': 812.4, 'total': 901.2}, in milliseconds."""
+    stages = {}
+    for entry in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, _, params = entry.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                stages[name.strip()] = float(value)
+    return stages
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(name: str, samples: list[dict], elapsed: float) -> dict:
+    """Aggregates samples of one endpoint: {latency_ms, status, stages}."""
+    ok = [s for s in samples if s["status"] == 200]
+    latencies = sorted(s["latency_ms"] for s in ok)
+    errors = {}
+    for s in samples:
+        if s["status"] != 200:
+            errors[str(s["status"])] = errors.get(str(s["status"]), 0) + 1
+    stages = {}
+    for stage in STAGES:
+        values = sorted(s["stages"][stage] for s in ok if stage in s["stages"])
+        if values:
+            stages[stage] = {"mean_ms": round(statistics.fmean(values), 2), "p95_ms": round(percentile(values, 0.95), 2)}
+    return {
+        "endpoint": name,
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": errors,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "stages": stages,
+    }
+
+
+async def _post(client: httpx.AsyncClient, path: str, payload, samples: list[dict]):
+    started = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+        status, stages = response.status_code, parse_server_timing(response.headers.get("server-timing"))
+    except httpx.HTTPError as e:
+        response, status, stages = None, type(e).__name__, {}
+    samples.append({"latency_ms": (time.perf_counter() - started) * 1000, "status": status, "stages": stages})
+    return response if status == 200 else None
+
+
+async def run_load(url: str, scenario: str, concurrency: int, requests: int, timeout: float, num_results: int) -> dict:
+    samples = {"find-similar": [], "analyze-landscape": []}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        seed_patents = []
+        if scenario == "analyze":
+            response = await client.post("/api/find-similar", json={"idea_text": make_idea(-1)})
+            response.raise_for_status()
+            seed_patents = response.json()["matched_patents"][:num_results]
+            if not seed_patents:
+                raise RuntimeError("The warm-up search returned no patents; the analyze scenario needs some.")
+
+        async def one(i: int):
+            idea = make_idea(i)
+            patents = seed_patents
+            if scenario != "analyze":
+                response = await _post(client, "/api/find-similar", {"idea_text": idea}, samples["find-similar"])
+                if response is None or scenario == "find-similar":
+                    return
+                patents = response.json()["matched_patents"][:num_results]
+                if not patents:
+                    return
+            await _post(client, "/api/analyze-landscape", {"user_idea": idea, "matched_patents": patents},
+                        samples["analyze-landscape"])
+
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                await one(queue.get_nowait())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": {name: summarize(name, endpoint_samples, elapsed)
+                      for name, endpoint_samples in samples.items() if endpoint_samples},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict):
+    for summary in result["endpoints"].values():
+        print(f"\n{summary['endpoint']}: {summary['succeeded']}/{summary['requests']} ok, "
+              f"{summary['throughput_rps']} req/s, errors {summary['errors'] or 'none'}")
+        print(f"  latency  p50 {summary['p50_ms']:>9} ms   p95 {summary['p95_ms']:>9} ms   p99 {summary['p99_ms']:>9} ms")
+        for stage, values in summary["stages"].items():
+            print(f"  {stage:<11} mean {values['mean_ms']:>9} ms   p95 {values['p95_ms']:>9} ms")
+
+
+def print_comparison(result: dict, baseline: dict):
+    """Prints the change of every headline number against a stored run; lower is better except throughput."""
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):")
+    for name, summary in result["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            print(f"  {name}: not in the baseline")
+            continue
+        rows = [(key, before.get(key), summary[key]) for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")]
+        rows += [(f"{stage} mean_ms", before.get("stages", {}).get(stage, {}).get("mean_ms"), values["mean_ms"])
+                 for stage, values in summary["stages"].items()]
+        print(f"  {name}:")
+        for key, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"    {key:<22} {old if old is not None else '-':>10} -> {new:>10}  ({change})")
+
+
+def save(result: dict, path: str = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit']}-{result['args']['scenario']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--scenario", choices=SCENARIOS, default="flow")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Ideas to submit in total.")
+    parser.add_argument("--num-results", type=int, default=5, help="Patents passed to each analysis.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--output", help="Where to write the JSON result; defaults to benchmarks/results/.")
+    parser.add_argument("--compare", help="A previous result JSON to print deltas against.")
+    parser.add_argument("--label", default="", help="Free text stored with the result, e.g. the config under test.")
+
+
+def run(url: str, args, environment: dict = None) -> dict:
+    print(f"Running '{args.scenario}' against {url}: {args.requests} ideas at concurrency {args.concurrency}...")
+    result = asyncio.run(run_load(url, args.scenario, args.concurrency, args.requests, args.timeout, args.num_results))
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "label": args.label,
+        "args": {key: getattr(args, key) for key in ("scenario", "concurrency", "requests", "num_results")},
+        "environment": environment or {},
+        **result,
+    }
+    print_report(result)
+    print(f"\nResult written to {save(result, args.output)}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(result, json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the backend under test.")
+    add_arguments(parser)
+    args = parser.parse_args()
+    run(args.url, args)
@@ -0,0 +1,122 @@
+"""
+Runs the load test end to end with no Atlas, Gemini or Together AI access:
+
+  1. builds (or reuses) a synthetic local index, the stand-in for $vectorSearch
+  2. starts benchmarks/fake_llm_server.py for both LLM providers
+  3. starts the backend with uvicorn, pointed at both stand-ins
+  4. runs benchmarks/load_test.py and stores the result JSON, then stops both servers
+
+Queries are still embedded by the real local model, so the embedding stage is measured as in
+production. Extra backend settings under test are passed with --env, e.g. --env RETRIEVAL_MODE=hybrid.
+Run from the backend directory:
+
+    python -m benchmarks.offline_suite --count 100000 --scenario flow --concurrency 16 --requests 200
+    python -m benchmarks.offline_suite --latency-ms 800 --gemini-failure-rate 0.2 --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from . import fake_llm_server, load_test, synthetic_index
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float):
+    """Polls `url` until it answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before it came up.")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s.")
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def fake_server_command(args) -> list[str]:
+    """Forwards the fake server's own options, parsed alongside the suite's, to its command line."""
+    options = argparse.ArgumentParser(add_help=False)
+    fake_llm_server.add_arguments(options)
+    command = [sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(args.llm_port)]
+    for action in options._actions:
+        value = getattr(args, action.dest)
+        if value is not None:
+            command += [action.option_strings[0], str(value)]
+    return command
+
+
+def backend_environment(args, dirs: dict) -> dict:
+    llm_url = f"http://127.0.0.1:{args.llm_port}"
+    overrides = {
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_DIR": dirs["local_index_dir"],
+        "GEMINI_API_ENDPOINT": llm_url,
+        "TOGETHER_BASE_URL": f"{llm_url}/v1",
+        "GOOGLE_API_KEY": "offline-benchmark",
+        "TOGETHER_API_KEY": "offline-benchmark",
+        # A warm on-disk embedding cache from an earlier run would hide the embedding cost.
+        "EMBEDDING_CACHE_PATH": "",
+    }
+    if dirs["lexical_index_dir"]:
+        overrides.update(RETRIEVAL_MODE="hybrid", LEXICAL_INDEX_DIR=dirs["lexical_index_dir"])
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        overrides[key] = value
+    return overrides
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="Patents in the synthetic index.")
+    parser.add_argument("--index-dir", default=os.path.join(tempfile.gettempdir(), "patent_checker_bench_index"))
+    parser.add_argument("--hybrid", action="store_true", help="Also build a BM25 index and run RETRIEVAL_MODE=hybrid.")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the backend.")
+    parser.add_argument("--backend-port", type=int, default=8000)
+    parser.add_argument("--llm-port", type=int, default=8001)
+    parser.add_argument("--startup-timeout", type=float, default=180.0, help="Seconds to wait for the model to load.")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend setting.")
+    fake_llm_server.add_arguments(parser)
+    load_test.add_arguments(parser)
+    args = parser.parse_args()
+
+    dirs = synthetic_index.build(args.index_dir, args.count, lexical=args.hybrid)
+    overrides = backend_environment(args, dirs)
+    backend_url = f"http://127.0.0.1:{args.backend_port}"
+
+    fake_server = subprocess.Popen(fake_server_command(args), cwd=BACKEND_DIR)
+    backend = None
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.llm_port}/stats", fake_server, 30)
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.backend_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env={**os.environ, **overrides},
+        )
+        # /ready turns 200 once the embedding model and indexes are loaded, so nothing timed is cold.
+        wait_until_up(f"{backend_url}/ready", backend, args.startup_timeout)
+        environment = {"index_count": args.count, "workers": args.workers, "backend_env": overrides,
+                       "fake_llm": httpx.get(f"http://127.0.0.1:{args.llm_port}/stats").json()}
+        load_test.run(backend_url, args, environment)
+        print(f"\nFake LLM server counters: {httpx.get(f'http://127.0.0.1:{args.llm_port}/stats').json()}")
+    finally:
+        if backend is not None:
+            stop(backend)
+        stop(fake_server)
@@ -0,0 +1,107 @@
+"""
+Builds a synthetic patent corpus as a local vector index (and optionally a lexical index), the
+offline stand-in for Atlas $vectorSearch: with VECTOR_BACKEND=local and LOCAL_INDEX_DIR pointing
+here, retrieval runs against it exactly as against a real local index.
+
+Titles and abstracts are generated from a fixed technical vocabulary and vectors are clustered
+random unit vectors, so building needs no model or network. Neighbours are not semantically
+meaningful, but the work done per search (and its cost) is the same as on real data.
+Run from the backend directory:
+
+    python -m benchmarks.synthetic_index --count 100000 --output /tmp/bench_index --lexical
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+INGESTION_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data_ingestion"))
+# all-MiniLM-L6-v2, the model the backend embeds queries with.
+DEFAULT_DIM = 384
+
+_VOCABULARY = (
+    "sensor actuator controller battery electrode polymer substrate membrane valve pump rotor stator "
+    "antenna waveform signal processor memory circuit transistor laser optical fiber lens coating alloy "
+    "catalyst reactor turbine blade bearing gear spring hinge housing module interface wireless network "
+    "protocol encryption vehicle drone robot gripper camera image neural model training inference "
+    "thermal cooling heating fluid pressure flow filter coupling adhesive composite ceramic magnet coil "
+    "frequency voltage current charging semiconductor wafer etching deposition implant catheter stent"
+).split()
+_CONNECTORS = ("configured to", "coupled to", "comprising", "adjacent to", "for controlling", "wherein the")
+
+
+def _sentence(rng: np.random.Generator, words: int) -> str:
+    parts = []
+    for _ in range(words):
+        parts.append(_VOCABULARY[rng.integers(len(_VOCABULARY))])
+        if rng.random() < 0.15:
+            parts.append(_CONNECTORS[rng.integers(len(_CONNECTORS))])
+    return " ".join(parts)
+
+
+def synthetic_metadata(count: int, seed: int):
+    """Yields {publication_number, title, abstract} dicts; the same seed always gives the same corpus."""
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        abstract = ". ".join(_sentence(rng, int(rng.integers(12, 30))) for _ in range(int(rng.integers(3, 7)))) + "."
+        yield {
+            "publication_number": f"US-{10_000_000 + i}-B2",
+            "title": _sentence(rng, int(rng.integers(4, 9))).capitalize(),
+            "abstract": abstract.capitalize(),
+        }
+
+
+def synthetic_documents(count: int, dim: int, clusters: int, seed: int):
+    """Yields (metadata, unit vector) pairs, the shape build_local_index.build_index consumes."""
+    # Vectors come from their own generator so the text does not depend on `dim`.
+    rng = np.random.default_rng(seed + 1)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for metadata in synthetic_metadata(count, seed):
+        vector = centers[rng.integers(clusters)] + 0.6 * rng.standard_normal(dim).astype(np.float32)
+        yield metadata, vector / np.linalg.norm(vector)
+
+
+def build(output_dir: str, count: int, dim: int = DEFAULT_DIM, clusters: int = 256, seed: int = 7,
+          lexical: bool = False, quantize: str = "none") -> dict:
+    """
+    Writes the vector index to `output_dir` and, with `lexical`, a BM25 index to
+    `output_dir`/lexical. Returns the directories to set as LOCAL_INDEX_DIR / LEXICAL_INDEX_DIR.
+    An index already built with the same parameters is reused.
+    """
+    dirs = {"local_index_dir": output_dir, "lexical_index_dir": os.path.join(output_dir, "lexical") if lexical else None}
+    spec = {"count": count, "dim": dim, "clusters": clusters, "seed": seed, "quantize": quantize}
+    spec_path = os.path.join(output_dir, "synthetic.json")
+    if os.path.exists(spec_path):
+        with open(spec_path, encoding="utf-8") as f:
+            built = json.load(f)
+        if built in ({**spec, "lexical": lexical}, {**spec, "lexical": True}):
+            print(f"Reusing synthetic index in '{output_dir}'.")
+            return dirs
+
+    # The ingestion scripts are standalone modules that import their siblings by name.
+    sys.path.insert(0, INGESTION_DIR)
+    import build_lexical_index
+    import build_local_index
+
+    build_local_index.build_index(count, synthetic_documents(count, dim, clusters, seed), output_dir,
+                                  "float32", build_local_index.ANN_THRESHOLD, quantize)
+    if lexical:
+        build_lexical_index.build_index(synthetic_metadata(count, seed), dirs["lexical_index_dir"], count)
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump({**spec, "lexical": lexical}, f)
+    return dirs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="Directory to write the index to.")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--lexical", action="store_true", help="Also build a BM25 index for RETRIEVAL_MODE=hybrid.")
+    parser.add_argument("--quantize", choices=["none", "int8", "binary", "all"], default="none")
+    args = parser.parse_args()
+    build(args.output, args.count, args.dim, args.clusters, args.seed, args.lexical, args.quantize)
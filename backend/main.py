@@ -1,12 +1,39 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from app.api import analyst
+from app.core import config, executors, log, metrics, timing
+from app.services import mongo_service, warmup
+
+log.configure(config.LOG_LEVEL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled MongoDB client per worker process, opened here and closed on shutdown.
+    await mongo_service.connect()
+    # The model and indexes load in the background so the worker starts accepting connections
+    # at once; load balancers should route to it only after /ready returns 200.
+    warmup_task = None
+    if config.WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(warmup.run())
+    else:
+        warmup.mark_ready()
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await mongo_service.close()
+    executors.shutdown()
+    log.shutdown()
 
 app = FastAPI(
     title="PatentAI Analyst API",
     version="3.0.0-FINAL",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 # --- THE DEFINITIVE CORS FIX ---
@@ -19,12 +46,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods (POST, GET, etc.)
     allow_headers=["*"],  # Allow all headers
+    # 503 backoff hints, per-stage timings and the id to quote when reporting a failed request
+    expose_headers=["Retry-After", "Server-Timing", "X-Request-ID"],
 )
 # -----------------------------
 
+# Gives every request an id (echoed in X-Request-ID and on every log line) and reports where it
+# spent its time (embedding, retrieval, llm, validation) in a Server-Timing header, read by
+# browser dev tools and by benchmarks/load_test.py. Durations also feed the /metrics histograms.
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    request_id = log.new_request_id(request.headers.get("x-request-id"))
+    stages = timing.start_request()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        # Labelled by the endpoint that handled it, not the raw path, so label values stay bounded.
+        endpoint = request.scope.get("endpoint")
+        handler = endpoint.__name__ if endpoint is not None else "unmatched"
+        metrics.REQUEST_SECONDS.observe(elapsed, method=request.method, handler=handler, status=status)
+    stages["total"] = elapsed
+    response.headers["Server-Timing"] = timing.server_timing_header(stages)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # All endpoints from 'analyst.py' are now covered by the middleware above.
 app.include_router(analyst.router, prefix="/api")
 
+@app.get("/ready", include_in_schema=False)
+def read_ready():
+    """Readiness probe: 503 until this worker's warm-up has finished, then 200."""
+    snapshot = warmup.state.snapshot()
+    return JSONResponse(snapshot, status_code=200 if warmup.state.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/", tags=["Root"], include_in_schema=False)
 def read_root():
     return {"message": "PatentAI Analyst API is running and CORS is correctly configured."}
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+The pieces ingestion must share with the backend (model loading and fingerprint, tokenizer,
+quantizers, embedding server client), from backend/app/shared.py. That module imports nothing else from the backend, so
+this puts backend/ on sys.path without loading the backend's settings or services.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.shared import (EMBEDDING_BACKENDS, EmbeddingClient, EmbeddingServerOverloaded,  # noqa: E402
+                        binarize, embedding_model_id, load_model, quantize_int8, tokenize)
+
+__all__ = ["EMBEDDING_BACKENDS", "EmbeddingClient", "EmbeddingServerOverloaded", "binarize", "embedding_model_id",
+           "load_model", "quantize_int8", "tokenize"]
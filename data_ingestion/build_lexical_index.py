@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+from array import array
+import numpy as np
+from collections import Counter
+from dotenv import load_dotenv, find_dotenv
+from tqdm import tqdm
+from backend_shared import tokenize
+from pipeline import iter_jsonl
+from patent_metadata import FILTER_FIELDS, FilterColumnsWriter
+
+load_dotenv(find_dotenv())
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "patent_db")
+MONGO_COLLECTION = "patents"
+INPUT_JSON_FILE = "data_ingestion/patents.json"
+OUTPUT_DIR = "data_ingestion/lexical_index"
+# Standard BM25 parameters: term-frequency saturation and document-length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+class LexicalIndexBuilder:
+    """
+    Accumulates (term, row, tf) triples in flat arrays while documents stream past, then writes
+    term-major postings with precomputed BM25 impacts. Metadata is written as documents arrive,
+    so only the postings triples are held in memory.
+    """
+
+    def __init__(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.vocabulary = {}
+        self.term_column = array('i')
+        self.row_column = array('i')
+        self.tf_column = array('H')
+        self.lengths = array('i')
+        self.metadata_offsets = array('q', [0])
+        self._metadata_file = open(os.path.join(output_dir, "metadata.jsonl"), 'wb')
+        self.filters = FilterColumnsWriter(output_dir)
+
+    def add(self, document: dict):
+        row = len(self.lengths)
+        tokens = tokenize(f"{document.get('title') or ''} {document.get('abstract') or ''}")
+        for term, tf in Counter(tokens).items():
+            self.term_column.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self.row_column.append(row)
+            self.tf_column.append(min(tf, 65535))
+        self.lengths.append(len(tokens))
+        metadata = {"publication_number": document.get('publication_number'), "title": document.get('title'),
+                    "abstract": document.get('abstract'),
+                    **{field: document[field] for field in ("cluster_id", "family_members") if document.get(field)}}
+        self._metadata_file.write(json.dumps(metadata, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.metadata_offsets.append(self._metadata_file.tell())
+        self.filters.add(document)
+
+    def finish(self):
+        self._metadata_file.close()
+        count = len(self.lengths)
+        terms = np.frombuffer(self.term_column, dtype=np.int32)
+        rows = np.frombuffer(self.row_column, dtype=np.int32)
+        tfs = np.frombuffer(self.tf_column, dtype=np.uint16).astype(np.float32)
+        lengths = np.frombuffer(self.lengths, dtype=np.int32).astype(np.float32)
+
+        # Rows were appended in order, so a stable sort by term keeps rows ascending per term.
+        order = np.argsort(terms, kind='stable')
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        document_frequency = np.bincount(terms, minlength=len(self.vocabulary))
+        postings_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=postings_offsets[1:])
+
+        average_length = float(lengths.mean()) if count else 0.0
+        idf = np.log(1.0 + (count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[rows] / max(average_length, 1e-9))
+        impacts = (idf[terms] * tfs * (BM25_K1 + 1.0) / (tfs + norm)).astype(np.float32)
+        max_impacts = np.maximum.reduceat(impacts, postings_offsets[:-1]) if len(impacts) else np.empty(0, np.float32)
+
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(os.path.join(self.output_dir, "terms.json"), 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        np.save(os.path.join(self.output_dir, "postings_offsets.npy"), postings_offsets)
+        np.save(os.path.join(self.output_dir, "postings_docs.npy"), rows)
+        np.save(os.path.join(self.output_dir, "postings_impacts.npy"), impacts)
+        np.save(os.path.join(self.output_dir, "max_impacts.npy"), max_impacts.astype(np.float32))
+        np.save(os.path.join(self.output_dir, "metadata_offsets.npy"), np.frombuffer(self.metadata_offsets, dtype=np.int64))
+        self.filters.finish()
+        manifest = {"count": count, "terms": len(vocabulary), "postings": int(len(rows)),
+                    "average_length": round(average_length, 3), "k1": BM25_K1, "b": BM25_B}
+        with open(os.path.join(self.output_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"Lexical index written to '{self.output_dir}': {count} patents, {len(vocabulary)} terms, "
+              f"{len(rows)} postings.")
+
+def build_index(documents, output_dir: str, total: int = None):
+    builder = LexicalIndexBuilder(output_dir)
+    for document in tqdm(documents, total=total, desc="Indexing title + abstract"):
+        builder.add(document)
+    builder.finish()
+
+def build_from_collection(collection, output_dir: str = OUTPUT_DIR):
+    """Indexes everything already ingested into `collection`; the ingestion scripts call this."""
+    query = {"abstract": {"$exists": True}}
+    projection = {"_id": 0, "publication_number": 1, "title": 1, "abstract": 1, "cluster_id": 1, "family_members": 1,
+                  **dict.fromkeys(FILTER_FIELDS, 1)}
+    build_index(collection.find(query, projection, batch_size=1000), output_dir, collection.count_documents(query))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the BM25 index used when RETRIEVAL_MODE=hybrid.")
+    parser.add_argument("--source", choices=["mongo", "jsonl"], default="mongo")
+    parser.add_argument("--input", default=INPUT_JSON_FILE, help="JSONL file to index when --source=jsonl.")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    if args.source == "mongo":
+        from pymongo import MongoClient
+        if not MONGO_URI:
+            raise ValueError("MONGO_URI not found in .env file!")
+        client = MongoClient(MONGO_URI)
+        try:
+            build_from_collection(client[MONGO_DB_NAME][MONGO_COLLECTION], args.output)
+        finally:
+            client.close()
+    else:
+        build_index((row for row in iter_jsonl(args.input) if row.get('abstract')), args.output)
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from tqdm import tqdm
+from backend_shared import EMBEDDING_BACKENDS, binarize, quantize_int8
+from pipeline import batched, iter_jsonl, load_sentence_transformer
+from patent_metadata import FILTER_FIELDS, FilterColumnsWriter, metadata_fields
+
+load_dotenv(find_dotenv())
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "patent_db")
+MONGO_COLLECTION = "patents"
+INPUT_JSON_FILE = "data_ingestion/patents.json"
+OUTPUT_DIR = "data_ingestion/local_index"
+ENCODE_BATCH_SIZE = 64
+# Corpora at least this large also get an HNSW graph; smaller ones are searched exactly.
+ANN_THRESHOLD = 50000
+
+def iter_mongo_documents():
+    """Yields (metadata, embedding) pairs from the already-ingested Atlas collection."""
+    from pymongo import MongoClient
+    if not MONGO_URI:
+        raise ValueError("MONGO_URI not found in .env file!")
+    client = MongoClient(MONGO_URI)
+    collection = client[MONGO_DB_NAME][MONGO_COLLECTION]
+    # Collections ingested with --drop-full only hold int8 codes; those are dequantized.
+    query = {"$or": [{"embedding": {"$exists": True}}, {"embedding_int8": {"$exists": True}}]}
+    projection = {"_id": 0, "publication_number": 1, "title": 1, "abstract": 1, "cluster_id": 1, "family_members": 1,
+                  **dict.fromkeys(FILTER_FIELDS, 1), "embedding": 1, "embedding_int8": 1, "embedding_scale": 1}
+    total = collection.count_documents(query)
+    def generate():
+        try:
+            for doc in collection.find(query, projection, batch_size=1000):
+                embedding = doc.pop("embedding", None)
+                codes = doc.pop("embedding_int8", None)
+                scale = doc.pop("embedding_scale", 1.0)
+                if embedding is None:
+                    embedding = np.asarray(codes.as_vector().data, dtype=np.float32) * scale
+                yield doc, embedding
+        finally:
+            client.close()
+    return total, generate()
+
+def _read_jsonl_rows(path: str):
+    return (row for row in iter_jsonl(path) if row.get('abstract'))
+
+def iter_jsonl_documents(path: str, backend: str = "torch"):
+    """Yields (metadata, embedding) pairs by embedding the same JSONL that ingest_from_file.py reads."""
+    total = sum(1 for _ in _read_jsonl_rows(path))
+    print(f"Loading local AI model (all-MiniLM-L6-v2, {backend} backend). This may take a moment...")
+    model = load_sentence_transformer(backend)
+    def generate():
+        for batch in batched(_read_jsonl_rows(path), ENCODE_BATCH_SIZE):
+            yield from _encode_batch(model, batch)
+    return total, generate()
+
+def _encode_batch(model, rows):
+    vectors = model.encode([row['abstract'] for row in rows], batch_size=len(rows))
+    for row, vector in zip(rows, vectors):
+        metadata = {"publication_number": row.get('publication_number'), "title": row.get('title'),
+                    "abstract": row.get('abstract'), **metadata_fields(row)}
+        yield metadata, vector
+
+def build_index(total: int, documents, output_dir: str, dtype: str, ann_threshold: int, quantize: str = "none"):
+    if total == 0:
+        print("No documents with embeddings found; nothing to index.")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    embeddings = None
+    offsets = np.zeros(total + 1, dtype=np.int64)
+    count = 0
+    filters = FilterColumnsWriter(output_dir)
+
+    with open(os.path.join(output_dir, "metadata.jsonl"), 'wb') as metadata_file:
+        for metadata, embedding in tqdm(documents, total=total, desc="Writing local index"):
+            if count >= total:
+                break
+            vector = np.asarray(embedding, dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(
+                    os.path.join(output_dir, "embeddings.npy"), mode='w+', dtype=dtype, shape=(total, vector.shape[0])
+                )
+            norm = np.linalg.norm(vector)
+            embeddings[count] = vector / norm if norm > 0 else vector
+            # Filter fields become columns (see patent_metadata.py) instead of metadata.
+            filters.add(metadata)
+            metadata = {key: value for key, value in metadata.items() if key not in FILTER_FIELDS}
+            metadata_file.write(json.dumps(metadata, ensure_ascii=False).encode('utf-8') + b"\n")
+            offsets[count + 1] = metadata_file.tell()
+            count += 1
+
+    if count < total:
+        raise RuntimeError(f"Expected {total} documents but only read {count}; the source changed during the build.")
+    embeddings.flush()
+    np.save(os.path.join(output_dir, "metadata_offsets.npy"), offsets)
+    filters.finish()
+
+    ann = None
+    if count >= ann_threshold:
+        ann = _build_hnsw(embeddings, os.path.join(output_dir, "hnsw.bin"))
+    elif os.path.exists(os.path.join(output_dir, "hnsw.bin")):
+        os.remove(os.path.join(output_dir, "hnsw.bin"))
+
+    quantized = _write_quantized(embeddings, output_dir, quantize)
+
+    manifest = {"count": count, "dim": int(embeddings.shape[1]), "dtype": dtype, "normalized": True, "ann": ann,
+                "quantized": quantized}
+    with open(os.path.join(output_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Local index written to '{output_dir}': {count} patents, dtype={dtype}, ann={ann or 'none (exact search)'}.")
+
+def _write_quantized(embeddings, output_dir: str, quantize: str) -> list[str]:
+    """Writes int8 codes (+ per-row scales) and/or packed sign bits next to the full matrix."""
+    modes = ["int8", "binary"] if quantize == "all" else [] if quantize == "none" else [quantize]
+    count, dim = embeddings.shape
+    layouts = {"int8": ("embeddings_int8.npy", np.int8, dim), "binary": ("embeddings_bits.npy", np.uint8, (dim + 7) // 8)}
+    outputs = {}
+    for mode, (name, dtype, width) in layouts.items():
+        path = os.path.join(output_dir, name)
+        if mode in modes:
+            outputs[mode] = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(count, width))
+        elif os.path.exists(path):
+            os.remove(path)
+    if not outputs:
+        return modes
+    scales = np.empty(count, dtype=np.float32)
+    for start in tqdm(range(0, count, 10000), desc="Quantizing"):
+        block = np.asarray(embeddings[start:start + 10000], dtype=np.float32)
+        end = start + len(block)
+        if "int8" in outputs:
+            outputs["int8"][start:end], scales[start:end] = quantize_int8(block)
+        if "binary" in outputs:
+            outputs["binary"][start:end] = binarize(block)
+    for codes in outputs.values():
+        codes.flush()
+    if "int8" in outputs:
+        np.save(os.path.join(output_dir, "int8_scales.npy"), scales)
+    return modes
+
+def _build_hnsw(embeddings, path: str):
+    try:
+        import hnswlib
+    except ImportError:
+        print("hnswlib is not installed; the backend will fall back to exact search.")
+        return None
+    count, dim = embeddings.shape
+    graph = hnswlib.Index(space='ip', dim=dim)
+    graph.init_index(max_elements=count, ef_construction=200, M=16)
+    for start in tqdm(range(0, count, 10000), desc="Building HNSW graph"):
+        block = np.asarray(embeddings[start:start + 10000], dtype=np.float32)
+        graph.add_items(block, np.arange(start, start + len(block)))
+    graph.save_index(path)
+    return "hnsw"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped index used when VECTOR_BACKEND=local.")
+    parser.add_argument("--source", choices=["mongo", "jsonl"], default="mongo")
+    parser.add_argument("--input", default=INPUT_JSON_FILE, help="JSONL file to embed when --source=jsonl.")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="torch",
+                        help="Inference backend for --source=jsonl; match the backend's EMBEDDING_BACKEND.")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--ann-threshold", type=int, default=ANN_THRESHOLD)
+    parser.add_argument("--quantize", choices=["none", "int8", "binary", "all"], default="none",
+                        help="Also write quantized codes for VECTOR_QUANTIZATION (all = int8 and binary).")
+    args = parser.parse_args()
+
+    if args.source == "mongo":
+        total, documents = iter_mongo_documents()
+    else:
+        total, documents = iter_jsonl_documents(args.input, args.backend)
+    build_index(total, documents, args.output, args.dtype, args.ann_threshold, args.quantize)
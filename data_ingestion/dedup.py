@@ -0,0 +1,221 @@
+import argparse
+import re
+import time
+import zlib
+from collections import Counter
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+from pipeline import batched, iter_jsonl
+from incremental import content_hash
+
+# Signatures are stored on canonical documents, so these must not change between runs.
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+MINHASH_SEED = 1
+DEFAULT_THRESHOLD = 0.8
+CLUSTER_WRITE_CHUNK = 1000
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+class MinHasher:
+    """MinHash signatures over word 3-grams: the share of equal slots estimates Jaccard similarity."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = MINHASH_SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingles(text)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * h + b) mod p, truncated to 32 bits; the multiplication may wrap, which keeps it a valid hash family.
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def choose_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    (bands, rows per band) for LSH banding. Two signatures share a bucket with probability
+    1 - (1 - s^rows)^bands at Jaccard s; this picks the split whose false positives below
+    `threshold` plus false negatives above it are smallest.
+    """
+    def area(curve, low, high):
+        s = np.linspace(low, high, 200)
+        return float(np.mean(curve(s)) * (high - low))
+
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            collide = lambda s: 1 - (1 - s ** rows) ** bands
+            error = area(collide, 0.0, threshold) + area(lambda s: 1 - collide(s), threshold, 1.0)
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    Streaming near-duplicate clustering. Each patent is compared only with the canonical patents
+    sharing one of its LSH buckets, so a corpus is clustered in about linear time. A patent whose
+    estimated Jaccard similarity to a canonical one is at least `threshold`, or that shares its
+    `family_id`, joins that cluster; otherwise it becomes the canonical patent of a new cluster.
+    Only canonical signatures are kept, so memory grows with the deduplicated corpus.
+    Clusters loaded by seed() are only written again when they gain members.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self._families = {}
+        self._hashes = {}  # seeded canonical publication_number -> stored content_hash
+        self._stored_members = {}  # seeded canonical publication_number -> stored family_members
+        self._new = set()  # canonical patents first seen this run
+        self.members = {}  # canonical publication_number -> member publication_numbers seen this run
+        self.seen = 0
+        self.duplicates = 0
+        self.family_matches = 0
+        self.seconds = 0.0
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, hash(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+
+    def _add_canonical(self, publication_number: str, signature: np.ndarray, family_id=None):
+        self._signatures[publication_number] = signature
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, publication_number)
+        if family_id:
+            self._families.setdefault(family_id, publication_number)
+
+    def _nearest(self, signature: np.ndarray):
+        candidates = {self._buckets[band].get(key) for band, key in self._band_keys(signature)} - {None}
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def seed(self, collection) -> int:
+        """Loads the canonical patents an earlier run stored, so an incremental run clusters against them."""
+        loaded = 0
+        width = len(self.hasher.a) * 4
+        projection = {"_id": 0, "publication_number": 1, "minhash": 1, "family_id": 1, "content_hash": 1, "family_members": 1}
+        for doc in collection.find({"minhash": {"$exists": True}}, projection):
+            if len(doc["minhash"]) == width:
+                number = doc["publication_number"]
+                self._add_canonical(number, np.frombuffer(doc["minhash"], dtype=np.uint32), doc.get("family_id"))
+                self._hashes[number] = doc.get("content_hash")
+                if doc.get("family_members"):
+                    self._stored_members[number] = set(doc["family_members"])
+                loaded += 1
+        return loaded
+
+    def assign(self, row: dict):
+        """Returns the canonical publication_number `row` duplicates, or None if `row` is canonical."""
+        started = time.perf_counter()
+        self.seen += 1
+        number = row['publication_number']
+        try:
+            if number in self._signatures:
+                # Already canonical (an earlier or resumed run stored it): it keeps its own cluster,
+                # but a changed abstract needs a new signature, stored when the patent is re-embedded.
+                if number in self._hashes and self._hashes[number] != content_hash(row.get('title'), row.get('abstract')):
+                    self._add_canonical(number, self.hasher.signature(row.get('abstract')))
+                    del self._hashes[number]
+                return None
+            family_id = row.get('family_id')
+            canonical = self._families.get(family_id) if family_id else None
+            if canonical is not None:
+                self.family_matches += 1
+            else:
+                signature = self.hasher.signature(row.get('abstract'))
+                canonical = self._nearest(signature)
+                if canonical is None:
+                    self._add_canonical(number, signature, family_id)
+                    self._new.add(number)
+                    self.members.setdefault(number, [])
+                    return None
+            self.duplicates += 1
+            if number not in self._stored_members.get(canonical, ()):
+                self.members.setdefault(canonical, []).append(number)
+            return canonical
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def canonical_rows(self, rows):
+        """Streams the canonical rows of `rows`, each carrying its cluster fields; duplicates are only recorded."""
+        for row in rows:
+            if self.assign(row) is None:
+                yield {**row, **self.cluster_fields(row['publication_number'])}
+
+    def cluster_fields(self, publication_number: str) -> dict:
+        return {"cluster_id": publication_number, "minhash": Binary(self._signatures[publication_number].tobytes())}
+
+    def write_clusters(self, collection, incremental: bool = True):
+        """
+        Records the new member publication numbers of each cluster on its canonical document. An
+        incremental run also sets cluster_id and the signature on new canonical patents it did not
+        re-embed, and removes the new members' own documents, since their canonical now stands for
+        them. Clusters that neither gained members nor are new are not written.
+        """
+        members = [number for numbers in self.members.values() for number in numbers]
+        updates = (
+            UpdateOne({"publication_number": canonical},
+                      {"$set": self.cluster_fields(canonical), "$addToSet": {"family_members": {"$each": numbers}}})
+            for canonical, numbers in self.members.items() if numbers or (incremental and canonical in self._new)
+        )
+        for chunk in batched(updates, CLUSTER_WRITE_CHUNK):
+            collection.bulk_write(chunk, ordered=False)
+        if incremental:
+            for chunk in batched(members, CLUSTER_WRITE_CHUNK):
+                collection.delete_many({"publication_number": {"$in": chunk}})
+
+    def report(self) -> dict:
+        ratio = self.duplicates / self.seen if self.seen else 0.0
+        return {
+            "rows": self.seen,
+            "clusters": len(self.members),
+            "duplicates": self.duplicates,
+            "family_matches": self.family_matches,
+            "dedup_ratio": round(ratio, 4),
+            "bands": self.bands,
+            "rows_per_band": self.rows,
+            "rows_per_sec": round(self.seen / self.seconds, 1) if self.seconds else None,
+        }
+
+    def print_report(self):
+        r = self.report()
+        print(f"Dedup: {r['rows']} patents -> {r['rows'] - r['duplicates']} canonical, {r['duplicates']} near-duplicates or "
+              f"family members ({r['dedup_ratio']:.1%}), {r['family_matches']} by family_id; "
+              f"MinHash/LSH at {r['rows_per_sec']} patents/sec ({r['bands']} bands x {r['rows_per_band']} rows).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the near-duplicate clusters of a patents JSONL file without ingesting it.")
+    parser.add_argument("--input", default="data_ingestion/patents.json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Estimated Jaccard similarity of word 3-grams.")
+    parser.add_argument("--show", type=int, default=5, help="Largest clusters to list.")
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.threshold)
+    for row in iter_jsonl(args.input):
+        if row.get('abstract') and row.get('publication_number'):
+            index.assign(row)
+    index.print_report()
+    for canonical, numbers in Counter({c: len(m) for c, m in index.members.items() if m}).most_common(args.show):
+        print(f"  {canonical}: {numbers} members, e.g. {', '.join(index.members[canonical][:5])}")
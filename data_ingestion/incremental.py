@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from patent_metadata import FILTER_FIELDS, absent_fields, update_operators
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".checkpoints")
+
+
+def content_hash(title, abstract) -> str:
+    """Fingerprint of the fields that feed the embedding; a change here means re-embedding."""
+    return hashlib.sha256(f"{title or ''}\x00{abstract or ''}".encode('utf-8')).hexdigest()
+
+
+def ensure_publication_index(collection):
+    """Upserts look documents up by publication_number, so that lookup must be indexed."""
+    try:
+        collection.create_index([("publication_number", ASCENDING)], unique=True, name="publication_number_unique")
+    except OperationFailure as e:
+        print(f"Could not create a unique publication_number index ({e}); falling back to a non-unique one.")
+        collection.create_index([("publication_number", ASCENDING)], name="publication_number")
+
+
+def split_unchanged(collection, rows: list, model_id: str, key=lambda row: row) -> tuple[list, int]:
+    """
+    Returns (rows that need embedding, number skipped). A row is skipped when a document with the
+    same publication_number already stores the same content hash and embedding model.
+    `key` maps a row to a dict with publication_number, title and abstract.
+    """
+    fields = [key(row) for row in rows]
+    numbers = [f.get('publication_number') for f in fields]
+    existing = {
+        doc['publication_number']: (doc.get('content_hash'), doc.get('embedding_model'))
+        for doc in collection.find(
+            {"publication_number": {"$in": numbers}},
+            {"_id": 0, "publication_number": 1, "content_hash": 1, "embedding_model": 1},
+        )
+    }
+    changed = [
+        row for row, f in zip(rows, fields)
+        if existing.get(f.get('publication_number')) != (content_hash(f.get('title'), f.get('abstract')), model_id)
+    ]
+    return changed, len(rows) - len(changed)
+
+
+def with_fingerprint(document: dict, model_id: str) -> dict:
+    document["content_hash"] = content_hash(document.get('title'), document.get('abstract'))
+    document["embedding_model"] = model_id
+    document["ingested_at"] = datetime.now(timezone.utc)
+    return document
+
+
+def _stored_value(value):
+    # pymongo hands datetimes back naive (in UTC), so aware ones are compared the same way.
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def set_fields(collection, documents: list) -> int:
+    """
+    Sets the fields of each document on the stored patent with its publication_number, without
+    inserting missing ones. Used to refresh metadata on patents that were not re-embedded, so
+    only patents whose stored values differ are written. Filter fields a document lacks are
+    removed from the stored patent. Returns the number updated.
+    """
+    if not documents:
+        return 0
+    projection = {"_id": 0, "publication_number": 1, **dict.fromkeys(FILTER_FIELDS, 1),
+                  **{field: 1 for doc in documents for field in doc}}
+    stored = {doc['publication_number']: doc for doc in collection.find(
+        {"publication_number": {"$in": [doc['publication_number'] for doc in documents]}}, projection)}
+
+    def differs(doc, old):
+        return any(_stored_value(value) != _stored_value(old.get(field)) for field, value in doc.items()) \
+            or any(field in old for field in absent_fields(doc))
+
+    updates = [
+        UpdateOne({"publication_number": doc['publication_number']}, update_operators(doc))
+        for doc in documents
+        if doc['publication_number'] in stored and differs(doc, stored[doc['publication_number']])
+    ]
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def upsert_documents(collection, documents: list):
+    if not documents:
+        return
+    collection.bulk_write(
+        [UpdateOne({"publication_number": doc['publication_number']}, update_operators(doc), upsert=True)
+         for doc in documents],
+        ordered=False,
+    )
+
+
+class Checkpoint:
+    """
+    Remembers how far a run has durably written so a crashed run resumes where it stopped.
+    The file is replaced atomically and written at most once per `interval` seconds.
+    """
+
+    def __init__(self, name: str, source: str, interval: float = 5.0):
+        self.path = os.path.join(CHECKPOINT_DIR, f"{name}.json")
+        self.source = source
+        self.interval = interval
+        self._last_write = 0.0
+
+    def load(self) -> int:
+        """Returns the saved position, or 0 when there is none or it belongs to a different source."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        return saved.get("position", 0) if saved.get("source") == self.source else 0
+
+    def save(self, position: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_write < self.interval:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": self.source, "position": position}, f)
+        os.replace(temp_path, self.path)
+        self._last_write = now
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,11 +1,20 @@
 
-import json
+import argparse
 import os
-from datetime import datetime
+import threading
+import time
+from itertools import islice
 from dotenv import load_dotenv, find_dotenv
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
+from backend_shared import EMBEDDING_BACKENDS, embedding_model_id
+from pipeline import (ChunkedInserter, batched, iter_jsonl, load_sentence_transformer, make_encoder,
+                      make_remote_encoder, run_pipeline)
+from incremental import (Checkpoint, ensure_publication_index, set_fields, split_unchanged, upsert_documents,
+                         with_fingerprint)
+from patent_metadata import metadata_fields
+from quantization import QUANTIZE_CHOICES, add_quantized_fields
+from build_lexical_index import OUTPUT_DIR as LEXICAL_INDEX_DIR, build_from_collection
+from dedup import DEFAULT_THRESHOLD as DEDUP_THRESHOLD, NearDuplicateIndex
 
 load_dotenv(find_dotenv())
 MONGO_URI = os.getenv("MONGO_URI")
@@ -15,45 +24,157 @@ if not MONGO_URI:
 MONGO_DB_NAME = "patent_db"
 MONGO_COLLECTION = "patents"
 INPUT_JSON_FILE = "data_ingestion/patents.json"
+ENCODE_BATCH_SIZE = 64
+INSERT_CHUNK_SIZE = 1000
 
-def ingest_data():
+def _source_id(path: str) -> str:
+    """Identifies this exact input file, so a checkpoint is never applied to a different file."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def ingest_data(input_path=INPUT_JSON_FILE, batch_size=ENCODE_BATCH_SIZE, insert_chunk_size=INSERT_CHUNK_SIZE,
+                encode_workers=1, processes=1, queue_size=8, full=False, quantize="none", keep_full=True,
+                lexical_index=False, backend="torch", dedup_threshold=DEDUP_THRESHOLD, embedding_server=None):
+    """
+    Incremental by default: upserts by publication_number and only re-embeds patents whose
+    title/abstract or embedding model changed. Progress is checkpointed so a crashed run resumes.
+    With full=True the collection is dropped and rebuilt from scratch.
+    `quantize` also stores int8 or binary codes for quantized search; see quantization.py.
+    With lexical_index=True the BM25 index for hybrid retrieval is rebuilt from the collection.
+    Publication date, country and CPC codes, when the rows carry them, are stored as search filters.
+    Near-duplicate abstracts (estimated Jaccard >= dedup_threshold) and rows sharing a family_id
+    are stored once: the canonical patent lists the others in family_members. 0 disables this.
+    With embedding_server (a Unix socket path) abstracts are encoded by the node's embedding
+    server instead of a model loaded here; `backend` must then name the server's EMBEDDING_BACKEND.
+    """
     client = MongoClient(MONGO_URI)
     collection = client[MONGO_DB_NAME][MONGO_COLLECTION]
-    collection.drop()
 
-    print("Loading local AI model (all-MiniLM-L6-v2). This may take a moment...")
-    model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-    print("Model loaded.")
+    if not os.path.exists(input_path):
+        print(f"ERROR: '{input_path}' not found. Did you run the conversion script first?")
+        return
+    checkpoint = Checkpoint("ingest_from_file", _source_id(input_path))
+    if full:
+        collection.drop()
+        checkpoint.clear()
+    else:
+        ensure_publication_index(collection)
+    deduper = NearDuplicateIndex(dedup_threshold) if dedup_threshold else None
+    if deduper and not full:
+        print(f"Loaded {deduper.seed(collection)} stored canonical patents for deduplication.")
+
+    model_id = embedding_model_id(backend)
+    if embedding_server:
+        print(f"Encoding with the embedding server at '{embedding_server}'.")
+        encode, close_encoder = make_remote_encoder(embedding_server, batch_size)
+    else:
+        print(f"Loading local AI model (all-MiniLM-L6-v2, {backend} backend). This may take a moment...")
+        model = load_sentence_transformer(backend)
+        print("Model loaded.")
+        encode, close_encoder = make_encoder(model, batch_size, processes)
+
+    skipped = 0
+    skipped_lock = threading.Lock()
 
-    docs_to_insert = []
-    print(f"Reading from '{INPUT_JSON_FILE}'...")
+    def embed_batch(rows):
+        nonlocal skipped
+        if not full:
+            changed, unchanged = split_unchanged(collection, rows, model_id)
+            with skipped_lock:
+                skipped += unchanged
+            if unchanged:
+                # Not re-embedded, but their date, country and CPC codes may be new or corrected; only
+                # patents whose stored values differ are written.
+                stale = {id(row) for row in changed}
+                set_fields(collection, [{"publication_number": row['publication_number'], **metadata_fields(row)}
+                                        for row in rows if id(row) not in stale])
+            rows = changed
+            if not rows:
+                return []
+        vectors = encode([row['abstract'] for row in rows])
+        return [add_quantized_fields(with_fingerprint({
+            "publication_number": row.get('publication_number'),
+            "title": row.get('title'),
+            "abstract": row.get('abstract'),
+            "embedding": [float(x) for x in vector],
+            **metadata_fields(row),
+            **{field: row[field] for field in ("family_id", "cluster_id", "minhash") if row.get(field)}
+        }, model_id), quantize, keep_full) for row, vector in zip(rows, vectors)]
+
+    rows = (row for row in iter_jsonl(input_path) if row.get('abstract') and row.get('publication_number'))
+    if deduper:
+        # Before the checkpoint skip, so a resumed run rebuilds the clusters of the rows it skips.
+        rows = deduper.canonical_rows(rows)
+    start = 0 if full else checkpoint.load()
+    if start:
+        print(f"Resuming from checkpoint: skipping the first {start} patents.")
+        rows = islice(rows, start, None)
+
+    mode = "full rebuild" if full else "incremental upsert"
+    print(f"Streaming from '{input_path}' ({mode}, batch size {batch_size}, insert chunks of {insert_chunk_size})...")
+    if full:
+        sink = ChunkedInserter(collection, insert_chunk_size)
+        on_commit = None
+    else:
+        # Upserts are written per batch, so the checkpoint only ever covers durable writes.
+        sink = lambda documents: upsert_documents(collection, documents)
+        on_commit = lambda committed: checkpoint.save(start + committed)
+    started = time.perf_counter()
     try:
-        with open(INPUT_JSON_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        for line in tqdm(lines, desc="Processing and Embedding"):
-            try:
-                row = json.loads(line)
-                if not row.get('abstract'): continue
-
-                embedding_vector = model.encode(row['abstract'])
-                docs_to_insert.append({
-                    "publication_number": row.get('publication_number'),
-                    "title": row.get('title'),
-                    "abstract": row.get('abstract'),
-                    "embedding": [float(x) for x in embedding_vector]
-                })
-            except Exception as e:
-                print(f"Skipping line due to error: {e}")
-
-        if docs_to_insert:
-            print(f"Embedding complete. Inserting {len(docs_to_insert)} documents...")
-            collection.insert_many(docs_to_insert, ordered=False)
-            print("Data ingestion successful!")
-        else:
-            print("No valid documents found to ingest.")
-            
-    except FileNotFoundError:
-        print(f"ERROR: '{INPUT_JSON_FILE}' not found. Did you run the conversion script first?")
+        written, _ = run_pipeline(batched(rows, batch_size), embed_batch, sink, workers=encode_workers,
+                                  queue_size=queue_size, desc="Processing and Embedding", on_commit=on_commit)
+        if full:
+            sink.flush()
+            # Built after the bulk load so duplicate source rows cannot abort the inserts.
+            ensure_publication_index(collection)
+        if deduper:
+            deduper.write_clusters(collection, incremental=not full)
+        checkpoint.clear()
+        if lexical_index:
+            build_from_collection(collection, LEXICAL_INDEX_DIR)
+    finally:
+        close_encoder()
+        client.close()
+    elapsed = time.perf_counter() - started
+
+    if deduper:
+        deduper.print_report()
+        print(f"Ingested {deduper.seen} patents in {elapsed:.1f}s ({deduper.seen / elapsed if elapsed else 0:.1f} patents/sec).")
+    if not full:
+        print(f"{written} new or changed patents embedded, {skipped} unchanged patents skipped.")
+    if written or skipped:
+        print("Data ingestion successful!")
+    else:
+        print("No valid documents found to ingest.")
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Embed patents from a JSONL file and load them into MongoDB.")
+    parser.add_argument("--input", default=INPUT_JSON_FILE)
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE, help="Abstracts per model.encode call.")
+    parser.add_argument("--insert-chunk-size", type=int, default=INSERT_CHUNK_SIZE, help="Documents per insert_many.")
+    parser.add_argument("--encode-workers", type=int, default=1, help="Encoder threads sharing the model.")
+    parser.add_argument("--processes", type=int, default=1, help="Encoder processes (multi-process model pool).")
+    parser.add_argument("--queue-size", type=int, default=8, help="Max batches buffered between pipeline stages.")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="torch",
+                        help="Inference backend for the model; match the backend's EMBEDDING_BACKEND.")
+    parser.add_argument("--full", action="store_true",
+                        help="Drop the collection and rebuild it instead of upserting only new or changed patents.")
+    parser.add_argument("--quantize", choices=QUANTIZE_CHOICES, default="none",
+                        help="Also store int8 or binary codes for VECTOR_QUANTIZATION. Switching needs --full.")
+    parser.add_argument("--drop-full", action="store_true",
+                        help="Store only the int8 codes, not the float vectors (requires --quantize int8).")
+    parser.add_argument("--lexical-index", action="store_true",
+                        help="Rebuild the BM25 index for RETRIEVAL_MODE=hybrid once ingestion finishes.")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Store patents whose abstracts are at least this similar (estimated Jaccard of word "
+                             "3-grams) once, as one cluster; 0 disables deduplication.")
+    parser.add_argument("--embedding-server", metavar="SOCKET",
+                        help="Encode with the node's embedding server on this Unix socket (EMBEDDING_SERVER_SOCKET) "
+                             "instead of loading another copy of the model.")
+    args = parser.parse_args()
+    if args.drop_full and args.quantize != "int8":
+        parser.error("--drop-full requires --quantize int8")
+    ingest_data(args.input, args.batch_size, args.insert_chunk_size, args.encode_workers, args.processes,
+                args.queue_size, full=args.full, quantize=args.quantize, keep_full=not args.drop_full,
+                lexical_index=args.lexical_index, backend=args.backend, dedup_threshold=args.dedup_threshold,
+                embedding_server=args.embedding_server)
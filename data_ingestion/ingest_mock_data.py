@@ -1,8 +1,11 @@
+import argparse
 import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
+from incremental import ensure_publication_index, split_unchanged, upsert_documents, with_fingerprint
+from backend_shared import EMBEDDING_BACKENDS, embedding_model_id
+from pipeline import load_sentence_transformer
 
 load_dotenv() 
 
@@ -21,24 +24,34 @@ mock_patents = [
     {"publication_number": "MOCK-005","title": "Proximity detection for a surgical light","abstract": "A surgical light head and proximity detection method includes a housing, a plurality of light emitting elements arranged in the housing and configured to direct light at a target region of interest, and a plurality of distance sensors arranged in the housing."}
 ]
 
-def ingest_mock_data():
+def ingest_mock_data(full=False, backend="torch"):
     print("Connecting to MongoDB Atlas...")
     client = MongoClient(MONGO_URI)
     db = client[MONGO_DB_NAME]
     collection = db[MONGO_COLLECTION]
     print("Connection successful.")
 
-    collection.drop()
-    print(f"Dropped existing collection '{MONGO_COLLECTION}'.")
+    model_id = embedding_model_id(backend)
+    patents = mock_patents
+    if full:
+        collection.drop()
+        print(f"Dropped existing collection '{MONGO_COLLECTION}'.")
+    else:
+        ensure_publication_index(collection)
+        patents, unchanged = split_unchanged(collection, mock_patents, model_id)
+        print(f"{unchanged} mock patents unchanged, {len(patents)} to embed.")
+        if not patents:
+            print("\nMock data is already up to date.")
+            return
 
-    print("Loading local embedding model (all-MiniLM-L6-v2)...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    print(f"Loading local embedding model (all-MiniLM-L6-v2, {backend} backend)...")
+    model = load_sentence_transformer(backend)
     print("Model loaded.")
 
     documents_to_insert = []
     
     print("Generating embeddings for mock data...")
-    for patent in tqdm(mock_patents, desc="Embedding Mock Data"):
+    for patent in tqdm(patents, desc="Embedding Mock Data"):
         # The .tolist() method returns numpy floats, which can cause issues.
         raw_embedding = model.encode(patent['abstract']).tolist()
 
@@ -54,11 +67,20 @@ def ingest_mock_data():
             "abstract": patent['abstract'],
             "embedding": clean_embedding, # Use the cleaned vector
         }
-        documents_to_insert.append(patent_document)
+        documents_to_insert.append(with_fingerprint(patent_document, model_id))
 
-    collection.insert_many(documents_to_insert)
+    if full:
+        collection.insert_many(documents_to_insert)
+        ensure_publication_index(collection)
+    else:
+        upsert_documents(collection, documents_to_insert)
     print("\nMock data ingestion complete!")
     print(f"Total documents in '{MONGO_COLLECTION}': {collection.count_documents({})}")
 
 if __name__ == "__main__":
-    ingest_mock_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the mock patents into MongoDB.")
+    parser.add_argument("--full", action="store_true", help="Drop the collection first instead of upserting changes.")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="torch",
+                        help="Inference backend for the model; match the backend's EMBEDDING_BACKEND.")
+    args = parser.parse_args()
+    ingest_mock_data(full=args.full, backend=args.backend)
\ No newline at end of file
@@ -1,10 +1,19 @@
+import argparse
+import hashlib
 import os
-import sys
+import random
+import threading
+import time
+from itertools import islice
+import numpy as np
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from google.cloud import bigquery
-from google.cloud import aiplatform
-from tqdm import tqdm
+from pipeline import iter_jsonl, run_pipeline
+from incremental import (Checkpoint, ensure_publication_index, set_fields, split_unchanged, upsert_documents,
+                         with_fingerprint)
+from patent_metadata import metadata_fields
+from quantization import QUANTIZE_CHOICES, add_quantized_fields
+from build_lexical_index import OUTPUT_DIR as LEXICAL_INDEX_DIR, build_from_collection
 
 load_dotenv(dotenv_path='../.env')
 
@@ -14,10 +23,25 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 GOOGLE_CLOUD_PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
 GOOGLE_CLOUD_LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
 EMBEDDING_MODEL_NAME = "text-embedding-004" # Use the latest Google model
+EMBEDDING_DIMENSIONS = 768 # Standard for this model
 MONGO_COLLECTION = "patents"
 
-if not all([MONGO_URI, MONGO_DB_NAME, GOOGLE_CLOUD_PROJECT_ID, GOOGLE_CLOUD_LOCATION]):
-    raise ValueError("All credentials (Mongo and Google Cloud) must be set in .env file.")
+# --- Throughput ---
+# text-embedding-004 accepts up to 250 texts and 20,000 input tokens per request, and truncates
+# each text at 2,048 tokens. Requests are packed up to both limits.
+EMBED_MAX_TEXTS_PER_CALL = 250
+EMBED_MAX_TOKENS_PER_CALL = 20000
+EMBED_MAX_TOKENS_PER_TEXT = 2048
+EMBED_WORKERS = 4
+EMBED_MAX_RETRIES = 6
+BIGQUERY_PAGE_SIZE = 5000
+DEFAULT_LIMIT = 2000
+
+# Errors worth retrying with backoff: quota exhaustion and transient server-side failures.
+_RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                     "DeadlineExceeded", "Aborted"}
+# The request as a whole was rejected (usually too many tokens); halving it is the fix.
+_SPLITTABLE_ERRORS = {"InvalidArgument", "BadRequest"}
 
 def get_mongodb_collection():
     print("Connecting to MongoDB Atlas...")
@@ -25,68 +49,252 @@ def get_mongodb_collection():
     db = client[MONGO_DB_NAME]
     return db[MONGO_COLLECTION]
 
-def get_text_embedding(client, text: str) -> list[float]:
-    response = client.get_embeddings(
-        texts=[text],
-        output_dimensionality=768 # Standard for this model
-    )
-    return response.embeddings[0].values
+class VertexEmbedder:
+    """text-embedding-004 on Vertex AI; one call embeds a whole packed request."""
 
-def ingest_data():
-    collection = get_mongodb_collection()
-    collection.drop()
-    print(f"Dropped existing collection '{MONGO_COLLECTION}'.")
+    model_id = EMBEDDING_MODEL_NAME
 
-    print("Connecting to Google BigQuery...")
-    bq_client = bigquery.Client(project=GOOGLE_CLOUD_PROJECT_ID)
-    print("Initializing Google AI Platform TextEmbeddingModel...")
-    embedding_client = aiplatform.TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    def __init__(self):
+        import vertexai
+        from vertexai.language_models import TextEmbeddingModel
+        print("Initializing Vertex AI TextEmbeddingModel...")
+        vertexai.init(project=GOOGLE_CLOUD_PROJECT_ID, location=GOOGLE_CLOUD_LOCATION)
+        self.model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        response = self.model.get_embeddings(texts, output_dimensionality=EMBEDDING_DIMENSIONS)
+        return [embedding.values for embedding in response]
+
+class HashingEmbedder:
+    """
+    Offline stand-in for VertexEmbedder: a deterministic bag-of-words hashing embedding with the
+    same dimensionality. It needs no network or credentials, so the whole pipeline can be
+    exercised locally. Its vectors are not comparable with real model embeddings.
+    `latency_ms` simulates the round trip of a remote call.
+    """
+
+    model_id = "local-hashing-768"
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, latency_ms: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+
+    def _embed_one(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._embed_one(text) for text in texts]
+
+def estimate_tokens(text: str) -> int:
+    """Roughly four characters per token, capped at the model's per-text truncation length."""
+    return min(len(text) // 4 + 1, EMBED_MAX_TOKENS_PER_TEXT)
+
+def _row_fields(row) -> dict:
+    return {"publication_number": row.get('publication_number'), "title": row.get('title'),
+            "abstract": row.get('abstract'), **metadata_fields(row)}
+
+def _is_valid(row) -> bool:
+    return bool(row.get('publication_number') and row.get('title') and row.get('abstract'))
+
+def pack_requests(rows, max_texts: int = EMBED_MAX_TEXTS_PER_CALL, max_tokens: int = EMBED_MAX_TOKENS_PER_CALL):
+    """
+    Groups rows into batches that each fit in one embedding request. Every source row lands in a
+    batch (invalid ones count as zero tokens) so batch sizes add up to source row offsets.
+    """
+    batch, tokens = [], 0
+    for row in rows:
+        row_tokens = estimate_tokens(row.get('abstract')) if _is_valid(row) else 0
+        if batch and (len(batch) >= max_texts or tokens + row_tokens > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(row)
+        tokens += row_tokens
+    if batch:
+        yield batch
+
+def embed_with_retry(embedder, texts: list[str], max_retries: int = EMBED_MAX_RETRIES) -> list[list[float]]:
+    """
+    Retries quota and transient errors with exponential backoff and full jitter, so concurrent
+    workers that hit the quota together do not retry in lockstep. A request rejected as a whole
+    is split in half and each half is retried on its own.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embedder.embed(texts)
+        except Exception as e:
+            error_name = type(e).__name__
+            if error_name in _SPLITTABLE_ERRORS and len(texts) > 1:
+                middle = len(texts) // 2
+                return embed_with_retry(embedder, texts[:middle], max_retries) + \
+                    embed_with_retry(embedder, texts[middle:], max_retries)
+            if error_name not in _RETRYABLE_ERRORS or attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(60.0, 2.0 ** attempt))
+            print(f"\nEmbedding request for {len(texts)} texts failed ({error_name}); retrying in {delay:.1f}s.")
+            time.sleep(delay)
 
-    # Note: Increase LIMIT for a real dataset (e.g., 50000).
-    # Be mindful of costs, although this will be covered by free credits.
-    sql_query = """
+def bigquery_sql(limit: int) -> str:
+    # Be mindful of costs when raising the limit, although this will be covered by free credits.
+    # The tie-breaker on publication_number keeps row order stable, so a checkpointed row
+    # offset still points at the same patent when the query is re-run on resume.
+    return f"""
         SELECT
           publication_number,
+          publication_date,
+          country_code,
+          ARRAY(SELECT code FROM UNNEST(cpc)) AS cpc_codes,
           (SELECT text FROM UNNEST(title_localized) WHERE language = 'en' LIMIT 1) AS title,
           (SELECT text FROM UNNEST(abstract_localized) WHERE language = 'en' LIMIT 1) AS abstract
         FROM `patents-public-data.patents.publications`
         WHERE EXISTS(SELECT 1 FROM UNNEST(abstract_localized) WHERE language = 'en')
-        ORDER BY publication_date DESC
-        LIMIT 2000;
+          AND EXISTS(SELECT 1 FROM UNNEST(title_localized) WHERE language = 'en')
+        ORDER BY publication_date DESC, publication_number
+        {f"LIMIT {limit}" if limit else ""};
+    """
+
+def iter_bigquery_rows(sql_query: str, start: int, page_size: int = BIGQUERY_PAGE_SIZE):
+    """
+    Returns (total rows, row iterator starting at `start`). Rows are fetched one page at a time
+    as the iterator is consumed, so memory does not grow with the size of the result set.
     """
-    
+    from google.cloud import bigquery
+    print("Connecting to Google BigQuery...")
+    bq_client = bigquery.Client(project=GOOGLE_CLOUD_PROJECT_ID)
     print("Executing BigQuery query...")
-    query_job = bq_client.query(sql_query)
-    total_rows = query_job.result().total_rows
+    result = bq_client.query(sql_query).result(page_size=page_size, start_index=start)
+    return result.total_rows, iter(result)
+
+def iter_file_rows(path: str, limit: int, start: int):
+    """Same contract as iter_bigquery_rows, reading a JSONL export instead (for offline runs)."""
+    total = sum(1 for _ in islice(iter_jsonl(path), limit or None))
+    return total, islice(iter_jsonl(path), start, limit or None)
+
+def ingest_data(full=False, source="bigquery", input_path=None, embedder_name="vertex", limit=DEFAULT_LIMIT,
+                workers=EMBED_WORKERS, page_size=BIGQUERY_PAGE_SIZE, dry_run=False, stand_in_latency_ms=0.0,
+                quantize="none", keep_full=True, lexical_index=False):
+    """
+    Incremental by default: upserts by publication_number and skips patents whose content hash and
+    embedding model are unchanged. A checkpoint of rows processed lets a crashed run resume.
+
+    Rows are packed into multi-text embedding requests and `workers` requests are in flight at
+    once, so BigQuery paging, embedding and MongoDB writes all overlap.
+    With dry_run=True nothing is read from or written to MongoDB.
+    `quantize` also stores int8 or binary codes for quantized search; see quantization.py.
+    With lexical_index=True the BM25 index for hybrid retrieval is rebuilt from the collection.
+    """
+    collection = None
+    if not dry_run:
+        collection = get_mongodb_collection()
+        if full:
+            collection.drop()
+            print(f"Dropped existing collection '{MONGO_COLLECTION}'.")
+        ensure_publication_index(collection)
+
+    embedder = HashingEmbedder(latency_ms=stand_in_latency_ms) if embedder_name == "local" else VertexEmbedder()
+
+    if source == "bigquery":
+        sql_query = bigquery_sql(limit)
+        checkpoint = Checkpoint("ingest_patents", hashlib.sha256(sql_query.encode('utf-8')).hexdigest())
+    else:
+        stat = os.stat(input_path)
+        checkpoint = Checkpoint("ingest_patents_file",
+                                f"{os.path.abspath(input_path)}:{stat.st_size}:{int(stat.st_mtime)}:{limit}")
+    start = 0
+    if full or dry_run:
+        checkpoint.clear()
+    else:
+        start = checkpoint.load()
+
+    if source == "bigquery":
+        total_rows, rows = iter_bigquery_rows(sql_query, start, page_size)
+    else:
+        total_rows, rows = iter_file_rows(input_path, limit, start)
     print(f"Found {total_rows} patents to ingest.")
+    if start:
+        print(f"Resuming from checkpoint: skipping the first {start} rows.")
 
-    batch = []
-    batch_size = 100
-    
-    for row in tqdm(query_job.result(), total=total_rows, desc="Processing patents"):
-        if not row.abstract or not row.title:
-            continue
-        try:
-            embedding_vector = get_text_embedding(embedding_client, row.abstract)
-            patent_document = {
-                "publication_number": row.publication_number,
-                "title": row.title,
-                "abstract": row.abstract,
-                "embedding": embedding_vector,
-            }
-            batch.append(patent_document)
-
-            if len(batch) >= batch_size:
-                collection.insert_many(batch)
-                batch = []
-        except Exception as e:
-            print(f"\nAn error occurred for {row.publication_number}: {e}")
+    skipped = 0
+    skipped_lock = threading.Lock()
 
-    if batch:
-        collection.insert_many(batch)
-    
+    def embed_batch(batch):
+        nonlocal skipped
+        fields = [_row_fields(row) for row in batch if _is_valid(row)]
+        if collection is not None and not full:
+            changed, unchanged = split_unchanged(collection, fields, embedder.model_id)
+            with skipped_lock:
+                skipped += unchanged
+            if unchanged:
+                # Not re-embedded, but their date, country and CPC codes may be new or corrected; only
+                # patents whose stored values differ are written.
+                stale = {id(f) for f in changed}
+                set_fields(collection, [{"publication_number": f['publication_number'], **metadata_fields(f)}
+                                        for f in fields if id(f) not in stale])
+            fields = changed
+        if not fields:
+            return []
+        vectors = embed_with_retry(embedder, [f['abstract'] for f in fields])
+        return [add_quantized_fields(with_fingerprint({**f, "embedding": vector}, embedder.model_id), quantize, keep_full)
+                for f, vector in zip(fields, vectors)]
+
+    if dry_run:
+        sink = lambda documents: None
+        on_commit = None
+    else:
+        # Upserts are written per request batch, so the checkpoint only ever covers durable writes.
+        sink = lambda documents: upsert_documents(collection, documents)
+        on_commit = lambda committed: checkpoint.save(start + committed)
+    print(f"Embedding with {embedder.model_id}: up to {EMBED_MAX_TEXTS_PER_CALL} texts per request, "
+          f"{workers} requests in flight.")
+    run_pipeline(pack_requests(rows), embed_batch, sink, workers=workers, queue_size=workers * 2,
+                 desc="Processing patents", on_commit=on_commit)
+    checkpoint.clear()
+    if lexical_index and collection is not None:
+        build_from_collection(collection, LEXICAL_INDEX_DIR)
+
+    if not full and not dry_run:
+        print(f"\n{skipped} unchanged patents skipped.")
     print("\nData ingestion complete!")
 
 if __name__ == "__main__":
-    aiplatform.init(project=GOOGLE_CLOUD_PROJECT_ID, location=GOOGLE_CLOUD_LOCATION)
-    ingest_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest patents from BigQuery into MongoDB.")
+    parser.add_argument("--full", action="store_true", help="Drop the collection first instead of upserting changes.")
+    parser.add_argument("--source", choices=["bigquery", "jsonl"], default="bigquery")
+    parser.add_argument("--input", help="JSONL file with publication_number/title/abstract (and optionally "
+                                        "publication_date, country_code, cpc_codes) when --source=jsonl.")
+    parser.add_argument("--embedder", choices=["vertex", "local"], default="vertex",
+                        help="'local' is an offline hashing stand-in for testing the pipeline.")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Max patents to ingest; 0 for no limit.")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="Embedding requests in flight at once.")
+    parser.add_argument("--page-size", type=int, default=BIGQUERY_PAGE_SIZE, help="Rows per BigQuery result page.")
+    parser.add_argument("--dry-run", action="store_true", help="Embed but do not touch MongoDB.")
+    parser.add_argument("--stand-in-latency-ms", type=float, default=0.0,
+                        help="Simulated per-request latency for the local embedder.")
+    parser.add_argument("--quantize", choices=QUANTIZE_CHOICES, default="none",
+                        help="Also store int8 or binary codes for VECTOR_QUANTIZATION. Switching needs --full.")
+    parser.add_argument("--drop-full", action="store_true",
+                        help="Store only the int8 codes, not the float vectors (requires --quantize int8).")
+    parser.add_argument("--lexical-index", action="store_true",
+                        help="Rebuild the BM25 index for RETRIEVAL_MODE=hybrid once ingestion finishes.")
+    args = parser.parse_args()
+
+    required = [] if args.dry_run else [MONGO_URI, MONGO_DB_NAME]
+    if args.source == "bigquery" or args.embedder == "vertex":
+        required += [GOOGLE_CLOUD_PROJECT_ID, GOOGLE_CLOUD_LOCATION]
+    if not all(required):
+        raise ValueError("All credentials (Mongo and Google Cloud) must be set in .env file.")
+    if args.drop_full and args.quantize != "int8":
+        parser.error("--drop-full requires --quantize int8")
+    if args.source == "jsonl" and not args.input:
+        parser.error("--input is required with --source=jsonl")
+    ingest_data(full=args.full, source=args.source, input_path=args.input, embedder_name=args.embedder,
+                limit=args.limit, workers=args.workers, page_size=args.page_size, dry_run=args.dry_run,
+                stand_in_latency_ms=args.stand_in_latency_ms, quantize=args.quantize, keep_full=not args.drop_full,
+                lexical_index=args.lexical_index)
@@ -0,0 +1,134 @@
+"""
+The filterable fields stored next to each embedding (publication date, CPC codes, country), and
+the filter columns the local indexes keep for them. Must stay in step with
+backend/app/services/search_filters.py, which turns /find-similar filters into Atlas $vectorSearch
+pre-filters or local row sets.
+
+On Atlas the fields must also be declared in the vector search index, next to the vector path:
+    {"type": "filter", "path": "publication_date"},
+    {"type": "filter", "path": "country_code"},
+    {"type": "filter", "path": "cpc_prefixes"}
+"""
+import json
+import os
+import re
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+
+FILTER_FIELDS = ("publication_date", "country_code", "cpc_codes", "cpc_prefixes")
+_DATE_DIGITS = re.compile(r"\d{8}")
+
+
+def normalize_cpc(code: str) -> str:
+    """'H04L 9/32' -> 'H04L9/32'. BigQuery's CPC codes are already in this form."""
+    return re.sub(r"\s+", "", code or "").upper()
+
+
+def cpc_prefixes(codes) -> list[str]:
+    """
+    Every level a CPC code can be filtered at: class (H04), subclass (H04L), main group (H04L9)
+    and the full code (H04L9/32). Sections are left out; they would match most of the corpus.
+    """
+    prefixes = set()
+    for code in map(normalize_cpc, codes):
+        if len(code) < 3:
+            continue
+        prefixes.update((code[:3], code[:4], code.split("/")[0], code))
+    return sorted(prefixes)
+
+
+def parse_publication_date(value):
+    """A UTC datetime from BigQuery's YYYYMMDD integer, 'YYYY-MM-DD', 'YYYYMMDD' or a date; None if unknown."""
+    if value in (None, "", 0):
+        return None
+    if hasattr(value, "year"):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    digits = str(value).replace("-", "").strip()[:8]
+    if not _DATE_DIGITS.fullmatch(digits):
+        return None
+    try:
+        return datetime.strptime(digits, "%Y%m%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _cpc_codes(row) -> list[str]:
+    codes = row.get('cpc_codes') or row.get('cpc') or []
+    if isinstance(codes, str):
+        codes = re.split(r"[;,|]", codes)
+    # BigQuery's cpc column is a list of {code, inventive, first, tree} records.
+    codes = [c.get('code') if isinstance(c, dict) else c for c in codes]
+    return sorted({normalize_cpc(c) for c in codes if c and normalize_cpc(c)})
+
+
+def metadata_fields(row) -> dict:
+    """
+    The filter fields of a source row. The country falls back to the publication number's
+    prefix ('US-2020123456-A1' -> 'US'). Missing values are left out, so such a patent never
+    matches a filter on that field; update_operators removes them from a stored patent as well.
+    """
+    fields = {}
+    date = parse_publication_date(row.get('publication_date'))
+    if date is not None:
+        fields["publication_date"] = date
+    country = row.get('country_code') or (row.get('publication_number') or "").split("-")[0]
+    if re.fullmatch(r"[A-Za-z]{2}", country or ""):
+        fields["country_code"] = country.upper()
+    codes = _cpc_codes(row)
+    if codes:
+        fields["cpc_codes"] = codes
+        fields["cpc_prefixes"] = cpc_prefixes(codes)
+    return fields
+
+
+def absent_fields(document: dict) -> list[str]:
+    """The filter fields `document` lacks; a stored patent must lose them too, or stale filters keep matching."""
+    return [field for field in FILTER_FIELDS if field not in document]
+
+
+def update_operators(document: dict) -> dict:
+    """$set for `document`, plus $unset of the filter fields it lacks (MongoDB rejects an empty $unset)."""
+    absent = absent_fields(document)
+    return {"$set": document, **({"$unset": dict.fromkeys(absent, "")} if absent else {})}
+
+
+class FilterColumnsWriter:
+    """
+    Writes the filter fields of a local index's rows as columns:
+      - filter_dates.npy      int32 YYYYMMDD per row, 0 when unknown
+      - filter_countries.npy  uint16 position in filters.json's "countries" per row, 0 when unknown
+      - filter_cpc_rows.npy   int32 rows, ascending within each CPC prefix
+      - filters.json          the countries, and each CPC prefix's [start, end) in filter_cpc_rows.npy
+    Rows are added in index order.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.dates = array('i')
+        self.countries = array('H')
+        self.country_ids = {"": 0}
+        self.cpc_rows = {}
+
+    def add(self, document: dict):
+        row = len(self.dates)
+        # Works on source rows and on stored documents alike.
+        fields = metadata_fields(document)
+        date = fields.get('publication_date')
+        self.dates.append(int(date.strftime("%Y%m%d")) if date else 0)
+        self.countries.append(self.country_ids.setdefault(fields.get('country_code') or "", len(self.country_ids)))
+        for prefix in fields.get('cpc_prefixes') or []:
+            self.cpc_rows.setdefault(prefix, array('i')).append(row)
+
+    def finish(self):
+        ranges, start = {}, 0
+        for prefix in sorted(self.cpc_rows):
+            ranges[prefix] = [start, start + len(self.cpc_rows[prefix])]
+            start += len(self.cpc_rows[prefix])
+        rows = np.concatenate([np.frombuffer(self.cpc_rows[p], dtype=np.int32) for p in sorted(self.cpc_rows)]) \
+            if self.cpc_rows else np.empty(0, dtype=np.int32)
+        np.save(os.path.join(self.output_dir, "filter_dates.npy"), np.frombuffer(self.dates, dtype=np.int32))
+        np.save(os.path.join(self.output_dir, "filter_countries.npy"), np.frombuffer(self.countries, dtype=np.uint16))
+        np.save(os.path.join(self.output_dir, "filter_cpc_rows.npy"), rows)
+        with open(os.path.join(self.output_dir, "filters.json"), 'w', encoding='utf-8') as f:
+            json.dump({"countries": sorted(self.country_ids, key=self.country_ids.get), "cpc": ranges}, f)
@@ -0,0 +1,170 @@
+import json
+import queue
+import random
+import threading
+import time
+from itertools import islice
+import numpy as np
+from tqdm import tqdm
+from backend_shared import EmbeddingClient, EmbeddingServerOverloaded, load_model
+
+_DONE = object()
+
+
+def iter_jsonl(path: str):
+    """Streams a JSON Lines file one row at a time instead of reading it all into memory."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number} due to error: {e}")
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def load_sentence_transformer(backend: str = "torch", threads: int = 0):
+    """Loads all-MiniLM-L6-v2 exactly as the backend does for queries, so documents and queries match."""
+    return load_model(backend, threads)
+
+
+def make_encoder(model, batch_size: int, processes: int = 1):
+    """
+    Returns (encode, close) for a SentenceTransformer. With processes > 1 the model is replicated
+    into a multi-process pool so encoding is not limited to one interpreter.
+    """
+    if processes > 1:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * processes)
+        def encode(texts):
+            return model.encode_multi_process(texts, pool, batch_size=batch_size)
+        return encode, lambda: model.stop_multi_process_pool(pool)
+    def encode(texts):
+        return model.encode(texts, batch_size=batch_size)
+    return encode, lambda: None
+
+
+def make_remote_encoder(socket_path: str, batch_size: int, timeout: float = 300, max_retries: int = 5):
+    """
+    Returns (encode, close) that send texts to the node's embedding server
+    (backend/app/services/embedding_server.py) through the shared client instead of loading a model here.
+    Each encoder thread keeps its own connection. An overloaded server is retried up to
+    `max_retries` times with exponential backoff and full jitter.
+    """
+    client = EmbeddingClient(socket_path, timeout)
+
+    def request(texts):
+        for attempt in range(max_retries + 1):
+            try:
+                return client.encode(texts)
+            except EmbeddingServerOverloaded as e:
+                # Busy with the web workers' requests; back off rather than fail the run.
+                if attempt == max_retries:
+                    raise
+                delay = random.uniform(0, min(60.0, (e.retry_after or 1) * 2.0 ** attempt))
+                print(f"\nThe embedding server is busy; retrying {len(texts)} texts in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def encode(texts):
+        # Sent in batch_size slices so a single request never holds the server for long.
+        return np.concatenate([request(chunk) for chunk in batched(texts, batch_size)])
+    return encode, client.close
+
+
+class ChunkedInserter:
+    """Buffers documents and writes them with insert_many in fixed-size chunks."""
+
+    def __init__(self, collection, chunk_size: int):
+        self.collection = collection
+        self.chunk_size = chunk_size
+        self._buffer = []
+
+    def __call__(self, documents: list):
+        self._buffer.extend(documents)
+        while len(self._buffer) >= self.chunk_size:
+            self.collection.insert_many(self._buffer[:self.chunk_size], ordered=False)
+            del self._buffer[:self.chunk_size]
+
+    def flush(self):
+        if self._buffer:
+            self.collection.insert_many(self._buffer, ordered=False)
+            self._buffer = []
+
+
+def run_pipeline(batches, transform, sink, workers: int = 1, queue_size: int = 8, desc: str = "Ingesting",
+                 on_commit=None) -> tuple[int, float]:
+    """
+    Streams `batches` through `transform` into `sink` and returns (documents written, seconds).
+
+    Reading, transforming (on `workers` threads) and writing run concurrently, joined by queues
+    that hold at most `queue_size` batches, so memory stays flat however large the input is.
+    `transform` takes a batch and returns a list of documents; a batch that raises is skipped.
+
+    Batches can finish out of order across workers. `on_commit(n)` is called with the number of
+    input items in the longest finished prefix of batches, which is a safe point to resume from.
+    """
+    to_transform = queue.Queue(maxsize=queue_size)
+    to_write = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def produce():
+        try:
+            for sequence, batch in enumerate(batches):
+                to_transform.put((sequence, batch))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            for _ in range(workers):
+                to_transform.put(_DONE)
+
+    def work():
+        try:
+            while (item := to_transform.get()) is not _DONE:
+                sequence, batch = item
+                try:
+                    documents = transform(batch)
+                except Exception as e:
+                    print(f"\nSkipping batch of {len(batch)} due to error: {e}")
+                    documents = []
+                to_write.put((sequence, len(batch), documents))
+        finally:
+            to_write.put(_DONE)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    written = 0
+    finished_workers = 0
+    finished_batches = {}
+    next_sequence = 0
+    committed = 0
+    started = time.perf_counter()
+    with tqdm(desc=desc, unit="docs") as progress:
+        while finished_workers < workers:
+            item = to_write.get()
+            if item is _DONE:
+                finished_workers += 1
+                continue
+            sequence, batch_size, documents = item
+            if documents:
+                sink(documents)
+            written += len(documents)
+            progress.update(len(documents))
+            finished_batches[sequence] = batch_size
+            while next_sequence in finished_batches:
+                committed += finished_batches.pop(next_sequence)
+                next_sequence += 1
+            if on_commit is not None:
+                on_commit(committed)
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    print(f"Processed {written} documents in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.1f} docs/sec).")
+    return written, elapsed
@@ -0,0 +1,30 @@
+"""
+Writes the compact embedding encodings searched when VECTOR_QUANTIZATION is set in the backend.
+The encoders come from backend/app/shared.py, so they match the ones the backend quantizes queries with.
+"""
+from bson.binary import Binary, BinaryVectorDtype
+from backend_shared import binarize, quantize_int8
+
+QUANTIZE_CHOICES = ["none", "int8", "binary"]
+
+
+def add_quantized_fields(document: dict, mode: str, keep_full: bool = True) -> dict:
+    """
+    Adds embedding_int8 + embedding_scale or embedding_bits (BSON vector subtypes Atlas can index)
+    to a document that has an "embedding". Without keep_full the float vector is dropped, which
+    only int8 allows: search rescoring then uses the dequantized int8 vector instead.
+    """
+    if mode == "none":
+        return document
+    embedding = document["embedding"]
+    if mode == "int8":
+        codes, scales = quantize_int8(embedding)
+        document["embedding_int8"] = Binary.from_vector(codes[0].tolist(), BinaryVectorDtype.INT8)
+        document["embedding_scale"] = float(scales[0])
+    else:
+        document["embedding_bits"] = Binary.from_vector(binarize(embedding)[0].tolist(), BinaryVectorDtype.PACKED_BIT)
+    if not keep_full:
+        if mode != "int8":
+            raise ValueError("Binary codes are too coarse to rescore with; keep the full vectors.")
+        del document["embedding"]
+    return document